@@ -0,0 +1,32 @@
+# app/common/alias_sampler.py
+
+import random
+
+class AliasTable:
+    """
+    Walker / Vose 別名表：建表 O(n)，之後每次依權重抽樣都是 O(1)。
+    機率分布與 random.choices(items, weights=...) 相同。
+    """
+
+    def __init__(self, items, weights):
+        self.items = list(items)
+        n = len(self.items)
+        total = float(sum(weights))
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop(); l = large.pop()
+            self.prob[s] = scaled[s]; self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        # 剩下的 (含浮點誤差) 機率都是 1
+
+    def sample(self, rng=random):
+        i = int(rng.random() * len(self.items))
+        return self.items[i] if rng.random() < self.prob[i] else self.items[self.alias[i]]
+
+    def sample_many(self, k: int, rng=random):
+        return [self.sample(rng) for _ in range(k)]
@@ -3,8 +3,10 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session
-from app.db.session import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, undefer_group
+from app.db.session import get_db, get_async_db
 from app.models.user import User
 
 # 🔥 關鍵修正：這裡改成 app.common.security
@@ -12,21 +14,64 @@ from app.common.security import SECRET_KEY, ALGORITHM
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def get_username_from_token(token: str):
+    # JWT 驗證，失敗回傳 None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+# 🔥 User 的大欄位預設延遲載入 (輪詢路由只讀小的數值欄位)，
+#    路由用 current_user_with(...) 宣告需要的欄位群組，驗證時同一條 SELECT 一起載入
+USER_COLUMN_GROUPS = ("auth", "collection", "legacy")
+
+def user_load_options(groups):
+    for g in groups:
+        if g not in USER_COLUMN_GROUPS: raise ValueError(f"未知的欄位群組: {g}")
+    return [undefer_group(g) for g in groups]
+
+def get_user_from_token(token: str, db: Session, groups=()):
+    # HTTP 與 WebSocket 共用的 JWT 驗證，失敗回傳 None
+    username = get_username_from_token(token)
+    if username is None:
+        return None
+    return db.query(User).options(*user_load_options(groups)).filter(User.username == username).first()
+
+def credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+
+def current_user_with(*groups: str):
+    # 例：Depends(current_user_with("collection"))
+    user_load_options(groups)  # 群組名稱打錯時在 import 就報錯
+    def dependency(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+        user = get_user_from_token(token, db, groups)
+        if user is None:
+            raise credentials_exception()
+        return user
+    return dependency
+
+get_current_user = current_user_with()
+
+async def get_user_from_token_async(token: str, db: AsyncSession, groups=()):
+    username = get_username_from_token(token)
+    if username is None:
+        return None
+    return await db.scalar(select(User).options(*user_load_options(groups)).where(User.username == username))
+
+def current_user_with_async(*groups: str):
+    # 🔥 非同步版本：玩家資料由 AsyncSession 載入，搭配 get_async_db 使用
+    #    AsyncSession 不能延遲載入，handler 在 run_sync 以外會讀到的群組一定要宣告
+    user_load_options(groups)
+    async def dependency(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+        user = await get_user_from_token_async(token, db, groups)
+        if user is None:
+            raise credentials_exception()
+        return user
+    return dependency
+
+get_current_user_async = current_user_with_async()
\ No newline at end of file
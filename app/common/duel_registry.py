@@ -0,0 +1,69 @@
+# app/common/duel_registry.py
+
+import time
+import uuid
+
+from app.common.state_store import state_store, StateStore
+
+# 對戰結束後房間保留多久 (讓雙方還能看到結算畫面)
+DUEL_ENDED_TTL_SECONDS = 60
+# 雙方都關掉分頁、沒打完的房間閒置多久後淘汰
+DUEL_IDLE_TTL_SECONDS = 1800
+DUEL_MAX_ROOMS = 10_000
+
+class _RoomGone(Exception): pass
+
+class DuelRegistry:
+    """
+    對戰房間索引：room_id → room 與 user_id → room_id 兩張表，查詢都是 O(1)。
+    已結束的房間記在 duel_expiry，由背景排程 sweep() 清除，不再於每次輪詢時全部掃一遍。
+    """
+
+    def __init__(self, store: StateStore):
+        self.rooms = store.map("duel_rooms", ttl=DUEL_IDLE_TTL_SECONDS, max_size=DUEL_MAX_ROOMS)
+        self.by_user = store.map("duel_by_user", ttl=DUEL_IDLE_TTL_SECONDS, max_size=2 * DUEL_MAX_ROOMS)
+        self.expiry = store.map("duel_expiry")
+
+    def create(self, room: dict) -> str:
+        room_id = str(uuid.uuid4())
+        self.rooms[room_id] = room
+        self.by_user[room["p1"]] = room_id
+        self.by_user[room["p2"]] = room_id
+        return room_id
+
+    def find(self, user_id: int):
+        # 回傳 (room_id, room)，找不到時為 (None, None)
+        room_id = self.by_user.get(user_id)
+        room = self.rooms.get(room_id) if room_id else None
+        return (room_id, room) if room else (None, None)
+
+    def update(self, room_id: str, fn):
+        # 在 rooms 的鎖 / 交易內以 fn(room) 推進房間狀態，回傳新狀態；房間已不存在時回傳 None (不會寫入)
+        def apply(room):
+            if room is None: raise _RoomGone()
+            return fn(room)
+        try: room = self.rooms.update_value(room_id, apply)
+        except _RoomGone: return None
+        if room["status"] == "ENDED" and room_id not in self.expiry:
+            self.expiry[room_id] = time.time() + DUEL_ENDED_TTL_SECONDS
+        return room
+
+    def is_busy(self, user_id: int) -> bool:
+        _, room = self.find(user_id)
+        return room is not None and room["status"] != "ENDED"
+
+    def remove(self, room_id: str):
+        room = self.rooms.pop(room_id)
+        self.expiry.pop(room_id)
+        if room is None: return
+        for uid in (room["p1"], room["p2"]):
+            # 玩家可能已經開了新房間，只清掉仍指向這間的索引
+            if self.by_user.get(uid) == room_id: self.by_user.pop(uid)
+
+    def sweep(self, now: float = None) -> int:
+        now = now or time.time()
+        expired = [room_id for room_id, at in self.expiry.items() if at <= now]
+        for room_id in expired: self.remove(room_id)
+        return len(expired)
+
+duels = DuelRegistry(state_store)
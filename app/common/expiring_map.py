@@ -0,0 +1,80 @@
+# app/common/expiring_map.py
+
+import threading
+import time
+from collections import OrderedDict
+
+class ExpiringMap:
+    """
+    有存活時間 (最後一次存取起算) 與容量上限的 dict。
+    OrderedDict 依「最後存取」排序，最舊的一定在最前面，
+    所以過期與超量淘汰都只需從前端 pop，攤銷 O(1)。
+    threadpool 的 API 與背景 sweep 會同時存取，所有操作都在 _lock 內進行。
+    """
+
+    def __init__(self, ttl: float, max_size: int = None, refresh_on_read: bool = True, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.refresh_on_read = refresh_on_read
+        self.clock = clock
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.expired = 0   # 因逾時被淘汰的筆數
+        self.evicted = 0   # 因超過容量被淘汰的筆數
+        self._lock = threading.RLock()
+
+    def _purge(self, now):
+        data = self._data
+        while data:
+            key, (expires_at, _) = next(iter(data.items()))
+            if expires_at > now: break
+            data.pop(key, None); self.expired += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            now = self.clock()
+            self._purge(now)
+            entry = self._data.get(key)
+            if entry is None: return default
+            if self.refresh_on_read:
+                self._data[key] = (now + self.ttl, entry[1])
+                self._data.move_to_end(key)
+            return entry[1]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            now = self.clock()
+            self._purge(now)
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            if self.max_size is not None:
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False); self.evicted += 1
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._purge(self.clock())
+            del self._data[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            self._purge(self.clock())
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            self._purge(self.clock())
+            return len(self._data)
+
+    def items(self):
+        with self._lock:
+            self._purge(self.clock())
+            return [(k, v) for k, (_, v) in self._data.items()]
+
+    def clear(self):
+        with self._lock: self._data.clear()
+
+    def sweep(self):
+        with self._lock: self._purge(self.clock())
+
+    def stats(self) -> dict:
+        return {"size": len(self), "max_size": self.max_size, "ttl": self.ttl, "expired": self.expired, "evicted": self.evicted}
@@ -0,0 +1,37 @@
+# app/common/leveling.py
+
+from bisect import bisect_right
+
+from app.common.game_data import get_req_xp
+
+class LevelCurve:
+    """
+    累積經驗值表：cum[L] = 從 Lv.1 升到 Lv.L 需要的總經驗。
+    「Lv.L 帶著 E 經驗再加 X，最高到 C 級」一次二分搜尋就能算出結果，
+    不必逐級 while 迴圈 (結果與逐級扣除完全相同)。
+    """
+
+    def __init__(self, req_xp, max_level: int):
+        self.max_level = max_level
+        self.cum = [0, 0]
+        for lv in range(1, max_level):
+            self.cum.append(self.cum[-1] + req_xp(lv))
+
+    def add_exp(self, level: int, exp: int, gain: int, cap: int = None):
+        # 回傳 (新等級, 剩餘經驗)；到達上限後多的經驗保留在 exp 裡
+        cap = self.max_level if cap is None else min(cap, self.max_level)
+        if level >= cap or level < 1: return level, exp + gain
+        total = self.cum[level] + exp + gain
+        new_level = max(level, bisect_right(self.cum, total, level, cap + 1) - 1)
+        return new_level, total - self.cum[new_level]
+
+    def units_to_cap(self, level: int, exp: int, per_unit: int, count: int, cap: int) -> int:
+        # 每次加 per_unit 經驗、最多 count 次，到達 cap 就停：回傳實際用掉的次數
+        cap = min(cap, self.max_level)
+        if level >= cap: return 0
+        missing = self.cum[cap] - self.cum[level] - exp
+        needed = max(1, -(-missing // per_unit))
+        return min(count, needed)
+
+# 玩家 / 寶可夢共用的經驗曲線 (LEVEL_XP_MAP，上限 Lv.120)
+PLAYER_CURVE = LevelCurve(get_req_xp, 120)
@@ -0,0 +1,12 @@
+# app/common/responses.py
+
+import orjson
+from fastapi.responses import JSONResponse
+
+class ORJSONResponse(JSONResponse):
+    """
+    以 orjson 編碼的 JSONResponse (fastapi.responses.ORJSONResponse 已標示棄用，行為相同)。
+    datetime / numpy 數值可直接輸出，比標準 json 快。
+    """
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
@@ -0,0 +1,46 @@
+# app/common/retry.py
+
+import asyncio
+from functools import wraps
+from fastapi import HTTPException
+from sqlalchemy.orm.exc import StaleDataError
+
+STALE_RETRY_ATTEMPTS = 3
+
+def stale_conflict():
+    return HTTPException(status_code=409, detail="資料已被其他操作更新，請再試一次")
+
+def retry_on_stale(attempts: int = STALE_RETRY_ATTEMPTS):
+    """
+    樂觀鎖重試：User.version 不符時 commit 會丟 StaleDataError，
+    這裡 rollback、重新載入 current_user 後把整個 handler 再跑一次 (重新檢查餘額)。
+    handler 必須以 db / current_user 參數取得 session 與玩家，
+    且 commit 前不能有無法重做的副作用 (推播、共享狀態寫入請放在 commit 之後)。
+    """
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                db, user = kwargs["db"], kwargs.get("current_user")
+                for _ in range(attempts):
+                    try:
+                        return await fn(*args, **kwargs)
+                    except StaleDataError:
+                        # AsyncSession 不能延遲載入，rollback 後要明確 refresh
+                        await db.rollback()
+                        if user is not None: await db.refresh(user)
+                raise stale_conflict()
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            db = kwargs["db"]
+            for _ in range(attempts):
+                try:
+                    return fn(*args, **kwargs)
+                except StaleDataError:
+                    # rollback 會讓 session 內物件過期，下次存取自動重新 SELECT
+                    db.rollback()
+            raise stale_conflict()
+        return wrapper
+    return decorator
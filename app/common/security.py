@@ -1,9 +1,14 @@
 # app/common/security.py
 
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
+from fastapi import HTTPException
 from jose import jwt
 from passlib.context import CryptContext
+from app.core.config import settings
 
 # 設定
 SECRET_KEY = "CHANGE_THIS_TO_A_SUPER_SECRET_KEY"
@@ -18,6 +23,42 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# =================================================================
+# 🔥 bcrypt 改在獨立的 process pool 執行，不佔用事件迴圈與 threadpool
+#    pool 大小與排隊上限在 Settings (PASSWORD_HASH_WORKERS / PASSWORD_HASH_QUEUE)，排隊超過上限直接回 503 讓前端稍後重試
+# =================================================================
+class PasswordHasher:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._pool = None
+
+    def start(self):
+        # 啟動時先把 worker 全部開好，避免之後在有多條執行緒時才 fork
+        if self._pool: return
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        for f in [self._pool.submit(os.getpid) for _ in range(self.workers)]: f.result()
+
+    def shutdown(self):
+        if self._pool: self._pool.shutdown(wait=False, cancel_futures=True); self._pool = None
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(status_code=503, detail="伺服器忙碌中，請稍後再試", headers={"Retry-After": "1"})
+        self.start()
+        self.pending += 1
+        try: return await asyncio.wrap_future(self._pool.submit(fn, *args))
+        finally: self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
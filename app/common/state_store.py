@@ -0,0 +1,311 @@
+# app/common/state_store.py
+
+import os
+import asyncio
+import json
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.common.expiring_map import ExpiringMap
+
+# =================================================================
+# 🔥 共享狀態儲存 (StateStore)
+# 線上玩家、邀請、對戰房間、道館戰鬥、團體戰狀態都透過這裡存取，
+# 換成跨程序的實作後就能用 uvicorn --workers N 跑滿所有 CPU。
+#
+# 注意：取出的值一律視為副本，修改後要寫回 (store[key] = value)，
+#       需要「讀取-修改-寫回」的地方請用 update_value 保證原子性。
+#       map(name, ttl=..., max_size=...) 可讓閒置過久或超量的項目自動淘汰，
+#       避免玩家關掉分頁後留下的狀態讓記憶體無限成長。
+# =================================================================
+
+class StateMap:
+    """單一命名空間的 key/value 介面 (與 dict 用法相近)。"""
+
+    def get(self, key, default=None): raise NotImplementedError
+    def __setitem__(self, key, value): raise NotImplementedError
+    def __delitem__(self, key): raise NotImplementedError
+    def __contains__(self, key): raise NotImplementedError
+    def __len__(self): raise NotImplementedError
+    def items(self): raise NotImplementedError
+    def clear(self): raise NotImplementedError
+
+    def update_value(self, key, fn, default=None):
+        """原子地以 fn(舊值) 取代舊值，回傳新值。"""
+        raise NotImplementedError
+
+    def sweep(self): pass
+    def stats(self) -> dict: return {"size": len(self)}
+
+    def __getitem__(self, key):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing: raise KeyError(key)
+        return value
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        try: del self[key]
+        except KeyError: pass
+        return value
+
+    def keys(self): return [k for k, _ in self.items()]
+    def values(self): return [v for _, v in self.items()]
+
+class StateStore:
+    # True 代表資料放在程序外，推播需要經由 publish 轉送給其他 worker
+    shared = False
+
+    def map(self, name: str, ttl: float = None, max_size: int = None, refresh_on_read: bool = True) -> StateMap:
+        raise NotImplementedError
+
+    def maps(self) -> dict: raise NotImplementedError
+
+    def sweep(self):
+        # 由背景排程定期呼叫，清掉過期 / 超量的項目
+        for m in self.maps().values(): m.sweep()
+
+    def stats(self) -> dict:
+        return {name: m.stats() for name, m in self.maps().items()}
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        """只讓一個 worker 執行排程 (例如團體戰)，單程序實作永遠回傳 True。"""
+        return True
+
+    def publish(self, message): raise NotImplementedError
+    def poll(self, last_id: int): raise NotImplementedError
+
+    def publish_many(self, messages):
+        for message in messages: self.publish(message)
+
+    async def run(self, fn, *args):
+        """在事件迴圈裡存取共享狀態用：會阻塞的實作 (SQLite) 改丟到 threadpool 執行。"""
+        return fn(*args)
+
+# -----------------------------------------------------------------
+# 1. 單程序實作 (預設)：就是一般的 dict
+# -----------------------------------------------------------------
+_MISSING = object()
+
+def _copy(value):
+    # 與 SQLite 實作同樣以 pickle 複製 (小 dict 比 copy.deepcopy 快 3~6 倍)
+    return pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+class MemoryStateMap(StateMap):
+    def __init__(self, ttl: float = None, max_size: int = None, refresh_on_read: bool = True):
+        self._data = ExpiringMap(ttl, max_size, refresh_on_read) if ttl is not None else {}
+        self._lock = threading.Lock()
+
+    # 同步 API 跑在 threadpool，所有操作都要拿 _lock (不只 update_value)
+    # 🔥 與 SQLite 實作一致，進出都是副本：handler 在 commit 前改動取出的值不會影響共享狀態
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+        return default if value is _MISSING else _copy(value)
+    def __setitem__(self, key, value):
+        value = _copy(value)
+        with self._lock: self._data[key] = value
+    def __delitem__(self, key):
+        with self._lock: del self._data[key]
+    def __contains__(self, key):
+        with self._lock: return key in self._data
+    def __len__(self):
+        with self._lock: return len(self._data)
+    def items(self):
+        with self._lock: items = list(self._data.items())
+        return _copy(items)
+    def clear(self):
+        with self._lock: self._data.clear()
+
+    def update_value(self, key, fn, default=None):
+        with self._lock:
+            value = fn(_copy(self._data.get(key, default)))
+            self._data[key] = _copy(value)
+            return value
+
+    def sweep(self):
+        if isinstance(self._data, ExpiringMap):
+            with self._lock: self._data.sweep()
+
+    def stats(self) -> dict:
+        with self._lock:
+            if isinstance(self._data, ExpiringMap): return self._data.stats()
+            return {"size": len(self._data)}
+
+class MemoryStateStore(StateStore):
+    def __init__(self):
+        self._maps = {}
+
+    def map(self, name: str, ttl: float = None, max_size: int = None, refresh_on_read: bool = True) -> StateMap:
+        if name not in self._maps: self._maps[name] = MemoryStateMap(ttl, max_size, refresh_on_read)
+        return self._maps[name]
+
+    def maps(self) -> dict: return self._maps
+
+# -----------------------------------------------------------------
+# 2. 跨程序實作：本機 SQLite (WAL)，不需要額外的外部服務
+# -----------------------------------------------------------------
+class SQLiteStateMap(StateMap):
+    # expires_at 為 NULL 代表不會過期；有 ttl 時以 time.time() 計算 (跨程序共用時鐘)
+    LIVE = "ns = ? AND (expires_at IS NULL OR expires_at > ?)"
+
+    def __init__(self, store, name, ttl=None, max_size=None, refresh_on_read=True):
+        self._store = store
+        self._name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.refresh_on_read = refresh_on_read
+        self.expired = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _k(key): return json.dumps(key)
+
+    def _expires(self, now): return now + self.ttl if self.ttl is not None else None
+
+    def get(self, key, default=None):
+        now = time.time()
+        row = self._store.conn().execute(f"SELECT value, expires_at FROM state_kv WHERE {self.LIVE} AND key = ?", (self._name, now, self._k(key))).fetchone()
+        if not row: return default
+        # 剩餘時間不到一半才延長，避免每次讀取都要寫入
+        if self.ttl is not None and self.refresh_on_read and row[1] - now < self.ttl / 2:
+            self._store.conn().execute("UPDATE state_kv SET expires_at = ? WHERE ns = ? AND key = ?", (self._expires(now), self._name, self._k(key)))
+        return pickle.loads(row[0])
+
+    def __setitem__(self, key, value):
+        self._store.conn().execute(
+            "INSERT INTO state_kv (ns, key, value, expires_at) VALUES (?, ?, ?, ?) ON CONFLICT (ns, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (self._name, self._k(key), pickle.dumps(value), self._expires(time.time()))
+        )
+
+    def __delitem__(self, key):
+        cur = self._store.conn().execute(f"DELETE FROM state_kv WHERE {self.LIVE} AND key = ?", (self._name, time.time(), self._k(key)))
+        if cur.rowcount == 0: raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._store.conn().execute(f"SELECT 1 FROM state_kv WHERE {self.LIVE} AND key = ?", (self._name, time.time(), self._k(key))).fetchone() is not None
+
+    def __len__(self):
+        return self._store.conn().execute(f"SELECT COUNT(*) FROM state_kv WHERE {self.LIVE}", (self._name, time.time())).fetchone()[0]
+
+    def items(self):
+        rows = self._store.conn().execute(f"SELECT key, value FROM state_kv WHERE {self.LIVE}", (self._name, time.time())).fetchall()
+        return [(json.loads(k), pickle.loads(v)) for k, v in rows]
+
+    def clear(self):
+        self._store.conn().execute("DELETE FROM state_kv WHERE ns = ?", (self._name,))
+
+    def update_value(self, key, fn, default=None):
+        conn = self._store.conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            value = fn(self.get(key, default))
+            self[key] = value
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def sweep(self):
+        conn = self._store.conn()
+        if self.ttl is not None:
+            self.expired += conn.execute("DELETE FROM state_kv WHERE ns = ? AND expires_at <= ?", (self._name, time.time())).rowcount
+        if self.max_size is not None:
+            # 超過容量時淘汰最久沒被存取的 (expires_at 最小)
+            over = len(self) - self.max_size
+            if over > 0:
+                self.evicted += conn.execute(
+                    "DELETE FROM state_kv WHERE rowid IN (SELECT rowid FROM state_kv WHERE ns = ? ORDER BY expires_at LIMIT ?)", (self._name, over)
+                ).rowcount
+
+    def stats(self) -> dict:
+        return {"size": len(self), "max_size": self.max_size, "ttl": self.ttl, "expired": self.expired, "evicted": self.evicted}
+
+class SQLiteStateStore(StateStore):
+    shared = True
+    EVENT_RETENTION_SECONDS = 60
+
+    def __init__(self, path: str):
+        self.path = path
+        self.owner = str(uuid.uuid4())
+        self._local = threading.local()
+        self._maps = {}
+        conn = self.conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS state_kv (ns TEXT NOT NULL, key TEXT NOT NULL, value BLOB, expires_at REAL, PRIMARY KEY (ns, key))")
+        if "expires_at" not in {r[1] for r in conn.execute("PRAGMA table_info(state_kv)")}:
+            conn.execute("ALTER TABLE state_kv ADD COLUMN expires_at REAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS state_lease (name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS state_events (id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL, payload BLOB)")
+
+    def conn(self):
+        # sqlite3 連線不能跨執行緒共用，每個執行緒各開一條 (autocommit)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def map(self, name: str, ttl: float = None, max_size: int = None, refresh_on_read: bool = True) -> StateMap:
+        if name not in self._maps: self._maps[name] = SQLiteStateMap(self, name, ttl, max_size, refresh_on_read)
+        return self._maps[name]
+
+    def maps(self) -> dict: return self._maps
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        conn = self.conn(); now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT owner, expires_at FROM state_lease WHERE name = ?", (name,)).fetchone()
+            ok = row is None or row[0] == self.owner or row[1] < now
+            if ok:
+                conn.execute(
+                    "INSERT INTO state_lease (name, owner, expires_at) VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                    (name, self.owner, now + ttl)
+                )
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        return ok
+
+    def publish(self, message):
+        self.publish_many([message])
+
+    def publish_many(self, messages):
+        # 一次交易寫入整批事件 (relay 會把本程序累積的推播一起送出)
+        conn = self.conn(); now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO state_events (created, payload) VALUES (?, ?)", [(now, pickle.dumps(m)) for m in messages])
+            conn.execute("DELETE FROM state_events WHERE created < ?", (now - self.EVENT_RETENTION_SECONDS,))
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def run(self, fn, *args):
+        # sqlite3 呼叫最多會等 timeout=5 秒，不能在事件迴圈上執行
+        return await asyncio.to_thread(fn, *args)
+
+    def poll(self, last_id: int):
+        # last_id < 0 代表剛啟動：從最新一筆之後開始接收
+        conn = self.conn()
+        if last_id < 0:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM state_events").fetchone()[0], []
+        rows = conn.execute("SELECT id, payload FROM state_events WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+        if not rows: return last_id, []
+        return rows[-1][0], [pickle.loads(p) for _, p in rows]
+
+def create_state_store() -> StateStore:
+    backend = os.getenv("STATE_BACKEND", "memory")
+    if backend == "sqlite":
+        return SQLiteStateStore(os.getenv("STATE_SQLITE_PATH", "./game_state.db"))
+    return MemoryStateStore()
+
+state_store = create_state_store()
@@ -0,0 +1,53 @@
+# app/common/static_payloads.py
+
+import gzip
+import hashlib
+import json
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.common import game_data
+from app.common.game_data import SKILL_DB, HELD_ITEMS, POKEDEX_DATA, OBTAINABLE_MONS
+
+# =================================================================
+# 🔥 靜態遊戲資料：啟動時就序列化 (含 gzip)，只在部署之間才會改變
+#    ETag 由 game_data.py 內容計算，瀏覽器帶 If-None-Match 時直接回 304
+# =================================================================
+CACHE_CONTROL = "public, max-age=600"
+
+with open(game_data.__file__, "rb") as f:
+    GAME_DATA_HASH = hashlib.sha256(f.read()).hexdigest()[:32]
+
+def encode_json(content) -> bytes:
+    # 與 JSONResponse 相同的編碼方式
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+class StaticPayload:
+    def __init__(self, name: str, content):
+        self.body = encode_json(content)
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+        # 不同編碼是不同的表示法，強 ETag 必須分開
+        self.etag = f'"{GAME_DATA_HASH}-{name}"'
+        self.gzip_etag = f'"{GAME_DATA_HASH}-{name}-gz"'
+
+    def response(self, request: Request) -> Response:
+        headers = {"Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+        etag = self.gzip_etag if use_gzip else self.etag
+        headers["ETag"] = etag
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = {t.strip() for t in if_none_match.split(",")}
+            if "*" in tags or self.etag in tags or self.gzip_etag in tags:
+                return Response(status_code=304, headers=headers)
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+            return Response(content=self.gzip_body, media_type="application/json", headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+def build_pokedex_all():
+    return [{ "name": name, "img": data["img"], "hp": data["hp"], "atk": data["atk"], "is_obtainable": name in OBTAINABLE_MONS } for name, data in POKEDEX_DATA.items()]
+
+SKILLS_PAYLOAD = StaticPayload("skills", SKILL_DB)
+ITEMS_PAYLOAD = StaticPayload("items", HELD_ITEMS)
+POKEDEX_PAYLOAD = StaticPayload("pokedex", build_pokedex_all())
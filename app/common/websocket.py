@@ -1,40 +1,128 @@
 # app/common/websocket.py
 
-from typing import List, Dict
+import asyncio
+import json
+from collections import deque
+from typing import List, Dict, Set, Iterable, Optional
 from fastapi import WebSocket
+from app.common.state_store import state_store
 
 class ConnectionManager:
+    OUTBOX_MAX = 10_000
+
     def __init__(self):
-        # 存放活躍的連線: key=user_id, value=WebSocket
-        self.active_connections: Dict[int, WebSocket] = {}
+        # 存放活躍的連線: key=user_id, value=該玩家所有分頁的 WebSocket
+        self.active_connections: Dict[int, Set[WebSocket]] = {}
+        # 事件迴圈 (讓同步的 API 也能推播)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # 多 worker 模式：待寫入共享儲存的推播，由 relay 在 threadpool 批次送出 (deque 的 append/popleft 是執行緒安全的)
+        self._outbox = deque(maxlen=self.OUTBOX_MAX)
+        self._wake: Optional[asyncio.Event] = None
 
     async def connect(self, user_id: int, websocket: WebSocket):
         # 接受連線
         # 注意：accept() 通常在 endpoint 裡面做，這裡主要是記錄
-        self.active_connections[user_id] = websocket
+        self.loop = asyncio.get_running_loop()
+        self.active_connections.setdefault(user_id, set()).add(websocket)
+
+    def disconnect(self, user_id: int, websocket: Optional[WebSocket] = None):
+        sockets = self.active_connections.get(user_id)
+        if sockets is None: return
+        if websocket is None: sockets.clear()
+        else: sockets.discard(websocket)
+        if not sockets: del self.active_connections[user_id]
 
-    def disconnect(self, user_id: int):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+    def is_online(self, user_id: int) -> bool:
+        return user_id in self.active_connections
 
     def get_online_ids(self) -> List[int]:
         return list(self.active_connections.keys())
 
     async def send_personal_message(self, message: str, user_id: int):
-        if user_id in self.active_connections:
+        for ws in list(self.active_connections.get(user_id, ())):
             try:
-                await self.active_connections[user_id].send_text(message)
+                await ws.send_text(message)
             except:
-                self.disconnect(user_id)
+                self.disconnect(user_id, ws)
 
     async def broadcast(self, message: str):
-        # 對所有連線廣播
-        # 為了避免迭代時字典大小改變報錯，先複製一份 keys
-        for user_id in list(self.active_connections.keys()):
+        # 對所有連線廣播 (多 worker 時也會送到其他程序的連線)
+        self.send(None, message)
+
+    async def _deliver(self, user_ids: Optional[List[int]], message: str):
+        # 只送給「本程序」的連線；為了避免迭代時字典大小改變報錯，先複製一份 keys
+        if user_ids is None: user_ids = list(self.active_connections.keys())
+        for user_id in user_ids:
+            await self.send_personal_message(message, user_id)
+
+    # -----------------------------------------------------------------
+    # 🔥 結構化事件推播 (取代前端輪詢)
+    # 可以在同步或非同步的 API 中直接呼叫，不需 await
+    # -----------------------------------------------------------------
+    def push(self, user_id: int, event: str, data: dict):
+        self.send([user_id], self._encode(event, data))
+
+    def push_many(self, user_ids: Iterable[int], event: str, data: dict):
+        self.send(list(user_ids), self._encode(event, data))
+
+    def push_all(self, event: str, data: dict):
+        self.send(None, self._encode(event, data))
+
+    def send(self, user_ids: Optional[List[int]], message: str):
+        # user_ids=None 代表廣播
+        if state_store.shared:
+            # 玩家可能連在別的 worker 上，交給 relay 轉送；這裡只排進佇列，不在事件迴圈上寫 SQLite
+            self._outbox.append((user_ids, message)); self._notify(); return
+        if user_ids is not None: user_ids = [uid for uid in user_ids if uid in self.active_connections]
+        if not self.active_connections or user_ids == []: return
+        self._schedule(self._deliver(user_ids, message))
+
+    async def relay(self, interval: float = 0.1):
+        # 🔥 多 worker 模式：送出本程序的推播，並持續把共享儲存裡的事件轉送給本程序的連線
+        self.loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        last_id = -1
+        while True:
+            self._wake.clear()
             try:
-                ws = self.active_connections[user_id]
-                await ws.send_text(message)
-            except:
-                self.disconnect(user_id)
+                batch = [self._outbox.popleft() for _ in range(len(self._outbox))]
+                if batch: await asyncio.to_thread(state_store.publish_many, batch)
+                last_id, messages = await asyncio.to_thread(state_store.poll, last_id)
+                for user_ids, message in messages:
+                    await self._deliver(user_ids, message)
+            except Exception as e:
+                print(f"❌ 推播轉送錯誤: {e}")
+            if self._outbox: continue
+            try: await asyncio.wait_for(self._wake.wait(), interval)
+            except asyncio.TimeoutError: pass
+
+    def _notify(self):
+        # 有新推播時叫醒 relay，不必等到下一次輪詢
+        wake, loop = self._wake, self.loop
+        if wake is None or loop is None or loop.is_closed(): return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop: wake.set()
+        else: loop.call_soon_threadsafe(wake.set)
+
+    @staticmethod
+    def _encode(event: str, data: dict) -> str:
+        return json.dumps({"event": event, "data": data}, default=str)
+
+    def _schedule(self, coro):
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            coro.close(); return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            loop.create_task(coro)
+        else:
+            # 從 threadpool (同步 API) 丟回事件迴圈執行
+            asyncio.run_coroutine_threadsafe(coro, loop)
 
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
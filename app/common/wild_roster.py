@@ -0,0 +1,40 @@
+# app/common/wild_roster.py
+
+from bisect import bisect_right
+
+from app.common.game_data import POKEDEX_DATA, WILD_UNLOCK_LEVELS
+from app.common.stat_engine import stats_for, MAX_LEVEL
+from app.common.static_payloads import encode_json
+
+# =================================================================
+# 🔥 野怪名單快取：同一個等級的名單永遠相同，啟動時把 Lv.1 ~ 120 全部算好
+# =================================================================
+DEFAULT_WILD = ("小拉達",)
+
+# 排序後的解鎖等級，與「到該等級為止」已解鎖的累積名單
+UNLOCK_LEVELS = sorted(WILD_UNLOCK_LEVELS)
+CUMULATIVE_WILD = []
+for _lv in UNLOCK_LEVELS:
+    CUMULATIVE_WILD.append((CUMULATIVE_WILD[-1] if CUMULATIVE_WILD else ()) + tuple(WILD_UNLOCK_LEVELS[_lv]))
+
+def unlocked_wild_mons(level: int):
+    # 二分搜尋最後一個 <= level 的解鎖等級
+    i = bisect_right(UNLOCK_LEVELS, level)
+    return CUMULATIVE_WILD[i - 1] if i else DEFAULT_WILD
+
+def build_wild_roster(level: int):
+    names = [name for name in unlocked_wild_mons(level) if name in POKEDEX_DATA]
+    hp_list, atk_list = stats_for(names, [50] * len(names), [level] * len(names), is_player=False)
+    roster = []
+    for name, hp, atk in zip(names, hp_list.tolist(), atk_list.tolist()):
+        base = POKEDEX_DATA[name]
+        skills = base.get("skills", ["撞擊", "撞擊", "撞擊"])
+        roster.append({ "name": name, "raw_name": name, "is_powerful": False, "level": level, "hp": hp, "max_hp": hp, "attack": atk, "image_url": base["img"], "skills": skills })
+    return roster
+
+# level -> 已編碼好的 JSON bytes
+WILD_ROSTER_BYTES = {lv: encode_json(build_wild_roster(lv)) for lv in range(1, MAX_LEVEL + 1)}
+
+def wild_roster_bytes(level: int) -> bytes:
+    cached = WILD_ROSTER_BYTES.get(level)
+    return cached if cached is not None else encode_json(build_wild_roster(level))
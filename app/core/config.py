@@ -3,7 +3,22 @@
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
-    DATABASE_URL: str
+    # Zeabur 會自動注入 DATABASE_URL 環境變數，本機預設用 SQLite
+    DATABASE_URL: str = "sqlite:///./sql_app.db"
+
+    # 🔥 連線池設定 (SQLite 的非同步引擎固定只用一條連線)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30        # 等待可用連線的秒數
+    DB_POOL_RECYCLE: int = 1800      # 連線使用超過 30 分鐘就重建，避免被資料庫或代理端斷線
+    DB_POOL_PRE_PING: bool = True    # 取出連線前先 ping，壞掉的連線自動換新
+
+    # SQLite：鎖住時最多等待的毫秒數
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+
+    # 🔥 bcrypt 的 process pool 大小，與排隊中雜湊工作的上限 (超過回 503)
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE: int = 256
     
     # 你未來可以從 .env 增加更多設定
     # SECRET_KEY: str
@@ -0,0 +1,114 @@
+# app/db/schema.py
+
+import hashlib
+import sqlite3
+from contextlib import contextmanager
+from sqlalchemy import Column, String, Table, inspect, literal, select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable
+from app.db.base_class import Base
+from app.db.seed import GYM_SEEDS, seed_gyms
+from app.services.box_service import migrate_legacy_boxes
+from app.services.inventory_service import migrate_legacy_inventory
+from app.services.collection_service import migrate_collection_counts
+from app.services.quest_service import migrate_legacy_quests
+
+# 🔥 只有資料搬移 (不改表格、不改種子) 時手動 +1；表格與種子的變動會自動反映在指紋上
+SCHEMA_VERSION = 1
+
+# 多個 worker 同時啟動時，用資料庫層級的鎖讓搬移只跑一次
+MIGRATION_LOCK_KEY = 0x504B4D4E        # PostgreSQL advisory lock 的 key
+MIGRATION_LOCK_TIMEOUT_SECONDS = 600   # SQLite 等待其他 worker 搬移完成的上限
+
+schema_meta = Table(
+    "schema_meta", Base.metadata,
+    Column("key", String(50), primary_key=True),
+    Column("value", String(100), nullable=False),
+)
+
+def add_missing_columns(engine):
+    # create_all 只會建立新表格，不會替舊表格補欄位，這裡補上新版新增的欄位與索引
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables: continue
+            existing_cols = {c["name"] for c in inspector.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing_cols: continue
+                col_type = col.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}"
+                if col.default is not None and col.default.is_scalar:
+                    ddl += " DEFAULT " + str(literal(col.default.arg, col.type).compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+                conn.execute(text(ddl))
+                print(f"✅ 已新增欄位 {table.name}.{col.name}")
+            # 新增欄位上的索引也要補建
+            existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes: continue
+                index.create(conn)
+                print(f"✅ 已新增索引 {index.name}")
+
+def schema_version(dialect):
+    # 版本 = 手動版號 + 所有表格 DDL 與種子資料的指紋
+    h = hashlib.sha256(repr(GYM_SEEDS).encode())
+    for table in Base.metadata.sorted_tables:
+        h.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            h.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    return f"{SCHEMA_VERSION}:{h.hexdigest()[:16]}"
+
+def applied_version(engine):
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(schema_meta.c.value).where(schema_meta.c.key == "schema")).scalar()
+    except (OperationalError, ProgrammingError):
+        return None  # 第一次部署，還沒有 schema_meta
+
+@contextmanager
+def migration_lock(engine):
+    # 搬移期間持有的鎖：PostgreSQL 用 advisory lock；SQLite 沒有，改在旁邊的鎖檔開 EXCLUSIVE 交易 (不影響主資料庫連線)
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            try: yield
+            finally: conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    elif engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+        lock = sqlite3.connect(engine.url.database + ".migrate-lock", timeout=MIGRATION_LOCK_TIMEOUT_SECONDS, isolation_level=None)
+        try:
+            lock.execute("BEGIN EXCLUSIVE")
+            yield
+        finally:
+            lock.close()
+    else:
+        yield
+
+def prepare_database(engine, force: bool = False):
+    """
+    每次部署跑一次的建表 / 補欄位 / 種子 / 舊資料搬移。
+    版本與資料庫記錄相同時只花一次 SELECT，重啟不再有 DDL。
+    多個 worker 同時啟動時只有拿到鎖的會搬移，其他的等它做完後重新確認版本即略過。
+    """
+    version = schema_version(engine.dialect)
+    if not force and applied_version(engine) == version: return False
+    with migration_lock(engine):
+        if not force and applied_version(engine) == version: return False
+        Base.metadata.create_all(bind=engine)
+        add_missing_columns(engine)
+        with Session(engine) as db:
+            seed_gyms(db)
+            migrate_legacy_boxes(db)
+            migrate_legacy_inventory(db)
+            migrate_collection_counts(db)
+            migrate_legacy_quests(db)
+        with engine.begin() as conn:
+            conn.execute(schema_meta.delete().where(schema_meta.c.key == "schema"))
+            conn.execute(schema_meta.insert().values(key="schema", value=version))
+    print(f"✅ 資料庫已更新至版本 {version}")
+    return True
+
+if __name__ == "__main__":
+    # 部署指令：python -m app.db.schema
+    from app.db.session import engine
+    prepare_database(engine, force=True)
@@ -0,0 +1,30 @@
+# app/db/seed.py
+
+from sqlalchemy.orm import Session
+from app.models.user import Gym
+
+# 道館定義 (id 固定)，佔領狀態 (leader_*、occupied_at ...) 不屬於種子資料
+GYM_SEEDS = [
+    {"id": 1, "name": "第一道館", "buff_desc": "防守方 HP/ATK +10%", "income_rate": 10},
+    {"id": 2, "name": "第二道館", "buff_desc": "防守方 HP/ATK +10%", "income_rate": 15},
+    {"id": 3, "name": "第三道館", "buff_desc": "防守方 HP/ATK +10%", "income_rate": 15},
+    {"id": 4, "name": "第四道館", "buff_desc": "防守方 HP/ATK +10%", "income_rate": 20},
+    {"id": 5, "name": "限制道館 A", "buff_desc": "⚠️ 限制 Lv.50 以下 | 收益 +25%", "income_rate": 25},
+    {"id": 6, "name": "限制道館 B", "buff_desc": "⚠️ 限制 Lv.50 以下 | 收益 +25%", "income_rate": 25},
+]
+
+def seed_gyms(db: Session):
+    # 🔥 只新增缺少的道館、更新定義有變的欄位，不再 DROP TABLE (保留佔領狀態)
+    existing = {g.id: g for g in db.query(Gym).filter(Gym.id.in_([s["id"] for s in GYM_SEEDS]))}
+    changed = 0
+    for seed in GYM_SEEDS:
+        gym = existing.get(seed["id"])
+        if gym is None:
+            db.add(Gym(**seed)); changed += 1; continue
+        diff = {k: v for k, v in seed.items() if getattr(gym, k) != v}
+        for k, v in diff.items(): setattr(gym, k, v)
+        if diff: changed += 1
+    if changed:
+        db.commit()
+        print(f"✅ 已同步 {changed} 座道館定義")
+    return changed
@@ -1,21 +1,75 @@
 # app/db/session.py
-import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 
-# Zeabur 會自動注入 DATABASE_URL 環境變數
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
+from app.core.config import settings
+
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
 # 如果是 PostgreSQL，URL 開頭需要修正 (SQLAlchemy 只認 postgresql://)
 if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
     SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def pool_options(url, pool_size: int = None, max_overflow: int = None) -> dict:
+    # 記憶體 SQLite 用的是單一連線池，不吃這些參數
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"): return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE if pool_size is None else pool_size,
+        "max_overflow": settings.DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+def tune_sqlite(sync_engine):
+    # 🔥 WAL：讀取不會被寫入擋住 (團體戰 tick 寫入時其他人照樣能查詢)；
+    # synchronous=NORMAL 在 WAL 下仍保證資料庫不會損毀，只是斷電時可能少掉最後幾筆交易
+    @event.listens_for(sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+# SQLAlchemy 2.1 的 postgresql:// 預設改用 psycopg (v3)，這裡固定用 requirements 裡的 psycopg2
+if _url.drivername == "postgresql": _url = _url.set(drivername="postgresql+psycopg2")
+engine = create_engine(_url, **pool_options(_url))
+# 🔥 commit 後不讓物件過期，回應時不必再為了讀剛寫入的值多一次 SELECT
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+if engine.dialect.name == "sqlite": tune_sqlite(engine)
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# =================================================================
+# 🔥 非同步連線：async def 的熱門 API 用這個，等資料庫時不會卡住事件迴圈
+# =================================================================
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def to_async_url(url: str):
+    # 同一個 DATABASE_URL 換成非同步驅動 (已指定驅動的 URL 維持原樣)
+    u = make_url(url)
+    if u.drivername in ASYNC_DRIVERS: u = u.set(drivername=ASYNC_DRIVERS[u.drivername])
+    return u
+
+ASYNC_DATABASE_URL = to_async_url(SQLALCHEMY_DATABASE_URL)
+# SQLite 同時只能有一個寫入者：非同步請求共用一條連線排隊 (在事件迴圈上等待，不會互相撞鎖)
+if ASYNC_DATABASE_URL.get_backend_name() == "sqlite":
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, pool_size=1, max_overflow=0))
+    tune_sqlite(async_engine.sync_engine)
+else:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL))
+# commit 後不讓物件過期：回應序列化時不能再觸發同步的延遲載入
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,15 +1,20 @@
 # app/main.py
 
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request
+from sqlalchemy.orm.exc import StaleDataError
 from fastapi.middleware.cors import CORSMiddleware
-from app.db.session import engine
-from app.db.base_class import Base
-from app.routers import auth, shop, quest
+from app.db.session import engine, async_engine
+from app.routers import auth, shop, quest, ws
+from app.db.schema import prepare_database
+from app.common.websocket import manager
+from app.common.state_store import state_store
+from app.common.security import password_hasher
+from app.common.retry import stale_conflict
+from app.common.responses import ORJSONResponse
 
-# 自動建立表格 (包含 users_v11, gyms, friendships)
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Pokemon RPG API")
+# 🔥 回傳 dict 的路由 (輪詢、道館列表 ...) 改用 orjson 編碼
+app = FastAPI(title="Pokemon RPG API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,16 +24,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 🔥 沒有掛 retry_on_stale 的 handler 遇到版本衝突時回 409，由前端重送
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    return ORJSONResponse(status_code=409, content={"detail": stale_conflict().detail})
+
 # 路由掛載
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(shop.router, prefix="/api/v1/shop", tags=["shop"])
 app.include_router(shop.router, prefix="/api/v1/social", tags=["social"])
 app.include_router(quest.router, prefix="/api/v1/quests", tags=["quests"])
+app.include_router(ws.router, tags=["ws"])
 
-# 🔥 V2.12.3: 啟動時初始化道館
 @app.on_event("startup")
-def on_startup():
-    shop.init_gyms()
+async def on_startup():
+    password_hasher.start()
+    # 🔥 建表 / 補欄位 / 道館種子 / 舊資料搬移：版本沒變時只查一次 schema_meta
+    #    (部署流程可先跑 python -m app.db.schema，import 時不再做任何 DDL；多個 worker 同時啟動時由資料庫鎖保證只搬移一次)
+    prepare_database(engine)
+    # 🔥 團體戰狀態機改由背景任務推進
+    app.state.raid_task = asyncio.create_task(shop.raid_scheduler())
+    app.state.sweep_task = asyncio.create_task(shop.session_sweeper())
+    app.state.leaderboard_task = asyncio.create_task(shop.leaderboard_refresher())
+    # 🔥 多 worker (STATE_BACKEND=sqlite)：其他程序發出的推播經由共享儲存轉送
+    app.state.relay_task = asyncio.create_task(manager.relay()) if state_store.shared else None
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.raid_task.cancel()
+    app.state.sweep_task.cancel()
+    app.state.leaderboard_task.cancel()
+    if app.state.relay_task: app.state.relay_task.cancel()
+    password_hasher.shutdown()
+    await async_engine.dispose()
 
 @app.get("/")
 def read_root():
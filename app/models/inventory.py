@@ -0,0 +1,27 @@
+# app/models/inventory.py
+
+from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint
+from app.db.base_class import Base
+
+# =================================================================
+# 背包道具數量 (取代 User.inventory JSON 字典)
+# =================================================================
+class InventoryItem(Base):
+    __tablename__ = "inventory_items"
+    __table_args__ = (UniqueConstraint("user_id", "item_key", name="uq_inventory_user_item"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users_v11.id"), index=True, nullable=False)
+    item_key = Column(String(50), nullable=False)
+    count = Column(Integer, default=0, nullable=False)
+
+# =================================================================
+# 已兌換的序號
+# =================================================================
+class RedeemedCode(Base):
+    __tablename__ = "redeemed_codes"
+    __table_args__ = (UniqueConstraint("user_id", "code", name="uq_redeemed_user_code"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users_v11.id"), index=True, nullable=False)
+    code = Column(String(50), nullable=False)
@@ -0,0 +1,27 @@
+# app/models/pokemon.py
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from app.db.base_class import Base
+from datetime import datetime
+
+# =================================================================
+# 玩家擁有的寶可夢 (取代 User.pokemon_storage JSON 欄位)
+# =================================================================
+class OwnedPokemon(Base):
+    __tablename__ = "owned_pokemon"
+
+    uid = Column(String(100), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users_v11.id"), index=True, nullable=False)
+
+    name = Column(String(50), nullable=False)
+    iv = Column(Integer, default=50)
+    lv = Column(Integer, default=1)
+    exp = Column(Integer, default=0)
+    item = Column(String(50), default="leftovers")
+
+    # 用來維持盒子內的排列順序 (等同舊 JSON list 的 append 順序)
+    obtained_at = Column(DateTime, default=datetime.utcnow)
+
+    def as_dict(self):
+        # 與舊版 pokemon_storage 內每一筆 dict 的格式相同
+        return {"uid": self.uid, "name": self.name, "iv": self.iv, "lv": self.lv, "exp": self.exp, "item": self.item or "leftovers"}
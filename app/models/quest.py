@@ -0,0 +1,40 @@
+# app/models/quest.py
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, text
+from app.db.base_class import Base
+from datetime import datetime
+
+# =================================================================
+# 玩家任務 (取代 User.quests JSON 欄位)
+# =================================================================
+class Quest(Base):
+    __tablename__ = "quests"
+    __table_args__ = (
+        # 擊敗野怪時只查進行中的任務：user + 目標 + 等級條件
+        Index("ix_quests_active_target", "user_id", "target", "target_lv",
+              postgresql_where=text("status = 'ACTIVE'"), sqlite_where=text("status = 'ACTIVE'")),
+    )
+
+    id = Column(String(100), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users_v11.id"), index=True, nullable=False)
+
+    type = Column(String(20), default="BATTLE_WILD", nullable=False)
+    target = Column(String(50), nullable=False)
+    target_lv = Column(Integer, default=1, nullable=False)
+    target_display = Column(String(200), default="")
+    now = Column(Integer, default=0, nullable=False)
+    req = Column(Integer, default=1, nullable=False)
+    xp = Column(Integer, default=0)
+    gold = Column(Integer, default=0)
+    status = Column(String(20), default="ACTIVE", nullable=False)
+
+    # 維持任務列表的顯示順序 (等同舊 JSON list 的 append 順序)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def as_dict(self):
+        # 與舊版 quests JSON 內每一筆 dict 的格式相同 (多了 target_lv)
+        return {
+            "id": self.id, "type": self.type, "target": self.target, "target_lv": self.target_lv,
+            "target_display": self.target_display, "now": self.now, "req": self.req,
+            "xp": self.xp, "gold": self.gold, "status": self.status
+        }
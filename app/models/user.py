@@ -1,8 +1,13 @@
 # app/models/user.py
 
 from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy.orm import relationship, deferred
 from pydantic import BaseModel, ConfigDict
+from typing import Any, Dict, List, Optional, Union
 from app.db.base_class import Base
+from app.models.pokemon import OwnedPokemon
+from app.models.inventory import InventoryItem, RedeemedCode
+from app.models.quest import Quest
 from datetime import datetime
 
 # =================================================================
@@ -13,15 +18,16 @@ class User(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, index=True, nullable=False)
-    hashed_password = Column(String(255), nullable=False)
+    # 🔥 只有登入需要，延遲載入 (group="auth")
+    hashed_password = deferred(Column(String(255), nullable=False), group="auth")
     
     # 權限
     is_admin = Column(Boolean, default=False)
     
     # 玩家數值
-    level = Column(Integer, default=1)
+    level = Column(Integer, default=1, index=True)
     exp = Column(Integer, default=0)
-    money = Column(Integer, default=300)
+    money = Column(Integer, default=300, index=True)
     
     # 寵物狀態 (當前出戰)
     pokemon_name = Column(String(50), default="小火龍")
@@ -34,12 +40,42 @@ class User(Base):
     
     # 核心資料
     active_pokemon_uid = Column(String(100), default="") 
-    pokemon_storage = Column(Text, default="[]") 
+    # 🔥 舊版 JSON 盒子，只保留給啟動時的資料搬移使用，新資料一律寫入 owned_pokemon
+    legacy_pokemon_storage = deferred(Column("pokemon_storage", Text, default="[]"), group="legacy")
+    pokemons = relationship(OwnedPokemon, order_by=(OwnedPokemon.obtained_at, OwnedPokemon.uid), cascade="all, delete-orphan")
     
     # 遊戲資料
-    inventory = Column(Text, default="{}") 
-    unlocked_monsters = Column(Text, default="")
-    quests = Column(Text, default="[]")
+    # 🔥 舊版 JSON 背包，只保留給啟動時的資料搬移使用，數量改存 inventory_items
+    legacy_inventory = deferred(Column("inventory", Text, default="{}"), group="legacy")
+    inventory_items = relationship(InventoryItem, cascade="all, delete-orphan")
+    redeemed = relationship(RedeemedCode, cascade="all, delete-orphan")
+    active_item = Column(String(50), default="leftovers")
+    block_pvp = Column(Boolean, default=False)
+    # 🔥 大欄位一律延遲載入，需要的路由以 current_user_with("collection") 宣告
+    unlocked_monsters = deferred(Column(Text, default=""), group="collection")
+    # 🔥 圖鑑數量 (排行榜用)，由 collection_service.unlock_monsters 與 unlocked_monsters 同步維護
+    collection_count = Column(Integer, default=0, index=True)
+    # 🔥 舊版 JSON 任務，只保留給啟動時的資料搬移使用，任務改存 quests 表格
+    legacy_quests = deferred(Column("quests", Text, default="[]"), group="legacy")
+    quest_rows = relationship(Quest, order_by=Quest.created_at, cascade="all, delete-orphan")
+
+    # 🔥 樂觀鎖：每次 UPDATE 都帶 WHERE version = 舊值，並行請求後到者會收到 StaleDataError
+    version = Column(Integer, nullable=False, default=1)
+    __mapper_args__ = {"version_id_col": version}
+
+    @property
+    def pokemon_storage(self):
+        # 🔥 直接輸出巢狀物件，不再把 JSON 字串包在 JSON 裡 (欄位與舊版 JSON 相同)
+        return [p.as_dict() for p in self.pokemons]
+
+    @property
+    def inventory(self):
+        # 道具數量 + 設定旗標 (格式與舊版 inventory JSON 相同)
+        inv = {i.item_key: i.count for i in self.inventory_items}
+        inv["active_item"] = self.active_item or "leftovers"
+        if self.block_pvp: inv["block_pvp"] = True
+        if self.redeemed: inv["redeemed_codes"] = [r.code for r in self.redeemed]
+        return inv
 
 # =================================================================
 # 2. 道館模型 (Gym) - 更新版
@@ -89,8 +125,52 @@ class UserRead(BaseModel):
     max_hp: int
     attack: int
     
-    inventory: str
-    pokemon_storage: str
+    inventory: Dict[str, Any]
+    pokemon_storage: List[Dict[str, Any]]
     active_pokemon_uid: str
     
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+# 🔥 動作回應用：只輸出這次動作改到的欄位，前端合併進現有狀態 (需要完整狀態時帶 full_user=true)
+USER_DELTA_FIELDS = ("level", "exp", "money", "pokemon_name", "pokemon_image", "pet_level", "pet_exp", "hp", "max_hp", "attack", "active_pokemon_uid")
+
+class UserDelta(BaseModel):
+    level: Optional[int] = None
+    exp: Optional[int] = None
+    money: Optional[int] = None
+    pokemon_name: Optional[str] = None
+    pokemon_image: Optional[str] = None
+    pet_level: Optional[int] = None
+    pet_exp: Optional[int] = None
+    hp: Optional[int] = None
+    max_hp: Optional[int] = None
+    attack: Optional[int] = None
+    active_pokemon_uid: Optional[str] = None
+    inventory: Optional[Dict[str, Any]] = None
+    # 盒子只回傳這次新增 / 變動的寶可夢 (以 uid 對應) 與放生的 uid
+    pokemon: Optional[List[Dict[str, Any]]] = None
+    released_pokemon: Optional[List[str]] = None
+
+    @staticmethod
+    def snapshot(user: User) -> dict:
+        return {k: getattr(user, k) for k in USER_DELTA_FIELDS}
+
+    @classmethod
+    def since(cls, before: dict, user: User, inventory: bool = False, pokemon: Optional[list] = None, released: Optional[list] = None) -> "UserDelta":
+        # 只設定有變動的欄位，搭配 response_model_exclude_unset 不會輸出其他欄位
+        changed = {k: getattr(user, k) for k in USER_DELTA_FIELDS if getattr(user, k) != before[k]}
+        if inventory: changed["inventory"] = user.inventory
+        if pokemon: changed["pokemon"] = pokemon
+        if released: changed["released_pokemon"] = released
+        return cls(**changed)
+
+def user_state(user: User, before: dict, full: bool = False, inventory: bool = False, pokemon: Optional[list] = None, released: Optional[list] = None):
+    # inventory / 完整狀態會載入關聯，AsyncSession 要包在 run_sync 內呼叫
+    return UserRead.model_validate(user) if full else UserDelta.since(before, user, inventory, pokemon, released)
+
+class UserActionResponse(BaseModel):
+    message: str
+    user: Union[UserDelta, UserRead]
+
+    # 各動作額外的欄位 (prize、results、iv ...) 原樣輸出
+    model_config = ConfigDict(extra="allow")
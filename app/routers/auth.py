@@ -2,15 +2,16 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
 from datetime import timedelta
-import json
-import uuid
 
-from app.db.session import get_db
+from app.db.session import get_async_db
 from app.models.user import User, UserCreate, UserRead
-from app.common.security import verify_password, get_password_hash, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.common.security import password_hasher, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
 from app.common.deps import get_current_user
+from app.services.box_service import BoxService
 
 # 🔥 V2.11.23: 修正 Import 路徑
 from app.common.game_data import POKEDEX_DATA, apply_iv_stats
@@ -24,23 +25,17 @@ STARTERS = {
 }
 
 @router.post("/register", response_model=UserRead)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User.id).where(User.username == user.username))
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
+    # 🔥 雜湊要等上百毫秒，先把連線還給連線池再等
+    await db.close()
+    hashed_password = await password_hasher.hash(user.password)
     
     starter_name = STARTERS.get(user.starter_id, "小火龍")
     starter_data = POKEDEX_DATA.get(starter_name)
     
-    # 創建初始寶可夢
-    starter_mon = {
-        "uid": str(uuid.uuid4()),
-        "name": starter_name,
-        "iv": 50, # 初始 IV
-        "lv": 1,
-        "exp": 0
-    }
-    
     # 計算初始能力
     base_hp = starter_data["hp"] if starter_data else 100
     base_atk = starter_data["atk"] if starter_data else 10
@@ -48,27 +43,38 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     # 初始背包
     new_user = User(
         username=user.username,
-        hashed_password=get_password_hash(user.password),
+        hashed_password=hashed_password,
         money=300, # 初始金幣
         pokemon_name=starter_name,
         pokemon_image=starter_data["img"] if starter_data else "",
-        active_pokemon_uid=starter_mon["uid"],
-        pokemon_storage=json.dumps([starter_mon]),
         hp=apply_iv_stats(base_hp, 50, 1, is_hp=True),
         max_hp=apply_iv_stats(base_hp, 50, 1, is_hp=True),
         attack=apply_iv_stats(base_atk, 50, 1, is_hp=False),
-        unlocked_monsters=starter_name
+        unlocked_monsters=starter_name,
+        collection_count=1
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    try: await db.flush()
+    except IntegrityError:
+        # 等待雜湊期間同名帳號已被註冊
+        await db.rollback(); raise HTTPException(status_code=400, detail="Username already registered")
+    
+    # 創建初始寶可夢 (初始 IV 50)
+    starter_mon = await db.run_sync(lambda s: BoxService(s).add(new_user, starter_name, 50, 1))
+    new_user.active_pokemon_uid = starter_mon.uid
+    await db.commit()
+    # UserRead 會讀取盒子與背包，回應前先載入
+    await db.refresh(new_user, ["pokemons", "inventory_items", "redeemed"])
     return new_user
 
 @router.post("/token")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    # hashed_password 是延遲載入欄位，登入只查這一欄
+    hashed_password = await db.scalar(select(User.hashed_password).where(User.username == form_data.username))
+    # 🔥 驗證密碼期間不佔用資料庫連線
+    await db.close()
+    if not hashed_password or not await password_hasher.verify(form_data.password, hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -76,7 +82,7 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": form_data.username}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -4,13 +4,15 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List
 from pydantic import BaseModel
 import random
-import json
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
-from app.models.user import User
+from app.models.user import User, UserDelta, UserActionResponse, user_state
 from app.common.deps import get_current_user
 from app.common.websocket import manager
+from app.common.leveling import LevelCurve
+from app.services.inventory_service import InventoryService
+from app.services.quest_service import QuestService
 
 router = APIRouter()
 
@@ -44,6 +46,8 @@ def get_req_xp(lv):
     if lv < 10: return LEVEL_XP.get(lv, 5000)
     return 5000 + (lv - 9) * 2000
 
+PET_CURVE = LevelCurve(get_req_xp, 25)
+
 async def check_levelup_dual(user: User):
     msg_list = []
     
@@ -57,21 +61,16 @@ async def check_levelup_dual(user: User):
         
     # 2. 寶可夢升級
     if (user.pet_level < user.level or (user.level == 1 and user.pet_level == 1)) and user.pet_level < 25:
-        req_xp_pet = get_req_xp(user.pet_level)
-        while user.pet_exp >= req_xp_pet:
-            if user.pet_level >= user.level and user.level > 1: break
-            if user.pet_level >= 25: break 
-            
-            user.pet_level += 1
-            user.pet_exp -= req_xp_pet
-            
-            # 數值成長 (HP*1.08, ATK*1.06)
+        # 🔥 累積經驗表一次算出新等級 (Lv.1 訓練師不限制寶可夢等級)
+        cap = user.level if user.level > 1 else 25
+        old_pet_lv = user.pet_level
+        user.pet_level, user.pet_exp = PET_CURVE.add_exp(user.pet_level, user.pet_exp, 0, cap)
+        for lv in range(old_pet_lv + 1, user.pet_level + 1):
+            # 數值成長 (HP*1.08, ATK*1.06)，每級取整一次
             user.max_hp = int(user.max_hp * 1.08)
             user.hp = user.max_hp
             user.attack = int(user.attack * 1.06)
-            
-            msg_list.append(f"{user.pokemon_name}升級(Lv.{user.pet_level})")
-            req_xp_pet = get_req_xp(user.pet_level)
+            msg_list.append(f"{user.pokemon_name}升級(Lv.{lv})")
             
     return " & ".join(msg_list) if msg_list else None
 
@@ -137,13 +136,15 @@ class AttackWildSchema(BaseModel):
     is_dead: bool
     level: int 
 
-@router.post("/wild/attack")
+@router.post("/wild/attack", response_model=UserActionResponse, response_model_exclude_unset=True)
 async def attack_wild(
     data: AttackWildSchema,
+    full_user: bool = Query(False),
     db: Session = Depends(get_db), 
     current_user: User = Depends(get_current_user)
 ):
     msg = ""
+    before = UserDelta.snapshot(current_user)
     if data.is_dead:
         base_name = data.monster_name.split('(')[0].strip().replace(" 👑", "")
         monster_lv = data.level
@@ -171,29 +172,15 @@ async def attack_wild(
         
         # 掉落糖果機率 25%
         if random.random() < 0.25:
-            inventory = json.loads(current_user.inventory) if current_user.inventory else {}
-            inventory["candy"] = inventory.get("candy", 0) + 1
-            current_user.inventory = json.dumps(inventory)
+            InventoryService(db).grant(current_user, "candy", 1)
             msg += " 🍬 獲得糖果！"
 
         lvl_msg = await check_levelup_dual(current_user)
         if lvl_msg: msg += f" 🎉 {lvl_msg}！"
             
-        try:
-            quests = json.loads(current_user.quests) if current_user.quests else []
-            quest_updated = False
-            for q in quests:
-                is_target_match = (q["target"] == base_name)
-                is_level_match = (monster_lv >= q["target_lv"])
-                if q["status"] == "ACTIVE" and is_target_match and is_level_match:
-                    if q["now"] < q["req"]:
-                        q["now"] += 1
-                        quest_updated = True
-                        if q["now"] >= q["req"]: q["status"] = "COMPLETED"; msg += " (任務完成!)"
-            if quest_updated: current_user.quests = json.dumps(quests)
-        except Exception as e: print(e)
+        if "COMPLETED" in QuestService(db).record_kill(current_user.id, base_name, monster_lv): msg += " (任務完成!)"
 
         db.add(current_user)
         db.commit()
     
-    return {"message": msg, "user": current_user}
\ No newline at end of file
+    return {"message": msg, "user": user_state(current_user, before, full_user, inventory=True)}
\ No newline at end of file
@@ -1,31 +1,26 @@
 # app/routers/quest.py
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 import random
-import json
 import uuid
 import math
 
 from app.db.session import get_db
 from app.common.deps import get_current_user
-from app.models.user import User
+from app.common.retry import retry_on_stale
+from app.models.user import User, UserDelta, UserActionResponse, user_state
+from app.services.inventory_service import InventoryService
+from app.services.quest_service import QuestService
 
 # 引用遊戲資料 (解鎖列表)
-from app.common.game_data import WILD_UNLOCK_LEVELS
+from app.common.wild_roster import unlocked_wild_mons
 
 router = APIRouter()
 
 def generate_quest(user_pet_level):
-    # 1. 找出玩家當前等級能遇到的所有野怪
-    valid_targets = []
-    for unlock_lv, mons in WILD_UNLOCK_LEVELS.items():
-        if unlock_lv <= user_pet_level:
-            valid_targets.extend(mons)
-            
-    # 若無解鎖 (防呆)，預設小拉達
-    if not valid_targets:
-        valid_targets = ["小拉達"]
+    # 1. 找出玩家當前等級能遇到的所有野怪 (若無解鎖則預設小拉達)
+    valid_targets = unlocked_wild_mons(user_pet_level)
         
     # 2. 隨機選一個目標
     target = random.choice(valid_targets)
@@ -62,6 +57,7 @@ def generate_quest(user_pet_level):
         "id": str(uuid.uuid4()),
         "type": q_type,
         "target": target,
+        "target_lv": user_pet_level,
         "target_display": desc,
         "now": 0,
         "req": req,
@@ -72,78 +68,66 @@ def generate_quest(user_pet_level):
 
 @router.get("/")
 def get_quests(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    try:
-        quests = json.loads(current_user.quests) if current_user.quests else []
-    except:
-        quests = []
+    service = QuestService(db)
+    quests = service.list(current_user.id)
     
     # 🔥 核心邏輯：永遠保持 3 個任務
     changed = False
     while len(quests) < 3:
-        new_q = generate_quest(current_user.pet_level)
-        quests.append(new_q)
+        quests.append(service.add(current_user, generate_quest(current_user.pet_level)))
         changed = True
         
     if changed:
-        current_user.quests = json.dumps(quests)
         db.commit()
         
-    return quests
+    return [q.as_dict() for q in quests]
 
-@router.post("/claim/{quest_id}")
-def claim_quest(quest_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    try:
-        quests = json.loads(current_user.quests)
-    except:
-        raise HTTPException(status_code=400, detail="任務資料錯誤")
-        
-    target_q = next((q for q in quests if q["id"] == quest_id), None)
+@router.post("/claim/{quest_id}", response_model=UserActionResponse, response_model_exclude_unset=True)
+@retry_on_stale()
+def claim_quest(quest_id: str, full_user: bool = Query(False), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    service = QuestService(db)
+    target_q = service.get(current_user.id, quest_id)
     if not target_q:
         raise HTTPException(status_code=404, detail="找不到此任務")
         
-    if target_q["now"] < target_q["req"]:
+    if target_q.now < target_q.req:
         raise HTTPException(status_code=400, detail="任務尚未完成")
         
     # 發放獎勵
-    current_user.exp += target_q["xp"]
-    current_user.pet_exp += target_q["xp"]
-    current_user.money += target_q["gold"]
+    before = UserDelta.snapshot(current_user)
+    current_user.exp += target_q.xp
+    current_user.pet_exp += target_q.xp
+    current_user.money += target_q.gold
     
     # 移除已完成任務
-    quests = [q for q in quests if q["id"] != quest_id]
-    current_user.quests = json.dumps(quests)
+    service.remove(current_user, target_q)
     
     msg = ""
     
     # 黃金任務特殊獎勵
-    if target_q["type"] == "GOLDEN":
-        try: inv = json.loads(current_user.inventory)
-        except: inv = {}
-        inv["golden_candy"] = inv.get("golden_candy", 0) + 1
-        current_user.inventory = json.dumps(inv)
+    if target_q.type == "GOLDEN":
+        InventoryService(db).grant(current_user, "golden_candy", 1)
         msg = "獲得 ✨ 黃金糖果 x1"
     else:
-        msg = f"獲得 {target_q['xp']} XP, {target_q['gold']} G"
+        msg = f"獲得 {target_q.xp} XP, {target_q.gold} G"
 
     db.commit()
-    return {"message": f"任務完成！{msg}", "user": current_user}
+    return {"message": f"任務完成！{msg}", "user": user_state(current_user, before, full_user, inventory=target_q.type == "GOLDEN")}
 
 @router.post("/abandon/{quest_id}")
+@retry_on_stale()
 def abandon_quest(quest_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     if current_user.money < 1000:
         raise HTTPException(status_code=400, detail="金幣不足 1000 G")
         
-    try: quests = json.loads(current_user.quests)
-    except: quests = []
-    
-    # 移除任務
-    new_quests = [q for q in quests if q["id"] != quest_id]
-    
-    if len(new_quests) == len(quests):
+    service = QuestService(db)
+    target_q = service.get(current_user.id, quest_id)
+    if not target_q:
         raise HTTPException(status_code=404, detail="找不到任務")
         
+    # 移除任務
     current_user.money -= 1000
-    current_user.quests = json.dumps(new_quests)
+    service.remove(current_user, target_q)
     db.commit()
     
-    return {"message": "已放棄任務 (消耗 1000G)"}
\ No newline at end of file
+    return {"message": "已放棄任務 (消耗 1000G)"}
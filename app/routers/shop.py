@@ -1,73 +1,109 @@
 # app/routers/shop.py
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, Column, Integer, String, ForeignKey, DateTime, Float, desc, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, Column, Integer, String, ForeignKey, DateTime, Float, desc, update, case
 from datetime import datetime, timedelta
+import asyncio
 import random
-import json
 import uuid
-import re
+import time
+from typing import List, Optional
+from pydantic import BaseModel, Field
 
-from app.db.session import get_db, engine
-from app.db.base_class import Base 
-from app.common.deps import get_current_user
-from app.models.user import User, Gym
+from app.db.session import get_db, get_async_db, engine
+from app.db.seed import GYM_SEEDS, seed_gyms
+from app.common.deps import get_current_user, get_current_user_async, current_user_with, current_user_with_async
+from app.models.user import User, Gym, UserDelta, UserActionResponse, user_state
 from app.common.websocket import manager 
+from app.common.state_store import state_store
+from app.common.duel_registry import duels
+from app.services.box_service import BoxService, MAX_BOX_SIZE
+from app.services.inventory_service import InventoryService
+from app.services.quest_service import QuestService
+from app.services.collection_service import unlock_monsters
+from app.services.leaderboard_service import LeaderboardService, LEADERBOARD_COLUMNS
+from app.common.static_payloads import SKILLS_PAYLOAD, ITEMS_PAYLOAD, POKEDEX_PAYLOAD
+from app.common.wild_roster import wild_roster_bytes
+from app.common.alias_sampler import AliasTable
+from app.common.leveling import PLAYER_CURVE
+from app.common.retry import retry_on_stale
 
 # 引入 V2.16.0 的新資料結構 (含 HELD_ITEMS)
 from app.common.game_data import (
     SKILL_DB, POKEDEX_DATA, COLLECTION_MONS, OBTAINABLE_MONS, LEGENDARY_MONS,
     WILD_UNLOCK_LEVELS, GACHA_NORMAL, GACHA_MEDIUM, GACHA_HIGH, 
     GACHA_CANDY, GACHA_GOLDEN, GACHA_LEGENDARY_CANDY, GACHA_LEGENDARY_GOLD,
-    LEVEL_XP_MAP, RAID_BOSS_POOL, HELD_ITEMS, get_req_xp, apply_iv_stats
+    LEVEL_XP_MAP, RAID_BOSS_POOL, HELD_ITEMS, apply_iv_stats
 )
 
 router = APIRouter()
 
 # =================================================================
-# 🔥 初始化邏輯
+# 🔥 共享狀態
 # =================================================================
-def init_gyms():
-    try:
-        with Session(engine) as session:
-            session.execute(text("DROP TABLE IF EXISTS gyms CASCADE"))
-            session.commit()
-            Base.metadata.create_all(bind=engine)
-            gyms = [
-                Gym(id=1, name="第一道館", buff_desc="防守方 HP/ATK +10%", income_rate=10),
-                Gym(id=2, name="第二道館", buff_desc="防守方 HP/ATK +10%", income_rate=15),
-                Gym(id=3, name="第三道館", buff_desc="防守方 HP/ATK +10%", income_rate=15),
-                Gym(id=4, name="第四道館", buff_desc="防守方 HP/ATK +10%", income_rate=20),
-                Gym(id=5, name="限制道館 A", buff_desc="⚠️ 限制 Lv.50 以下 | 收益 +25%", income_rate=25),
-                Gym(id=6, name="限制道館 B", buff_desc="⚠️ 限制 Lv.50 以下 | 收益 +25%", income_rate=25),
-            ]
-            session.add_all(gyms)
-            session.commit()
-            print("✅ 道館初始化完成")
-    except Exception as e:
-        print(f"❌ 道館初始化錯誤: {e}")
-
-ONLINE_USERS = {}
-INVITES = {}
-DUEL_ROOMS = {}
-GYM_BATTLES = {} 
+# 🔥 共享狀態改放在 StateStore (STATE_BACKEND=sqlite 時可跨 worker 共用)
+#    取出的是副本；要改內容時用 update_value 原子地推進，例如 duels.update(room_id, fn)
+#    閒置超過 ttl 秒或超過 max_size 筆時自動淘汰 (玩家關掉分頁不會留下垃圾)
+ONLINE_USERS = state_store.map("online_users", ttl=600, max_size=100_000, refresh_on_read=False)
+INVITES = state_store.map("invites", ttl=300, max_size=10_000)
+GYM_BATTLES = state_store.map("gym_battles", ttl=900, max_size=10_000)
 
 RAID_SCHEDULE = [(8, 0), (14, 0), (18, 0), (21, 0), (22, 0), (23, 0)] 
-RAID_STATE = {"active": False, "status": "IDLE", "boss": None, "current_hp": 0, "max_hp": 0, "players": {}, "last_attack_time": None}
+# 團體戰：Boss 狀態存在 RAID["state"]，參戰玩家另外以 user_id 為 key 存放，加入/攻擊不必整包讀寫
+RAID = state_store.map("raid")
+RAID_PLAYERS = state_store.map("raid_players")
+RAID_IDLE = {"active": False, "status": "IDLE", "boss": None, "current_hp": 0, "max_hp": 0, "last_attack_time": None}
+
+def get_raid_state():
+    return RAID.get("state", RAID_IDLE)
 
 def update_user_activity(user_id):
     ONLINE_USERS[user_id] = datetime.utcnow()
 
 def is_user_busy(user_id):
-    for room in DUEL_ROOMS.values():
-        if (room["p1"] == user_id or room["p2"] == user_id) and room["status"] != "ENDED":
-            return True
-    return False
+    return duels.is_busy(user_id)
 
 def get_now_tw():
     return datetime.utcnow() + timedelta(hours=8)
 
+# =================================================================
+# 🔥 WebSocket 推播 (取代前端輪詢)
+# =================================================================
+RAID_PUSH_INTERVAL = 0.5  # 攻擊造成的 Boss 血量變化，最多每 0.5 秒廣播一次
+_last_raid_push = 0.0
+
+def duel_view(room, user_id):
+    # 與 /duel/status 回傳的格式相同
+    if room["status"] == "PREPARING":
+        remaining = (datetime.fromisoformat(room["countdown_end"]) - datetime.utcnow()).total_seconds()
+        return {"status": "PREPARING", "remaining": remaining}
+    is_p1 = (user_id == room["p1"])
+    my_data = room["p1_data"] if is_p1 else room["p2_data"]
+    op_data = room["p2_data"] if is_p1 else room["p1_data"]
+    return {"status": room["status"], "room_id": "xxx", "turn": room["turn"], "my_data": my_data, "opponent_data": op_data, "is_my_turn": (room["turn"] == user_id)}
+
+def push_duel(room):
+    for pid in (room["p1"], room["p2"]):
+        manager.push(pid, "duel", duel_view(room, pid))
+
+def raid_snapshot(st=None):
+    if st is None: st = get_raid_state()
+    boss = st["boss"]
+    return { "active": st["active"], "status": st["status"], "boss_name": boss["name"] if boss else "", "hp": st["current_hp"], "max_hp": st["max_hp"], "image": boss.get("img", "") if boss else "" }
+
+def push_raid(force=True, st=None):
+    global _last_raid_push
+    now = time.monotonic()
+    if not force and now - _last_raid_push < RAID_PUSH_INTERVAL: return
+    _last_raid_push = now
+    manager.push_all("raid", raid_snapshot(st))
+
+def push_gyms(db: Session):
+    manager.push_all("gyms", build_gym_list(db))
+
 # 🔥 力量頭帶計算 helper
 def calculate_muscle_band(damage, item_id):
     if item_id != "muscle_band": 
@@ -81,19 +117,24 @@ def calculate_muscle_band(damage, item_id):
         
     return damage, "normal" # 剩下 70% 正常
 
+# 🔥 靜態資料直接回傳啟動時編碼好的 bytes (支援 gzip / ETag / 304)
 @router.get("/data/skills")
-def get_skills_data():
-    return SKILL_DB
+async def get_skills_data(request: Request):
+    return SKILLS_PAYLOAD.response(request)
 
 @router.get("/data/items")
-def get_items_data():
-    return HELD_ITEMS
+async def get_items_data(request: Request):
+    return ITEMS_PAYLOAD.response(request)
+
+async def user_state_async(db: AsyncSession, user: User, before: dict, full: bool, inventory: bool = False, pokemon: Optional[list] = None, released: Optional[list] = None):
+    return await db.run_sync(lambda s: user_state(user, before, full, inventory, pokemon, released))
 
 # =================================================================
 # 1. 商店與扭蛋 (價格更新 V2.16)
 # =================================================================
-@router.post("/buy/{item_type}")
-async def buy_item(item_type: str, count: int = Query(1, gt=0), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+@router.post("/buy/{item_type}", response_model=UserActionResponse, response_model_exclude_unset=True)
+@retry_on_stale()
+async def buy_item(item_type: str, count: int = Query(1, gt=0), full_user: bool = Query(False), db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
     PRICES = {
         "candy": {"name": "神奇糖果", "price": 500, "key": "candy"},
         "growth": {"name": "成長糖果", "price": 2000, "key": "growth_candy"},
@@ -104,214 +145,185 @@ async def buy_item(item_type: str, count: int = Query(1, gt=0), db: Session = De
     item = PRICES[item_type]
     cost = item["price"] * count
     
+    before = UserDelta.snapshot(current_user)
     if current_user.money < cost: raise HTTPException(status_code=400, detail=f"金幣不足！需要 {cost} G")
     current_user.money -= cost
     
-    try: inv = json.loads(current_user.inventory)
-    except: inv = {}
-    inv[item["key"]] = inv.get(item["key"], 0) + count
-    current_user.inventory = json.dumps(inv)
-    db.commit()
-    return {"message": f"購買成功！獲得 {item['name']} x{count}", "user": current_user}
-
-@router.post("/gacha/{gacha_type}")
-async def play_gacha(gacha_type: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    try: box = json.loads(current_user.pokemon_storage) if current_user.pokemon_storage else []
-    except: box = []
-    if len(box) >= 35: raise HTTPException(status_code=400, detail="盒子滿了！請先放生")
-    try: inventory = json.loads(current_user.inventory) if current_user.inventory else {}
-    except: inventory = {}
-    
-    cost = 0; pool = []
-    
-    # 🔥 價格更新 (V2.16)
-    if gacha_type == 'normal': pool = GACHA_NORMAL; cost = 2500
-    elif gacha_type == 'medium': pool = GACHA_MEDIUM; cost = 5000
-    elif gacha_type == 'high': pool = GACHA_HIGH; cost = 15000
-    elif gacha_type == 'candy': pool = GACHA_CANDY; cost = 12
-    elif gacha_type == 'golden': pool = GACHA_GOLDEN; cost = 3
-    elif gacha_type == 'legendary_candy': pool = GACHA_LEGENDARY_CANDY; cost = 5
-    elif gacha_type == 'legendary_gold': pool = GACHA_LEGENDARY_GOLD; cost = 200000
-    else: raise HTTPException(status_code=400, detail="未知類型")
-    
-    if gacha_type == 'candy':
-        if inventory.get("candy", 0) < cost: raise HTTPException(status_code=400, detail="糖果不足")
-        inventory["candy"] -= cost
-    elif gacha_type == 'golden':
-        if inventory.get("golden_candy", 0) < cost: raise HTTPException(status_code=400, detail="黃金糖果不足")
-        inventory["golden_candy"] -= cost
-    elif gacha_type == 'legendary_candy':
-        if inventory.get("legendary_candy", 0) < cost: raise HTTPException(status_code=400, detail="傳說糖果不足")
-        inventory["legendary_candy"] -= cost
+    await db.run_sync(lambda s: InventoryService(s).grant(current_user, item["key"], count))
+    await db.commit()
+    return {"message": f"購買成功！獲得 {item['name']} x{count}", "user": await user_state_async(db, current_user, before, full_user, inventory=True)}
+
+# 🔥 扭蛋池：啟動時編譯成別名表，每抽 O(1)
+# type -> (池, 單抽價格, 消耗的道具；None 代表金幣)
+GACHA_CONFIG = {
+    "normal": (GACHA_NORMAL, 2500, None),
+    "medium": (GACHA_MEDIUM, 5000, None),
+    "high": (GACHA_HIGH, 15000, None),
+    "candy": (GACHA_CANDY, 12, "candy"),
+    "golden": (GACHA_GOLDEN, 3, "golden_candy"),
+    "legendary_candy": (GACHA_LEGENDARY_CANDY, 5, "legendary_candy"),
+    "legendary_gold": (GACHA_LEGENDARY_GOLD, 200000, None),
+}
+GACHA_TABLES = {t: AliasTable(pool, [p['weight'] for p in pool]) for t, (pool, cost, currency) in GACHA_CONFIG.items()}
+GACHA_CURRENCY_ERRORS = {"candy": "糖果不足", "golden_candy": "黃金糖果不足", "legendary_candy": "傳說糖果不足"}
+GACHA_RARE_MONS = ['快龍', '超夢', '夢幻', '拉普拉斯', '幸福蛋', '耿鬼', '鳳王', '洛奇亞']
+GACHA_MAX_COUNT = 10
+
+def draw_gacha(db: Session, current_user: User, gacha_type: str, count: int):
+    box = BoxService(db)
+    # 🔥 連抽：容量與花費一次檢查，全部寫入後只 commit 一次
+    if box.count(current_user.id) + count > MAX_BOX_SIZE:
+        raise HTTPException(status_code=400, detail="盒子滿了！請先放生" if count == 1 else f"盒子空間不足 {count} 格！請先放生")
+    inventory = InventoryService(db)
+    pool, cost, currency = GACHA_CONFIG[gacha_type]
+    total_cost = cost * count
+    
+    if currency:
+        if not inventory.spend(current_user, currency, total_cost): raise HTTPException(status_code=400, detail=GACHA_CURRENCY_ERRORS[currency])
     else:
-        if current_user.money < cost: raise HTTPException(status_code=400, detail="金幣不足")
-        current_user.money -= cost
-        
-    prize_data = random.choices(pool, weights=[p['weight'] for p in pool], k=1)[0]
-    prize_name = prize_data['name']
+        if current_user.money < total_cost: raise HTTPException(status_code=400, detail="金幣不足")
+        current_user.money -= total_cost
     
-    new_lv = random.randint(1, current_user.level)
     min_iv = 0
     if 'legendary' in gacha_type: min_iv = 60 
-    iv = random.randint(min_iv, 100)
-    
-    # 預設攜帶 Leftovers
-    new_mon = { "uid": str(uuid.uuid4()), "name": prize_name, "iv": iv, "lv": new_lv, "exp": 0, "item": "leftovers" }
-    box.append(new_mon)
-    
-    current_user.pokemon_storage = json.dumps(box)
-    current_user.inventory = json.dumps(inventory)
-    
-    unlocked = current_user.unlocked_monsters.split(',') if current_user.unlocked_monsters else []
-    if prize_name not in unlocked: unlocked.append(prize_name); current_user.unlocked_monsters = ",".join(unlocked)
+    prizes = []
+    for prize_data in GACHA_TABLES[gacha_type].sample_many(count):
+        new_lv = random.randint(1, current_user.level)
+        iv = random.randint(min_iv, 100)
+        # 預設攜帶 Leftovers
+        prizes.append(box.add(current_user, prize_data['name'], iv, new_lv, item="leftovers").as_dict())
     
-    db.commit()
+    unlock_monsters(current_user, [p["name"] for p in prizes])
+    return prizes
+
+@router.post("/gacha/{gacha_type}", response_model=UserActionResponse, response_model_exclude_unset=True)
+@retry_on_stale()
+async def play_gacha(gacha_type: str, count: int = Query(1, ge=1, le=GACHA_MAX_COUNT), full_user: bool = Query(False), db: AsyncSession = Depends(get_async_db), current_user: User = Depends(current_user_with_async("collection"))):
+    if gacha_type not in GACHA_CONFIG: raise HTTPException(status_code=400, detail="未知類型")
+    before = UserDelta.snapshot(current_user)
+    prizes = await db.run_sync(draw_gacha, current_user, gacha_type, count)
+    await db.commit()
+    user = await user_state_async(db, current_user, before, full_user, inventory=GACHA_CONFIG[gacha_type][2] is not None, pokemon=prizes)
     try:
-        if 'legendary' in gacha_type or gacha_type in ['golden', 'high'] or prize_name in ['快龍', '超夢', '夢幻', '拉普拉斯', '幸福蛋', '耿鬼', '鳳王', '洛奇亞']: 
-            await manager.broadcast(f"🎰 恭喜 [{current_user.username}] 獲得了稀有的 [{prize_name}] (Lv.{new_lv})！")
+        rare_type = 'legendary' in gacha_type or gacha_type in ['golden', 'high']
+        rare = [p for p in prizes if rare_type or p["name"] in GACHA_RARE_MONS]
+        # 連抽的稀有獎勵合併成一則廣播
+        if rare: await manager.broadcast(f"🎰 恭喜 [{current_user.username}] 獲得了稀有的 " + "、".join(f"[{p['name']}] (Lv.{p['lv']})" for p in rare) + "！")
     except: pass
     
-    return {"message": f"獲得 {prize_name} (Lv.{new_lv}, IV: {iv})!", "prize": new_mon, "user": current_user}
+    if count == 1:
+        new_mon = prizes[0]
+        return {"message": f"獲得 {new_mon['name']} (Lv.{new_mon['lv']}, IV: {new_mon['iv']})!", "prize": new_mon, "user": user}
+    return {"message": f"{count} 連抽獲得：" + "、".join(f"{p['name']} (Lv.{p['lv']})" for p in prizes), "prize": prizes[0], "prizes": prizes, "user": user}
 
 # =================================================================
 # 2. 核心功能 API (含裝備系統)
 # =================================================================
 
+def sync_active_stats(user: User, target, heal: bool = False):
+    # 出戰中的寶可夢數值有變動時，同步更新玩家身上的 HP/ATK (包含道具加成)
+    if target.uid != user.active_pokemon_uid: return
+    base = POKEDEX_DATA.get(target.name)
+    if not base: return
+    item_id = target.item or "leftovers"
+    user.max_hp = apply_iv_stats(base["hp"], target.iv, target.lv, is_hp=True, is_player=True, item_id=item_id)
+    user.attack = apply_iv_stats(base["atk"], target.iv, target.lv, is_hp=False, is_player=True, item_id=item_id)
+    if heal: user.hp = user.max_hp
+
+def equip_box_item(user: User, target, item_id: str) -> str:
+    if item_id not in HELD_ITEMS: raise HTTPException(status_code=400, detail="道具不存在")
+    target.item = item_id
+    # 若是當前出戰，需同步更新玩家屬性
+    if target.uid == user.active_pokemon_uid: user.active_item = item_id
+    sync_active_stats(user, target, heal=True)
+    return f"已裝備 {HELD_ITEMS[item_id]['name']}"
+
 # 🔥 裝備道具 (V2.16.1 修復：db.refresh)
-@router.post("/box/item/{pokemon_uid}")
-async def equip_item(pokemon_uid: str, item_id: str = Query(...), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+@router.post("/box/item/{pokemon_uid}", response_model=UserActionResponse, response_model_exclude_unset=True)
+@retry_on_stale()
+async def equip_item(pokemon_uid: str, item_id: str = Query(...), full_user: bool = Query(False), db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
     if item_id not in HELD_ITEMS: raise HTTPException(status_code=400, detail="道具不存在")
-    try: box = json.loads(current_user.pokemon_storage)
-    except: box = []
-    target = next((p for p in box if p["uid"] == pokemon_uid), None)
+    target = await db.run_sync(lambda s: BoxService(s).get(current_user.id, pokemon_uid))
     if not target: raise HTTPException(status_code=404, detail="找不到")
-    
-    target["item"] = item_id
-    
-    # 若是當前出戰，需同步更新玩家屬性
-    if pokemon_uid == current_user.active_pokemon_uid:
-        try: inv = json.loads(current_user.inventory)
-        except: inv = {}
-        inv["active_item"] = item_id
-        current_user.inventory = json.dumps(inv)
-        
-        base = POKEDEX_DATA.get(target["name"])
-        if base:
-            # 重新計算 HP/ATK (包含道具加成)
-            current_user.max_hp = apply_iv_stats(base["hp"], target["iv"], target["lv"], is_hp=True, is_player=True, item_id=item_id)
-            current_user.attack = apply_iv_stats(base["atk"], target["iv"], target["lv"], is_hp=False, is_player=True, item_id=item_id)
-            current_user.hp = current_user.max_hp
-
-    current_user.pokemon_storage = json.dumps(box)
-    db.commit()
-    # 🔥 關鍵修復：強制刷新，確保前端拿到最新狀態，防止選項跳回
-    db.refresh(current_user)
-    return {"message": f"已裝備 {HELD_ITEMS[item_id]['name']}", "user": current_user}
+    before = UserDelta.snapshot(current_user)
+    msg = equip_box_item(current_user, target, item_id)
+    await db.commit()
+    # 🔥 出戰道具存在 inventory 的 active_item，一併回傳避免前端選項跳回
+    return {"message": msg, "user": await user_state_async(db, current_user, before, full_user, inventory=True, pokemon=[target.as_dict()])}
 
-@router.post("/box/swap/{pokemon_uid}")
-async def swap_active_pokemon(pokemon_uid: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    try: box = json.loads(current_user.pokemon_storage)
-    except: box = []
-    target = next((p for p in box if p["uid"] == pokemon_uid), None)
+def swap_active(db: Session, current_user: User, pokemon_uid: str):
+    target = BoxService(db).get(current_user.id, pokemon_uid)
     if not target: raise HTTPException(status_code=404, detail="找不到")
     
     current_user.active_pokemon_uid = pokemon_uid
-    current_user.pokemon_name = target["name"]
-    current_user.pet_level = target["lv"]
-    current_user.pet_exp = target["exp"]
+    current_user.pokemon_name = target.name
+    current_user.pet_level = target.lv
+    current_user.pet_exp = target.exp
     
     # 🔥 更新 active_item
-    item_id = target.get("item", "leftovers")
-    try: inv = json.loads(current_user.inventory)
-    except: inv = {}
-    inv["active_item"] = item_id
-    current_user.inventory = json.dumps(inv)
+    item_id = target.item or "leftovers"
+    current_user.active_item = item_id
     
-    base = POKEDEX_DATA.get(target["name"])
+    base = POKEDEX_DATA.get(target.name)
     if base:
         current_user.pokemon_image = base["img"]
-        current_user.max_hp = apply_iv_stats(base["hp"], target["iv"], target["lv"], is_hp=True, is_player=True, item_id=item_id)
-        current_user.attack = apply_iv_stats(base["atk"], target["iv"], target["lv"], is_hp=False, is_player=True, item_id=item_id)
+        current_user.max_hp = apply_iv_stats(base["hp"], target.iv, target.lv, is_hp=True, is_player=True, item_id=item_id)
+        current_user.attack = apply_iv_stats(base["atk"], target.iv, target.lv, is_hp=False, is_player=True, item_id=item_id)
     else:
         current_user.pokemon_image = "https://via.placeholder.com/150"
         current_user.max_hp = 100
         current_user.attack = 10
         
     current_user.hp = current_user.max_hp
-    db.commit()
+    return target
+
+@router.post("/box/swap/{pokemon_uid}")
+@retry_on_stale()
+async def swap_active_pokemon(pokemon_uid: str, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
+    target = await db.run_sync(swap_active, current_user, pokemon_uid)
+    await db.commit()
     await manager.broadcast(f"EVENT:PVP_SWAP|{current_user.id}")
-    return {"message": f"就決定是你了，{target['name']}！"}
+    return {"message": f"就決定是你了，{target.name}！"}
 
-@router.post("/box/action/{action}/{pokemon_uid}")
-async def box_action(action: str, pokemon_uid: str, count: int = Query(1, gt=0), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    box = json.loads(current_user.pokemon_storage); inv = json.loads(current_user.inventory)
-    target = next((p for p in box if p["uid"] == pokemon_uid), None)
-    if not target: raise HTTPException(status_code=404, detail="找不到")
-    
-    if action == "release":
-        if pokemon_uid == current_user.active_pokemon_uid: raise HTTPException(status_code=400, detail="無法放生出戰中寶可夢")
-        box = [p for p in box if p["uid"] != pokemon_uid]
-        if target["name"] in LEGENDARY_MONS:
-            inv["legendary_candy"] = inv.get("legendary_candy", 0) + 1; msg = "✨ 放生傳說寶可夢，獲得 🔮 傳說糖果 x1"
-        else: current_user.money += 100; msg = "放生成功，獲得 100 Gold"
-        
-    elif action == "candy":
-        if target["lv"] >= current_user.level: raise HTTPException(status_code=400, detail="等級已達上限")
-        if inv.get("growth_candy", 0) < count: raise HTTPException(status_code=400, detail="成長糖果不足")
-        
-        real_used = 0
-        for _ in range(count):
-            if target["lv"] >= current_user.level: break 
-            inv["growth_candy"] -= 1
-            target["exp"] += 1500 
-            real_used += 1
-            req = get_req_xp(target["lv"])
-            while target["exp"] >= req and target["lv"] < 120:
-                if target["lv"] >= current_user.level: break
-                target["lv"] += 1; target["exp"] -= req; req = get_req_xp(target["lv"])
-        
-        if pokemon_uid == current_user.active_pokemon_uid:
-            base = POKEDEX_DATA.get(target["name"])
-            item_id = target.get("item", "leftovers")
-            if base: 
-                current_user.pet_level = target["lv"]
-                current_user.pet_exp = target["exp"]
-                current_user.max_hp = apply_iv_stats(base["hp"], target["iv"], target["lv"], is_hp=True, is_player=True, item_id=item_id)
-                current_user.attack = apply_iv_stats(base["atk"], target["iv"], target["lv"], is_hp=False, is_player=True, item_id=item_id)
-        msg = f"使用了 {real_used} 顆糖果，目前 Lv.{target['lv']}"
-        
-    current_user.pokemon_storage = json.dumps(box); current_user.inventory = json.dumps(inv)
-    db.commit()
-    return {"message": msg, "user": current_user}
-
-@router.post("/box/action/train")
-async def train_pokemon(pokemon_uid: str, mode: str = Query(...), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    box = json.loads(current_user.pokemon_storage)
-    try: inv = json.loads(current_user.inventory)
-    except: inv = {}
-    target = next((p for p in box if p["uid"] == pokemon_uid), None)
-    if not target: raise HTTPException(status_code=404, detail="找不到該寶可夢")
-    is_legendary = target["name"] in LEGENDARY_MONS
-    
-    cost_candy = 0; cost_gold_candy = 0; cost_leg_candy = 0; cost_money = 0
-    if mode == 'normal':
-        if is_legendary: cost_candy = 50; cost_leg_candy = 3; cost_money = 5000
-        else: cost_candy = 30; cost_gold_candy = 3; cost_money = 1000
-    elif mode == 'hyper':
-        if is_legendary: cost_candy = 250; cost_leg_candy = 15; cost_money = 25000
-        else: cost_candy = 150; cost_gold_candy = 15; cost_money = 5000
-            
-    if current_user.money < cost_money: raise HTTPException(status_code=400, detail=f"金幣不足")
-    if inv.get("candy", 0) < cost_candy: raise HTTPException(status_code=400, detail=f"糖果不足")
-    if inv.get("golden_candy", 0) < cost_gold_candy: raise HTTPException(status_code=400, detail=f"黃金糖果不足")
-    if inv.get("legendary_candy", 0) < cost_leg_candy: raise HTTPException(status_code=400, detail=f"傳說糖果不足")
-    
-    current_user.money -= cost_money
-    inv["candy"] -= cost_candy
-    inv["golden_candy"] = inv.get("golden_candy", 0) - cost_gold_candy
-    inv["legendary_candy"] = inv.get("legendary_candy", 0) - cost_leg_candy
+CANDY_EXP = 1500  # 每顆成長糖果的經驗值
+
+def release_box_pokemon(box: BoxService, inv: InventoryService, user: User, target) -> str:
+    if target.uid == user.active_pokemon_uid: raise HTTPException(status_code=400, detail="無法放生出戰中寶可夢")
+    box.remove(user, target)
+    if target.name in LEGENDARY_MONS:
+        inv.grant(user, "legendary_candy", 1); return "✨ 放生傳說寶可夢，獲得 🔮 傳說糖果 x1"
+    user.money += 100; return "放生成功，獲得 100 Gold"
+
+def feed_box_candy(inv: InventoryService, user: User, target, count: int) -> str:
+    if target.lv >= user.level: raise HTTPException(status_code=400, detail="等級已達上限")
+    if inv.get(user.id, "growth_candy") < count: raise HTTPException(status_code=400, detail="成長糖果不足")
+    # 🔥 累積經驗表直接算出：到達訓練師等級前需要幾顆、吃完後的等級與經驗
+    real_used = PLAYER_CURVE.units_to_cap(target.lv, target.exp, CANDY_EXP, count, user.level)
+    lv, exp = PLAYER_CURVE.add_exp(target.lv, target.exp, CANDY_EXP * real_used, user.level)
+    if not inv.spend(user, "growth_candy", real_used): raise HTTPException(status_code=400, detail="成長糖果不足")
+    target.lv = lv; target.exp = exp
+    if target.uid == user.active_pokemon_uid and POKEDEX_DATA.get(target.name):
+        user.pet_level = target.lv; user.pet_exp = target.exp
+    sync_active_stats(user, target)
+    return f"使用了 {real_used} 顆糖果，目前 Lv.{target.lv}"
+
+TRAIN_COSTS = {
+    # mode -> 是否傳說 -> (糖果, 黃金糖果, 傳說糖果, 金幣)
+    "normal": {False: (30, 3, 0, 1000), True: (50, 0, 3, 5000)},
+    "hyper": {False: (150, 15, 0, 5000), True: (250, 0, 15, 25000)},
+}
+
+def train_box_pokemon(inv: InventoryService, user: User, target, mode: str):
+    is_legendary = target.name in LEGENDARY_MONS
+    cost_candy, cost_gold_candy, cost_leg_candy, cost_money = TRAIN_COSTS.get(mode, {}).get(is_legendary, (0, 0, 0, 0))
+    if user.money < cost_money: raise HTTPException(status_code=400, detail=f"金幣不足")
+    # 任何一項不足都會直接拋錯，整筆交易不會 commit
+    if not inv.spend(user, "candy", cost_candy): raise HTTPException(status_code=400, detail=f"糖果不足")
+    if not inv.spend(user, "golden_candy", cost_gold_candy): raise HTTPException(status_code=400, detail=f"黃金糖果不足")
+    if not inv.spend(user, "legendary_candy", cost_leg_candy): raise HTTPException(status_code=400, detail=f"傳說糖果不足")
+    user.money -= cost_money
     
-    old_iv = target.get("iv", 0)
+    old_iv = target.iv or 0
     if mode == 'normal': 
         min_val = 60 if is_legendary else 0
         new_iv = random.randint(min_val, 100)
@@ -320,35 +332,117 @@ async def train_pokemon(pokemon_uid: str, mode: str = Query(...), db: Session =
         if old_iv >= 100: raise HTTPException(status_code=400, detail="IV 已滿")
         new_iv = random.randint(old_iv + 1, 100)
         msg = f"極限特訓成功！IV {old_iv} -> {new_iv}"
-        
-    target["iv"] = new_iv
-    if pokemon_uid == current_user.active_pokemon_uid:
-        base = POKEDEX_DATA.get(target["name"])
-        item_id = target.get("item", "leftovers")
-        if base: 
-            current_user.max_hp = apply_iv_stats(base["hp"], target["iv"], target["lv"], is_hp=True, is_player=True, item_id=item_id)
-            current_user.attack = apply_iv_stats(base["atk"], target["iv"], target["lv"], is_hp=False, is_player=True, item_id=item_id)
-            current_user.hp = current_user.max_hp
-    
-    current_user.pokemon_storage = json.dumps(box)
-    current_user.inventory = json.dumps(inv)
-    db.commit()
-    return {"message": msg, "iv": new_iv, "user": current_user}
+    target.iv = new_iv
+    sync_active_stats(user, target, heal=True)
+    return msg, new_iv
+
+def apply_box_action(db: Session, current_user: User, action: str, pokemon_uid: str, count: int):
+    box = BoxService(db); inv = InventoryService(db)
+    target = box.get(current_user.id, pokemon_uid)
+    if not target: raise HTTPException(status_code=404, detail="找不到")
+    
+    if action == "release": msg = release_box_pokemon(box, inv, current_user, target)
+    elif action == "candy": msg = feed_box_candy(inv, current_user, target, count)
+    return msg, target
+
+@router.post("/box/action/{action}/{pokemon_uid}", response_model=UserActionResponse, response_model_exclude_unset=True)
+@retry_on_stale()
+async def box_action(action: str, pokemon_uid: str, count: int = Query(1, gt=0), full_user: bool = Query(False), db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
+    before = UserDelta.snapshot(current_user)
+    msg, target = await db.run_sync(apply_box_action, current_user, action, pokemon_uid, count)
+    await db.commit()
+    if action == "release": changes = {"released": [pokemon_uid]}
+    else: changes = {"pokemon": [target.as_dict()]}
+    return {"message": msg, "user": await user_state_async(db, current_user, before, full_user, inventory=True, **changes)}
+
+def train_by_uid(db: Session, current_user: User, pokemon_uid: str, mode: str):
+    target = BoxService(db).get(current_user.id, pokemon_uid)
+    if not target: raise HTTPException(status_code=404, detail="找不到該寶可夢")
+    msg, _ = train_box_pokemon(InventoryService(db), current_user, target, mode)
+    return msg, target
+
+@router.post("/box/action/train", response_model=UserActionResponse, response_model_exclude_unset=True)
+@retry_on_stale()
+async def train_pokemon(pokemon_uid: str, mode: str = Query(...), full_user: bool = Query(False), db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
+    before = UserDelta.snapshot(current_user)
+    msg, target = await db.run_sync(train_by_uid, current_user, pokemon_uid, mode)
+    await db.commit()
+    return {"message": msg, "iv": target.iv, "user": await user_state_async(db, current_user, before, full_user, inventory=True, pokemon=[target.as_dict()])}
+
+# 🔥 一次送出多筆盒子操作 (放生 / 糖果 / 裝備 / 特訓)，全部成功才 commit
+BOX_BATCH_ACTIONS = ("release", "candy", "equip", "train")
+BOX_BATCH_MAX_OPS = 100
+
+class BoxBatchOp(BaseModel):
+    action: str
+    uid: str
+    count: int = Field(1, gt=0)
+    item_id: Optional[str] = None
+    mode: Optional[str] = None
+
+def apply_box_batch(db: Session, current_user: User, ops: List[BoxBatchOp]):
+    box = BoxService(db); inv = InventoryService(db)
+    targets = box.get_many(current_user.id, [op.uid for op in ops])
+    
+    # 先整批檢查，有任何一筆不合法就不動資料
+    released = set()
+    for i, op in enumerate(ops, 1):
+        if op.action not in BOX_BATCH_ACTIONS: raise HTTPException(status_code=400, detail=f"第 {i} 筆：未知的操作 {op.action}")
+        if op.uid not in targets: raise HTTPException(status_code=404, detail=f"第 {i} 筆：找不到")
+        if op.uid in released: raise HTTPException(status_code=400, detail=f"第 {i} 筆：{targets[op.uid].name} 已經放生")
+        if op.action == "release":
+            if op.uid == current_user.active_pokemon_uid: raise HTTPException(status_code=400, detail=f"第 {i} 筆：無法放生出戰中寶可夢")
+            released.add(op.uid)
+        if op.action == "equip" and op.item_id not in HELD_ITEMS: raise HTTPException(status_code=400, detail=f"第 {i} 筆：道具不存在")
+        if op.action == "train" and op.mode not in TRAIN_COSTS: raise HTTPException(status_code=400, detail=f"第 {i} 筆：未知的特訓模式")
+    
+    results = []
+    for i, op in enumerate(ops, 1):
+        target = targets[op.uid]
+        try:
+            if op.action == "release": msg = release_box_pokemon(box, inv, current_user, target)
+            elif op.action == "candy": msg = feed_box_candy(inv, current_user, target, op.count)
+            elif op.action == "equip": msg = equip_box_item(current_user, target, op.item_id)
+            else: msg, _ = train_box_pokemon(inv, current_user, target, op.mode)
+        except HTTPException as e:
+            # 中途失敗：整批回滾，前面已套用的操作也不會生效
+            db.rollback()
+            raise HTTPException(status_code=e.status_code, detail=f"第 {i} 筆：{e.detail}")
+        results.append({"uid": op.uid, "action": op.action, "message": msg})
+    # 回傳有變動的寶可夢 (依第一次出現的順序) 與放生的 uid，給前端合併盒子
+    changed = [targets[uid].as_dict() for uid in dict.fromkeys(op.uid for op in ops) if uid not in released]
+    return results, changed, [op.uid for op in ops if op.action == "release"]
+
+@router.post("/box/batch", response_model=UserActionResponse, response_model_exclude_unset=True)
+@retry_on_stale()
+async def box_batch(ops: List[BoxBatchOp], full_user: bool = Query(False), db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
+    if not ops: raise HTTPException(status_code=400, detail="沒有任何操作")
+    if len(ops) > BOX_BATCH_MAX_OPS: raise HTTPException(status_code=400, detail=f"一次最多 {BOX_BATCH_MAX_OPS} 筆操作")
+    before = UserDelta.snapshot(current_user)
+    results, changed, released = await db.run_sync(apply_box_batch, current_user, ops)
+    await db.commit()
+    return {"message": f"已完成 {len(results)} 筆操作", "results": results, "user": await user_state_async(db, current_user, before, full_user, inventory=True, pokemon=changed, released=released)}
 
 # =================================================================
 # 3. 道館系統 (Gym) - 🔥 修正：道具與補血
 # =================================================================
 
+def update_user_atomic(db: Session, user_id: int, **values):
+    # 單一條 UPDATE 改玩家欄位 (version 也 +1，讓並行中的 ORM 寫入重試)，本身不會因版本衝突失敗
+    db.execute(
+        update(User).where(User.id == user_id).values(**values, version=User.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
 @router.get("/gym/list")
 def get_gym_list(db: Session = Depends(get_db)):
-    try:
-        gyms = db.query(Gym).all()
-        if not gyms: raise Exception("No gyms found")
-    except Exception as e:
-        print(f"⚠️ 偵測到道館資料異常，正在嘗試自我修復... {e}")
-        db.rollback()
-        init_gyms() 
-        return []
+    gyms = db.query(Gym).all()
+    # 道館由 prepare_database 建立；資料被清空時補回定義即可 (不會動到其他道館的佔領狀態)
+    if len(gyms) < len(GYM_SEEDS): seed_gyms(db); gyms = db.query(Gym).all()
+    return build_gym_list(db, gyms)
+
+def build_gym_list(db: Session, gyms=None):
+    if gyms is None: gyms = db.query(Gym).all()
     result = []
     now = get_now_tw()
     for g in gyms:
@@ -367,31 +461,35 @@ def get_gym_list(db: Session = Depends(get_db)):
         })
     return result
 
-@router.post("/gym/occupy/{gym_id}")
-async def occupy_gym(gym_id: int, pokemon_uid: str = Query(...), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def occupy(db: Session, current_user: User, gym_id: int, pokemon_uid: str) -> str:
     gym = db.query(Gym).filter(Gym.id == gym_id).first()
     if not gym: raise HTTPException(status_code=404, detail="道館不存在")
     if gym.leader_id and gym.leader_id != current_user.id: raise HTTPException(status_code=400, detail="道館已被佔領，請先擊敗館主")
     existing_gym = db.query(Gym).filter(Gym.leader_pokemon_uid == pokemon_uid).first()
     if existing_gym and existing_gym.id != gym_id: raise HTTPException(status_code=400, detail=f"這隻寶可夢正在守衛 {existing_gym.name}")
-    try: box = json.loads(current_user.pokemon_storage)
-    except: box = []
-    target_mon = next((p for p in box if p["uid"] == pokemon_uid), None)
+    target_mon = BoxService(db).get(current_user.id, pokemon_uid)
     if not target_mon: raise HTTPException(status_code=404, detail="找不到該寶可夢")
-    if gym_id in [5, 6] and target_mon["lv"] > 50: raise HTTPException(status_code=400, detail="此道館限制 Lv.50 以下的寶可夢才能佔領！")
-    base = POKEDEX_DATA.get(target_mon["name"])
+    if gym_id in [5, 6] and target_mon.lv > 50: raise HTTPException(status_code=400, detail="此道館限制 Lv.50 以下的寶可夢才能佔領！")
+    base = POKEDEX_DATA.get(target_mon.name)
     if not base: raise HTTPException(status_code=400, detail="資料錯誤")
     
     # 🔥 佔領時寫入道具加成數值
-    item_id = target_mon.get("item", "leftovers")
-    hp = apply_iv_stats(base["hp"], target_mon["iv"], target_mon["lv"], is_hp=True, is_player=True, item_id=item_id)
-    atk = apply_iv_stats(base["atk"], target_mon["iv"], target_mon["lv"], is_hp=False, is_player=True, item_id=item_id)
+    item_id = target_mon.item or "leftovers"
+    hp = apply_iv_stats(base["hp"], target_mon.iv, target_mon.lv, is_hp=True, is_player=True, item_id=item_id)
+    atk = apply_iv_stats(base["atk"], target_mon.iv, target_mon.lv, is_hp=False, is_player=True, item_id=item_id)
     
-    gym.leader_id = current_user.id; gym.leader_name = current_user.username; gym.leader_pokemon = target_mon["name"]; gym.leader_pokemon_uid = pokemon_uid; gym.leader_hp = hp; gym.leader_max_hp = hp; gym.leader_atk = atk; gym.leader_img = base["img"]; gym.occupied_at = get_now_tw(); gym.protection_until = get_now_tw() + timedelta(minutes=5)
+    gym.leader_id = current_user.id; gym.leader_name = current_user.username; gym.leader_pokemon = target_mon.name; gym.leader_pokemon_uid = pokemon_uid; gym.leader_hp = hp; gym.leader_max_hp = hp; gym.leader_atk = atk; gym.leader_img = base["img"]; gym.occupied_at = get_now_tw(); gym.protection_until = get_now_tw() + timedelta(minutes=5)
     db.commit()
-    return {"message": f"成功派遣 {target_mon['name']} 佔領 {gym.name}！"}
+    push_gyms(db)
+    return f"成功派遣 {target_mon.name} 佔領 {gym.name}！"
+
+@router.post("/gym/occupy/{gym_id}")
+@retry_on_stale()
+async def occupy_gym(gym_id: int, pokemon_uid: str = Query(...), db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
+    return {"message": await db.run_sync(occupy, current_user, gym_id, pokemon_uid)}
 
 @router.post("/gym/battle/start/{gym_id}")
+@retry_on_stale()
 def start_gym_battle(gym_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     gym = db.query(Gym).filter(Gym.id == gym_id).first()
     if not gym: raise HTTPException(status_code=404, detail="道館不存在")
@@ -399,7 +497,7 @@ def start_gym_battle(gym_id: int, current_user: User = Depends(get_current_user)
     if gym.leader_id == current_user.id:
         now = get_now_tw(); mins = (now - gym.occupied_at).total_seconds() / 60; income = int(mins * gym.income_rate)
         if income < 1: return {"result": "WAIT", "message": "目前收益太少，晚點再來收吧"}
-        current_user.money += income; gym.occupied_at = now; db.commit()
+        current_user.money += income; gym.occupied_at = now; db.commit(); push_gyms(db)
         return {"result": "COLLECTED", "message": f"收取了 {income} Gold！"}
     if gym_id in [5, 6] and current_user.pet_level > 50: raise HTTPException(status_code=400, detail="此道館限制 Lv.50 以下的寶可夢才能挑戰！")
     now = get_now_tw()
@@ -408,101 +506,87 @@ def start_gym_battle(gym_id: int, current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=400, detail=f"道館保護中，剩餘 {left} 秒")
     battle_id = str(uuid.uuid4())
     boss_hp = int(gym.leader_max_hp * 1.1); boss_atk = int(gym.leader_atk * 1.1)
-    GYM_BATTLES[battle_id] = { 
-        "gym_id": gym_id, "challenger_id": current_user.id, 
-        "boss_data": { "name": gym.leader_name, "pname": gym.leader_pokemon, "hp": boss_hp, "max_hp": boss_hp, "atk": boss_atk, "img": gym.leader_img, "atk_mult": 1.0 },
-        "player_atk_mult": 1.0 
-    }
-    return {"result": "BATTLE_START", "battle_id": battle_id, "opponent": GYM_BATTLES[battle_id]["boss_data"]}
+    boss_data = { "name": gym.leader_name, "pname": gym.leader_pokemon, "hp": boss_hp, "max_hp": boss_hp, "atk": boss_atk, "img": gym.leader_img, "atk_mult": 1.0 }
+    GYM_BATTLES[battle_id] = { "gym_id": gym_id, "challenger_id": current_user.id, "boss_data": boss_data, "player_atk_mult": 1.0 }
+    return {"result": "BATTLE_START", "battle_id": battle_id, "opponent": boss_data}
 
 @router.post("/gym/battle/attack/{battle_id}")
 def gym_battle_attack(battle_id: str, damage: int = Query(0), heal: int = Query(0), debuff: int = Query(0), current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    if battle_id not in GYM_BATTLES: raise HTTPException(status_code=404, detail="戰鬥已過期")
-    room = GYM_BATTLES[battle_id]
-    
     try: damage = int(damage)
     except: damage = 0
     if damage < 0: damage = 0
     
     # 1. 玩家攻擊 (🔥 力量頭帶判定)
-    try: inv = json.loads(current_user.inventory)
-    except: inv = {}
-    active_item = inv.get("active_item", "leftovers")
+    active_item = current_user.active_item or "leftovers"
     
-    final_dmg, hit_type = calculate_muscle_band(damage, active_item)
-    final_dmg = int(final_dmg * room["player_atk_mult"])
-    
-    room["boss_data"]["hp"] = max(0, room["boss_data"]["hp"] - final_dmg)
-    
-    if debuff > 0: room["player_atk_mult"] *= 0.9 
+    base_dmg, hit_type = calculate_muscle_band(damage, active_item)
     
     # 🔥 修正：使用前端數值補血
-    heal_val = 0
-    if heal > 0:
-        heal_val = heal
-        final_user_hp = min(current_user.max_hp, current_user.hp + heal_val)
-    else:
-        final_user_hp = current_user.hp
-    
-    # 2. Boss AI
-    boss_dmg = 0
-    if room["boss_data"]["hp"] > 0:
-        boss_pname = room["boss_data"]["pname"]
-        boss_base = POKEDEX_DATA.get(boss_pname, {})
-        skills = boss_base.get("skills", ["撞擊", "撞擊", "撞擊"])
-        chosen_skill = random.choice(skills)
-        skill_info = SKILL_DB.get(chosen_skill, {"dmg": 20, "effect": None})
-        
-        base_atk = room["boss_data"]["atk"] * room["boss_data"]["atk_mult"]
-        raw_dmg = (base_atk / 100) * skill_info["dmg"]
-        boss_dmg = int(raw_dmg * random.uniform(0.95, 1.05))
+    heal_val = heal if heal > 0 else 0
+    
+    outcome = {"boss_dmg": 0}
+    def attack(room):
+        # 🔥 房間狀態在 GYM_BATTLES 的鎖 / 交易內推進，連點或多個 worker 同時攻擊不會互相覆蓋
+        if room is None or room["boss_data"]["hp"] <= 0: raise HTTPException(status_code=404, detail="戰鬥已過期")
+        final_dmg = int(base_dmg * room["player_atk_mult"])
+        room["boss_data"]["hp"] = max(0, room["boss_data"]["hp"] - final_dmg)
         
-        final_user_hp = max(0, final_user_hp - boss_dmg)
+        if debuff > 0: room["player_atk_mult"] *= 0.9 
         
-        effect = skill_info.get("effect"); prob = skill_info.get("prob", 0); val = skill_info.get("val", 0)
-        if effect and random.random() < prob:
-            if effect == "heal": 
-                h = int(room["boss_data"]["max_hp"] * val)
-                room["boss_data"]["hp"] += h
-            elif effect == "buff_atk": room["boss_data"]["atk_mult"] *= (1 + val)
-            elif effect == "debuff_atk": room["boss_data"]["atk_mult"] *= (1 - val)
-            elif effect == "recoil": 
-                d = int(room["boss_data"]["max_hp"] * val)
-                room["boss_data"]["hp"] = max(0, room["boss_data"]["hp"] - d)
-    
-    current_user.hp = final_user_hp
-    db.commit()
+        # 2. Boss AI
+        outcome["boss_dmg"] = 0
+        if room["boss_data"]["hp"] > 0:
+            boss_pname = room["boss_data"]["pname"]
+            boss_base = POKEDEX_DATA.get(boss_pname, {})
+            skills = boss_base.get("skills", ["撞擊", "撞擊", "撞擊"])
+            chosen_skill = random.choice(skills)
+            skill_info = SKILL_DB.get(chosen_skill, {"dmg": 20, "effect": None})
+            
+            base_atk = room["boss_data"]["atk"] * room["boss_data"]["atk_mult"]
+            raw_dmg = (base_atk / 100) * skill_info["dmg"]
+            outcome["boss_dmg"] = int(raw_dmg * random.uniform(0.95, 1.05))
+            
+            effect = skill_info.get("effect"); prob = skill_info.get("prob", 0); val = skill_info.get("val", 0)
+            if effect and random.random() < prob:
+                if effect == "heal": 
+                    h = int(room["boss_data"]["max_hp"] * val)
+                    room["boss_data"]["hp"] += h
+                elif effect == "buff_atk": room["boss_data"]["atk_mult"] *= (1 + val)
+                elif effect == "debuff_atk": room["boss_data"]["atk_mult"] *= (1 - val)
+                elif effect == "recoil": 
+                    d = int(room["boss_data"]["max_hp"] * val)
+                    room["boss_data"]["hp"] = max(0, room["boss_data"]["hp"] - d)
+        return room
+    room = GYM_BATTLES.update_value(battle_id, attack)
+    boss_dmg = outcome["boss_dmg"]
+    
+    # 玩家 HP 以單一條 UPDATE 結算 (先補血再扣 Boss 傷害)，房間已經推進，不能再因版本衝突回 409 重打一次
+    healed = case((User.hp + heal_val > User.max_hp, User.max_hp), else_=User.hp + heal_val)
+    update_user_atomic(db, current_user.id, hp=case((healed - boss_dmg < 0, 0), else_=healed - boss_dmg))
+    user_hp = db.query(User.hp).filter(User.id == current_user.id).scalar()
     
     if room["boss_data"]["hp"] <= 0:
         gym = db.query(Gym).filter(Gym.id == room["gym_id"]).first()
-        old_leader = db.query(User).filter(User.id == gym.leader_id).first()
-        if old_leader:
+        if gym.leader_id:
             mins = (get_now_tw() - gym.occupied_at).total_seconds() / 60; income = int(mins * gym.income_rate); 
-            if income > 0: old_leader.money += income
+            if income > 0: update_user_atomic(db, gym.leader_id, money=User.money + income)
         gym.leader_id = None; gym.leader_name = ""; gym.leader_pokemon = ""; gym.leader_pokemon_uid = ""; gym.occupied_at = None; gym.protection_until = None
-        current_user.hp = current_user.max_hp; current_user.money += 500; db.commit(); del GYM_BATTLES[battle_id]
-        return {"result": "WIN_SELECT", "reward": "踢館成功！請選擇寶可夢佔領！", "user_hp": current_user.hp, "gym_id": gym.id}
-    if current_user.hp <= 0: current_user.hp = current_user.max_hp; db.commit(); del GYM_BATTLES[battle_id]; return {"result": "LOSE", "reward": "挑戰失敗... (HP已回復)", "user_hp": current_user.hp, "boss_dmg": boss_dmg}
-    return {"result": "NEXT", "boss_hp": room["boss_data"]["hp"], "user_hp": current_user.hp, "boss_dmg": boss_dmg, "real_heal_amt": heal_val, "hit_type": hit_type}
+        update_user_atomic(db, current_user.id, hp=User.max_hp, money=User.money + 500); db.commit(); GYM_BATTLES.pop(battle_id); push_gyms(db)
+        return {"result": "WIN_SELECT", "reward": "踢館成功！請選擇寶可夢佔領！", "user_hp": current_user.max_hp, "gym_id": gym.id}
+    if user_hp <= 0: update_user_atomic(db, current_user.id, hp=User.max_hp); db.commit(); GYM_BATTLES.pop(battle_id); return {"result": "LOSE", "reward": "挑戰失敗... (HP已回復)", "user_hp": current_user.max_hp, "boss_dmg": boss_dmg}
+    db.commit()
+    return {"result": "NEXT", "boss_hp": room["boss_data"]["hp"], "user_hp": user_hp, "boss_dmg": boss_dmg, "real_heal_amt": heal_val, "hit_type": hit_type}
 
 @router.get("/pokedex/all")
-def get_all_pokedex():
-    result = []
-    for name, data in POKEDEX_DATA.items():
-        is_obtainable = name in OBTAINABLE_MONS
-        result.append({ "name": name, "img": data["img"], "hp": data["hp"], "atk": data["atk"], "is_obtainable": is_obtainable })
-    return result
+async def get_all_pokedex(request: Request):
+    return POKEDEX_PAYLOAD.response(request)
 
 @router.get("/pokedex/collection")
-def get_pokedex_collection(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    unlocked = current_user.unlocked_monsters.split(',') if current_user.unlocked_monsters else []
+def get_pokedex_collection(current_user: User = Depends(current_user_with("collection")), db: Session = Depends(get_db)):
     try:
-        box = json.loads(current_user.pokemon_storage) if current_user.pokemon_storage else []
-        is_updated = False
-        for p in box:
-            if p['name'] not in unlocked: unlocked.append(p['name']); is_updated = True
-        if is_updated: current_user.unlocked_monsters = ",".join(unlocked); db.commit()
+        if unlock_monsters(current_user, BoxService(db).names(current_user.id)): db.commit()
     except: pass 
+    unlocked = current_user.unlocked_monsters.split(',') if current_user.unlocked_monsters else []
     result = []
     for name in COLLECTION_MONS:
         if name in POKEDEX_DATA:
@@ -510,238 +594,324 @@ def get_pokedex_collection(current_user: User = Depends(get_current_user), db: S
             result.append({ "name": name, "img": data["img"], "is_owned": name in unlocked })
     return result
 
+def format_rank_value(board, score):
+    if board == "money": return f"{score} G"
+    if board == "collection": return f"{score}隻"
+    return f"Lv.{score}"
+
 @router.get("/leaderboard")
 def get_leaderboard(type: str = "level", db: Session = Depends(get_db)):
-    if type == "money":
-        users = db.query(User).order_by(desc(User.money)).limit(10).all()
-        return [{"rank": i+1, "username": u.username, "value": f"{u.money} G", "img": u.pokemon_image} for i, u in enumerate(users)]
-    else: 
-        users = db.query(User).order_by(desc(User.level)).limit(10).all()
-        return [{"rank": i+1, "username": u.username, "value": f"Lv.{u.level}", "img": u.pokemon_image} for i, u in enumerate(users)]
+    # 🔥 讀取背景刷新的快照，不必每次都查資料庫
+    board = type if type in LEADERBOARD_COLUMNS else "level"
+    return [{"rank": r["rank"], "username": r["username"], "value": format_rank_value(board, r["score"]), "img": r["img"]} for r in LeaderboardService(db).top(board)]
+
+@router.get("/leaderboard/me")
+def get_my_rank(type: str = "level", current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    my = LeaderboardService(db).rank(current_user, type)
+    return {**my, "value": format_rank_value(my["type"], my["score"])}
+
+LEADERBOARD_REFRESH_SECONDS = 30
+
+def refresh_leaderboards():
+    with Session(engine) as db: LeaderboardService(db).refresh()
+
+async def leaderboard_refresher():
+    while True:
+        try: await run_in_threadpool(refresh_leaderboards)
+        except Exception as e: print(f"❌ 排行榜刷新錯誤: {e}")
+        await asyncio.sleep(LEADERBOARD_REFRESH_SECONDS)
 
 # =================================================================
 # 5. 團體戰與野外 API
 # =================================================================
 
-def update_raid_logic(db: Session = None):
-    now = get_now_tw(); curr_total_mins = now.hour * 60 + now.minute
-    for (h, m) in RAID_SCHEDULE:
-        start_total_mins = h * 60 + m; start_lobby_mins = start_total_mins - 3 
-        if start_lobby_mins < 0: start_lobby_mins += 1440
-        if start_lobby_mins <= curr_total_mins < start_total_mins:
-            if RAID_STATE["status"] != "LOBBY":
-                boss_data = random.choices(RAID_BOSS_POOL, weights=[b['weight'] for b in RAID_BOSS_POOL], k=1)[0]
-                RAID_STATE["active"] = True; RAID_STATE["status"] = "LOBBY"; RAID_STATE["boss"] = boss_data; RAID_STATE["max_hp"] = boss_data["hp"]; RAID_STATE["current_hp"] = boss_data["hp"]; RAID_STATE["players"] = {}; RAID_STATE["last_attack_time"] = get_now_tw()
-            return
-    for (h, m) in RAID_SCHEDULE:
-        start_total_mins = h * 60 + m
-        if 0 <= (curr_total_mins - start_total_mins) < 15:
-            if RAID_STATE["status"] == "LOBBY": RAID_STATE["status"] = "FIGHTING"; RAID_STATE["last_attack_time"] = get_now_tw()
-            elif RAID_STATE["status"] == "IDLE": 
-                boss_data = random.choices(RAID_BOSS_POOL, weights=[b['weight'] for b in RAID_BOSS_POOL], k=1)[0]
-                RAID_STATE["active"] = True; RAID_STATE["status"] = "FIGHTING"; RAID_STATE["boss"] = boss_data; RAID_STATE["max_hp"] = boss_data["hp"]; RAID_STATE["current_hp"] = boss_data["hp"]; RAID_STATE["players"] = {}; RAID_STATE["last_attack_time"] = get_now_tw()
-            if RAID_STATE["status"] == "FIGHTING":
-                last_time = RAID_STATE.get("last_attack_time")
-                if last_time and (get_now_tw() - last_time).total_seconds() >= 7:
-                    if db:
-                        RAID_STATE["last_attack_time"] = get_now_tw(); base_dmg = int(RAID_STATE["boss"]["atk"] * 0.2); boss_dmg = int(base_dmg * random.uniform(0.95, 1.05))
-                        active_uids = [uid for uid, p in RAID_STATE["players"].items() if not p.get("dead_at")]
-                        if active_uids:
-                            users_to_hit = db.query(User).filter(User.id.in_(active_uids)).all()
-                            for u in users_to_hit: 
-                                u.hp = max(0, u.hp - boss_dmg)
-                                if u.hp <= 0:
-                                    RAID_STATE["players"][u.id]["dead_at"] = get_now_tw().isoformat()
-                            db.commit()
-            if RAID_STATE["current_hp"] <= 0: RAID_STATE["status"] = "ENDED"
-            return
-    if RAID_STATE["status"] != "IDLE": RAID_STATE["active"] = False; RAID_STATE["status"] = "IDLE"; RAID_STATE["boss"] = None
+# 🔥 團體戰排程：由 on_startup 啟動的背景任務推進 LOBBY → FIGHTING → ENDED，
+#    API 只讀取 RAID 狀態，不再於每個請求裡計算狀態與 Boss 傷害
+RAID_LOBBY_MINUTES = 3
+RAID_FIGHT_MINUTES = 15
+RAID_TICK_SECONDS = 7
+
+def get_raid_phase(now):
+    # 回傳 (目前階段, 下一個階段切換時間)
+    windows = []
+    for day in (-1, 0, 1):
+        for (h, m) in RAID_SCHEDULE:
+            start = now.replace(hour=h, minute=m, second=0, microsecond=0) + timedelta(days=day)
+            windows.append((start - timedelta(minutes=RAID_LOBBY_MINUTES), start, start + timedelta(minutes=RAID_FIGHT_MINUTES)))
+    for (lobby, start, end) in windows:
+        if lobby <= now < start: return "LOBBY", start
+    for (lobby, start, end) in windows:
+        if start <= now < end: return "FIGHTING", end
+    return "IDLE", min(lobby for (lobby, start, end) in windows if lobby > now)
+
+RAID_LEASE_SECONDS = 90  # 多 worker 時只有持有租約的 worker 推進狀態機
+
+def reset_raid(status):
+    boss_data = random.choices(RAID_BOSS_POOL, weights=[b['weight'] for b in RAID_BOSS_POOL], k=1)[0]
+    return {"active": True, "status": status, "boss": boss_data, "max_hp": boss_data["hp"], "current_hp": boss_data["hp"], "last_attack_time": get_now_tw()}
+
+def raid_boss_tick(db: Session, st):
+    base_dmg = int(st["boss"]["atk"] * 0.2); boss_dmg = int(base_dmg * random.uniform(0.95, 1.05))
+    players = dict(RAID_PLAYERS.items())
+    active_uids = [uid for uid, p in players.items() if not p.get("dead_at")]
+    if not active_uids: return
+    # 🔥 單一條 UPDATE ... RETURNING 扣血，不再把所有參戰玩家載入 ORM (version 也要 +1，讓並行中的請求重試)
+    stmt = (
+        update(User).where(User.id.in_(active_uids))
+        .values(hp=case((User.hp - boss_dmg < 0, 0), else_=User.hp - boss_dmg), version=User.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if db.get_bind().dialect.update_returning:
+        hit = db.execute(stmt.returning(User.id, User.hp)).all()
+    else:
+        db.execute(stmt)
+        hit = db.query(User.id, User.hp).filter(User.id.in_(active_uids)).all()
+    db.commit()
+    dead_at = get_now_tw().isoformat()
+    snapshot = raid_snapshot(st)
+    for uid, hp in hit:
+        p = players[uid]
+        # 只改 dead_at，期間的復活 / 領獎標記不會被舊快照蓋掉
+        if hp <= 0: p = RAID_PLAYERS.update_value(uid, lambda p: {**p, "dead_at": dead_at})
+        manager.push(uid, "raid", {**snapshot, "my_status": p, "user_hp": hp, "is_participant": True})
+
+def step_raid():
+    # 推進一次狀態機，回傳下一次需要醒來的時間
+    now = get_now_tw()
+    phase, next_change = get_raid_phase(now)
+    if not state_store.acquire_lease("raid_scheduler", RAID_LEASE_SECONDS):
+        # 其他 worker 正在負責，稍後再確認租約
+        return now + timedelta(seconds=30)
+    flags = {}
+
+    def advance(st):
+        # 只做純狀態轉換；扣血與推播在交易外進行
+        flags["prev"] = st["status"]
+        if phase == "LOBBY":
+            if st["status"] != "LOBBY": st = reset_raid("LOBBY"); flags["reset"] = True
+        elif phase == "FIGHTING":
+            if st["status"] == "LOBBY": st = {**st, "status": "FIGHTING", "last_attack_time": now}
+            elif st["status"] == "IDLE": st = reset_raid("FIGHTING"); flags["reset"] = True
+            if st["status"] == "FIGHTING":
+                next_tick = st["last_attack_time"] + timedelta(seconds=RAID_TICK_SECONDS)
+                if now >= next_tick:
+                    # 以固定節奏推進，不受請求量影響
+                    st = {**st, "last_attack_time": max(next_tick, now - timedelta(seconds=RAID_TICK_SECONDS))}
+                    flags["tick"] = True
+            if st["current_hp"] <= 0: st = {**st, "status": "ENDED"}
+        elif st["status"] != "IDLE":
+            st = {**st, "active": False, "status": "IDLE", "boss": None}
+        return st
+
+    st = RAID.update_value("state", advance, RAID_IDLE)
+    if flags.get("reset"): RAID_PLAYERS.clear()
+    if flags.get("tick"):
+        with Session(engine) as db: raid_boss_tick(db, st)
+    if st["status"] == "FIGHTING":
+        next_change = min(next_change, st["last_attack_time"] + timedelta(seconds=RAID_TICK_SECONDS))
+    if st["status"] != flags["prev"]: push_raid(st=st)
+    return next_change
+
+async def raid_scheduler():
+    while True:
+        try:
+            next_change = await run_in_threadpool(step_raid)
+            delay = (next_change - get_now_tw()).total_seconds()
+        except Exception as e:
+            print(f"❌ 團體戰排程錯誤: {e}")
+            delay = 1
+        await asyncio.sleep(min(max(delay, 0.05), 60))
+
+# 🔥 背景清理：對戰房間結束 60 秒後移除，並淘汰過期 / 超量的連線狀態
+SESSION_SWEEP_SECONDS = 10
+
+def sweep_sessions():
+    duels.sweep()
+    state_store.sweep()
+
+async def session_sweeper():
+    while True:
+        try: await run_in_threadpool(sweep_sessions)
+        except Exception as e: print(f"❌ 連線狀態清理錯誤: {e}")
+        await asyncio.sleep(SESSION_SWEEP_SECONDS)
 
 @router.get("/raid/status")
-def get_raid_status(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    update_raid_logic(db); my_status = {}; is_participant = False
-    if current_user.id in RAID_STATE["players"]: my_status = RAID_STATE["players"][current_user.id]; is_participant = True
-    boss_img = ""
-    if RAID_STATE["boss"]: boss_img = RAID_STATE["boss"].get("img", "")
-    return { "active": RAID_STATE["active"], "status": RAID_STATE["status"], "boss_name": RAID_STATE["boss"]["name"] if RAID_STATE["boss"] else "", "hp": RAID_STATE["current_hp"], "max_hp": RAID_STATE["max_hp"], "image": boss_img, "my_status": my_status, "user_hp": current_user.hp, "is_participant": is_participant }
+def get_raid_status(current_user: User = Depends(get_current_user)):
+    my_status = RAID_PLAYERS.get(current_user.id)
+    return { **raid_snapshot(), "my_status": my_status or {}, "user_hp": current_user.hp, "is_participant": my_status is not None }
 
 @router.post("/raid/join")
+@retry_on_stale()
 def join_raid(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    update_raid_logic(db)
-    if RAID_STATE["status"] == "LOBBY": return {"message": "戰鬥尚未開始，請稍候..."}
-    if RAID_STATE["status"] != "FIGHTING": raise HTTPException(status_code=400, detail="目前戰鬥尚未開始")
-    if current_user.id in RAID_STATE["players"]: return {"message": "已經加入過了"}
+    st = get_raid_state()
+    if st["status"] == "LOBBY": return {"message": "戰鬥尚未開始，請稍候..."}
+    if st["status"] != "FIGHTING": raise HTTPException(status_code=400, detail="目前戰鬥尚未開始")
+    if current_user.id in RAID_PLAYERS: return {"message": "已經加入過了"}
     if current_user.money < 1000: raise HTTPException(status_code=400, detail="金幣不足 (需 1000 G)")
     current_user.money -= 1000
-    RAID_STATE["players"][current_user.id] = { "name": current_user.username, "dmg": 0, "dead_at": None, "claimed": False }
     db.commit()
+    # 🔥 扣款 commit 成功 (版本沒衝突) 後才登記參戰，重試時不會被誤判為已加入
+    p_data = { "name": current_user.username, "dmg": 0, "dead_at": None, "claimed": False }
+    RAID_PLAYERS[current_user.id] = p_data
+    manager.push(current_user.id, "raid", {**raid_snapshot(st), "my_status": p_data, "is_participant": True})
     return {"message": "成功加入團體戰！"}
 
 # 🔥 修正：團體戰攻擊 API (加入 heal 參數)
 @router.post("/raid/attack")
 def attack_raid_boss(damage: int = Query(0), heal: int = Query(0), current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    update_raid_logic(db)
-    if current_user.id not in RAID_STATE["players"]: raise HTTPException(status_code=400, detail="你不在大廳中")
-    p_data = RAID_STATE["players"][current_user.id]
+    p_data = RAID_PLAYERS.get(current_user.id)
+    if p_data is None: raise HTTPException(status_code=400, detail="你不在大廳中")
     if p_data.get("dead_at"): raise HTTPException(status_code=400, detail="你已死亡，請盡快復活！")
-    if RAID_STATE["status"] != "FIGHTING": return {"message": "戰鬥尚未開始或已結束", "boss_hp": RAID_STATE["current_hp"]}
+    st = get_raid_state()
+    if st["status"] != "FIGHTING": return {"message": "戰鬥尚未開始或已結束", "boss_hp": st["current_hp"]}
     
     try: damage = int(damage)
     except: damage = 0
     if damage < 0: damage = 0
     
     # 力量頭帶判定
-    try: inv = json.loads(current_user.inventory)
-    except: inv = {}
-    active_item = inv.get("active_item", "leftovers")
+    active_item = current_user.active_item or "leftovers"
     final_dmg, hit_type = calculate_muscle_band(damage, active_item)
     
-    RAID_STATE["current_hp"] = max(0, RAID_STATE["current_hp"] - final_dmg)
+    def hit(st):
+        # 多個 worker 同時攻擊時以原子更新扣血
+        if st["status"] != "FIGHTING": return st
+        hp = max(0, st["current_hp"] - final_dmg)
+        return {**st, "current_hp": hp, "status": "ENDED" if hp <= 0 else st["status"]}
+    st = RAID.update_value("state", hit, RAID_IDLE)
+    push_raid(force=st["current_hp"] <= 0, st=st)
     
-    # 🔥 執行補血
+    # 🔥 執行補血：傷害已經計入，補血改用單一條 UPDATE，不會跟王的攻擊 (raid_boss_tick 會 +1 version) 衝突而回 409
     if heal > 0:
-        current_user.hp = min(current_user.max_hp, current_user.hp + heal)
+        db.execute(
+            update(User).where(User.id == current_user.id)
+            .values(hp=case((User.hp + heal > User.max_hp, User.max_hp), else_=User.hp + heal), version=User.version + 1)
+            .execution_options(synchronize_session=False)
+        )
         db.commit()
         
-    return {"message": f"造成 {final_dmg} 點傷害", "boss_hp": RAID_STATE["current_hp"], "hit_type": hit_type}
+    return {"message": f"造成 {final_dmg} 點傷害", "boss_hp": st["current_hp"], "hit_type": hit_type}
 
 @router.post("/raid/recover")
+@retry_on_stale()
 def raid_recover(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     heal_amount = int(current_user.max_hp * 0.2); current_user.hp = min(current_user.max_hp, current_user.hp + heal_amount); db.commit()
     return {"message": f"回復了 {heal_amount} HP", "hp": current_user.hp}
 
 @router.post("/raid/revive")
+@retry_on_stale()
 def revive_raid(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    if current_user.id not in RAID_STATE["players"]: raise HTTPException(status_code=400, detail="你不在大廳中")
+    p_data = RAID_PLAYERS.get(current_user.id)
+    if p_data is None: raise HTTPException(status_code=400, detail="你不在大廳中")
     if current_user.money < 500: raise HTTPException(status_code=400, detail="金幣不足 500G")
-    current_user.money -= 500; RAID_STATE["players"][current_user.id]["dead_at"] = None; current_user.hp = current_user.max_hp; db.commit()
+    current_user.money -= 500; current_user.hp = current_user.max_hp; db.commit()
+    RAID_PLAYERS[current_user.id] = {**p_data, "dead_at": None}
     return {"message": "復活成功！"}
 
 @router.post("/raid/claim")
+@retry_on_stale()
 def claim_raid_reward(choice: int = Query(...), current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    if RAID_STATE["status"] != "ENDED": raise HTTPException(status_code=400, detail="戰鬥尚未結束")
-    if current_user.id not in RAID_STATE["players"]: raise HTTPException(status_code=400, detail="你沒有參與這場戰鬥")
-    p_data = RAID_STATE["players"][current_user.id]
-    if p_data.get("claimed"): return {"message": "已經領過獎勵了"}
-    weights = [20, 40, 40]; options = ["pet", "candy", "money"]; prize = random.choices(options, weights=weights, k=1)[0]; msg = ""
-    try: inv = json.loads(current_user.inventory)
-    except: inv = {}
-    if prize == "candy": inv["legendary_candy"] = inv.get("legendary_candy", 0) + 1; msg = "獲得 🔮 傳說糖果 x1"
-    elif prize == "money": current_user.money += 6000; msg = "獲得 💰 6000 Gold"
-    elif prize == "pet":
-        boss_name = RAID_STATE["boss"]["name"].split(" ")[1]; new_lv = random.randint(1, current_user.level)
-        new_mon = { "uid": str(uuid.uuid4()), "name": boss_name, "iv": int(random.randint(60, 100)), "lv": new_lv, "exp": 0 }
-        try: box = json.loads(current_user.pokemon_storage); box.append(new_mon); current_user.pokemon_storage = json.dumps(box); msg = f"獲得 Boss 寶可夢：{boss_name} (Lv.{new_lv})！"
-        except: msg = "背包滿了，獲得 6000G 代替"; current_user.money += 6000
-    RAID_STATE["players"][current_user.id]["claimed"] = True; current_user.inventory = json.dumps(inv)
-    current_user.exp += 3000; current_user.pet_exp += 3000; current_user.hp = current_user.max_hp; db.commit()
+    st = get_raid_state()
+    if st["status"] != "ENDED": raise HTTPException(status_code=400, detail="戰鬥尚未結束")
+    if current_user.id not in RAID_PLAYERS: raise HTTPException(status_code=400, detail="你沒有參與這場戰鬥")
+    # 先原子地標記已領取，避免同一玩家在不同 worker 重複領獎
+    prev = {}
+    def mark(p): prev.update(p); return {**p, "claimed": True}
+    RAID_PLAYERS.update_value(current_user.id, mark)
+    if prev.get("claimed"): return {"message": "已經領過獎勵了"}
+    try:
+        weights = [20, 40, 40]; options = ["pet", "candy", "money"]; prize = random.choices(options, weights=weights, k=1)[0]; msg = ""
+        if prize == "candy": InventoryService(db).grant(current_user, "legendary_candy", 1); msg = "獲得 🔮 傳說糖果 x1"
+        elif prize == "money": current_user.money += 6000; msg = "獲得 💰 6000 Gold"
+        elif prize == "pet":
+            boss_name = st["boss"]["name"].split(" ")[1]; new_lv = random.randint(1, current_user.level)
+            box = BoxService(db)
+            if box.count(current_user.id) < MAX_BOX_SIZE: box.add(current_user, boss_name, int(random.randint(60, 100)), new_lv); msg = f"獲得 Boss 寶可夢：{boss_name} (Lv.{new_lv})！"
+            else: msg = "背包滿了，獲得 6000G 代替"; current_user.money += 6000
+        current_user.exp += 3000; current_user.pet_exp += 3000; current_user.hp = current_user.max_hp; db.commit()
+    except:
+        # 🔥 commit 失敗 (含版本衝突) 時還原領取標記，重試 / 下次請求才能再領
+        RAID_PLAYERS.update_value(current_user.id, lambda p: {**p, "claimed": prev.get("claimed", False)})
+        raise
     return {"message": msg, "prize": prize}
 
 @router.get("/wild/list")
 def get_wild_list(level: int, current_user: User = Depends(get_current_user)):
     update_user_activity(current_user.id); 
     if level > current_user.level: level = current_user.level
-    target_level = level
-    available_mons = []
-    for unlock_lv, mons in WILD_UNLOCK_LEVELS.items():
-        if unlock_lv <= target_level:
-            available_mons.extend(mons)
-    if not available_mons: available_mons = ["小拉達"]
-    display_mons = available_mons 
-    wild_list = []
-    for name in display_mons:
-        if name not in POKEDEX_DATA: continue
-        base = POKEDEX_DATA[name]
-        wild_hp = apply_iv_stats(base["hp"], 50, target_level, is_hp=True, is_player=False)
-        wild_atk = apply_iv_stats(base["atk"], 50, target_level, is_hp=False, is_player=False)
-        wild_skills = base.get("skills", ["撞擊", "撞擊", "撞擊"])
-        wild_list.append({ "name": name, "raw_name": name, "is_powerful": False, "level": target_level, "hp": wild_hp, "max_hp": wild_hp, "attack": wild_atk, "image_url": base["img"], "skills": wild_skills })
-    return wild_list
+    # 🔥 直接回傳啟動時算好並編碼的名單
+    return Response(content=wild_roster_bytes(level), media_type="application/json")
+
+def settle_wild_win(db: Session, current_user: User, is_powerful: bool, target_name: str, target_level: int) -> str:
+    real_name = target_name.replace("🔥 ", "").replace("強大的 ", "").replace("✨ ", "").strip()
+    target_data = POKEDEX_DATA.get(real_name, POKEDEX_DATA.get("小拉達"))
+    base_sum = target_data["hp"] + target_data["atk"]; xp = int((base_sum / 20) * target_level + 30); money = int(xp * 0.5) 
+    current_user.exp += xp; current_user.pet_exp += xp; current_user.money += money; msg = f"獲得 {xp} XP, {money} G"
+    inv = InventoryService(db)
+    if random.random() < 0.4: inv.grant(current_user, "candy", 1); msg += " & 🍬 獲得神奇糖果!"
+    if is_powerful: inv.grant(current_user, "growth_candy", 1); msg += " & 🍬 成長糖果 x1"
+    # 🔥 任務進度：一條 UPDATE 推進所有符合目標與等級的進行中任務
+    QuestService(db).record_kill(current_user.id, real_name, target_level)
+    old_lv = current_user.level
+    current_user.level, current_user.exp = PLAYER_CURVE.add_exp(current_user.level, current_user.exp, 0)
+    for lv in range(old_lv + 1, current_user.level + 1): msg += f" | 訓練師升級 Lv.{lv}!"
+    old_pet_lv = current_user.pet_level
+    current_user.pet_level, current_user.pet_exp = PLAYER_CURVE.add_exp(current_user.pet_level, current_user.pet_exp, 0)
+    pet_leveled_up = current_user.pet_level > old_pet_lv
+    for lv in range(old_pet_lv + 1, current_user.pet_level + 1): msg += f" | 寶可夢升級 Lv.{lv}!"
+    active_pet = BoxService(db).get(current_user.id, current_user.active_pokemon_uid)
+    if active_pet:
+        active_pet.exp = current_user.pet_exp; active_pet.lv = current_user.pet_level
+        if pet_leveled_up:
+            base = POKEDEX_DATA.get(active_pet.name)
+            if base: current_user.max_hp = apply_iv_stats(base["hp"], active_pet.iv, current_user.pet_level, is_hp=True, is_player=True); current_user.attack = apply_iv_stats(base["atk"], active_pet.iv, current_user.pet_level, is_hp=False, is_player=True); current_user.hp = current_user.max_hp
+    return msg
 
 @router.post("/wild/attack")
-async def wild_attack_api(is_win: bool = Query(...), is_powerful: bool = Query(False), target_name: str = Query("野怪"), target_level: int = Query(1), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    update_user_activity(current_user.id); current_user.hp = current_user.max_hp
+@retry_on_stale()
+async def wild_attack_api(is_win: bool = Query(...), is_powerful: bool = Query(False), target_name: str = Query("野怪"), target_level: int = Query(1), db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
+    await state_store.run(update_user_activity, current_user.id); current_user.hp = current_user.max_hp
     if is_win:
-        real_name = target_name.replace("🔥 ", "").replace("強大的 ", "").replace("✨ ", "").strip()
-        target_data = POKEDEX_DATA.get(real_name, POKEDEX_DATA.get("小拉達"))
-        base_sum = target_data["hp"] + target_data["atk"]; xp = int((base_sum / 20) * target_level + 30); money = int(xp * 0.5) 
-        current_user.exp += xp; current_user.pet_exp += xp; current_user.money += money; msg = f"獲得 {xp} XP, {money} G"
-        inv = json.loads(current_user.inventory)
-        if random.random() < 0.4: inv["candy"] = inv.get("candy", 0) + 1; msg += " & 🍬 獲得神奇糖果!"
-        if is_powerful: inv["growth_candy"] = inv.get("growth_candy", 0) + 1; msg += " & 🍬 成長糖果 x1"
-        current_user.inventory = json.dumps(inv)
-        quests = json.loads(current_user.quests) if current_user.quests else []
-        quest_updated = False
-        for q in quests:
-            if q["type"] in ["BATTLE_WILD", "GOLDEN"] and q["status"] != "COMPLETED":
-                req_lv_match = re.search(r'Lv\.(\d+)', q.get("target_display", ""))
-                req_lv = int(req_lv_match.group(1)) if req_lv_match else 1
-                if q.get("target") in real_name and target_level >= req_lv:
-                    q["now"] += 1
-                    quest_updated = True
-        if quest_updated: current_user.quests = json.dumps(quests)
-        req_xp_p = get_req_xp(current_user.level)
-        while current_user.exp >= req_xp_p and current_user.level < 120: current_user.exp -= req_xp_p; current_user.level += 1; req_xp_p = get_req_xp(current_user.level); msg += f" | 訓練師升級 Lv.{current_user.level}!"
-        req_xp_pet = get_req_xp(current_user.pet_level)
-        pet_leveled_up = False
-        while current_user.pet_exp >= req_xp_pet and current_user.pet_level < 120: current_user.pet_exp -= req_xp_pet; current_user.pet_level += 1; req_xp_pet = get_req_xp(current_user.pet_level); pet_leveled_up = True; msg += f" | 寶可夢升級 Lv.{current_user.pet_level}!"
-        try:
-            box = json.loads(current_user.pokemon_storage); active_pet = next((p for p in box if p['uid'] == current_user.active_pokemon_uid), None)
-            if active_pet:
-                active_pet["exp"] = current_user.pet_exp; active_pet["lv"] = current_user.pet_level
-                if pet_leveled_up:
-                    base = POKEDEX_DATA.get(active_pet["name"])
-                    if base: current_user.max_hp = apply_iv_stats(base["hp"], active_pet["iv"], current_user.pet_level, is_hp=True, is_player=True); current_user.attack = apply_iv_stats(base["atk"], active_pet["iv"], current_user.pet_level, is_hp=False, is_player=True); current_user.hp = current_user.max_hp
-            current_user.pokemon_storage = json.dumps(box)
-        except: pass
-        db.commit()
+        msg = await db.run_sync(settle_wild_win, current_user, is_powerful, target_name, target_level)
+        await db.commit()
         return {"message": f"勝利！HP已回復。{msg}"}
-    db.commit()
+    await db.commit()
     return {"message": "戰鬥結束，HP已回復。"}
 
 @router.post("/gamble")
-async def gamble(amount: int = Query(..., gt=0), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+@retry_on_stale()
+async def gamble(amount: int = Query(..., gt=0), db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
     if current_user.money < amount: raise HTTPException(status_code=400, detail="金幣不足")
     if random.random() < 0.5: current_user.money += amount; msg = f"🎰 贏了！獲得 {amount} Gold！"
     else: current_user.money -= amount; msg = "💸 輸了... 沒關係下次再來！"
-    db.commit()
+    await db.commit()
     return {"message": msg, "money": current_user.money}
 
 @router.post("/heal")
-async def buy_heal(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+@retry_on_stale()
+async def buy_heal(db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user_async)):
     if current_user.money < 50: raise HTTPException(status_code=400, detail="金幣不足")
-    current_user.money -= 50; current_user.hp = current_user.max_hp; db.commit()
+    current_user.money -= 50; current_user.hp = current_user.max_hp; await db.commit()
     return {"message": "體力已補滿"}
 
 @router.post("/social/settings/toggle_pvp")
 def toggle_pvp(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    try:
-        inv = json.loads(current_user.inventory) if current_user.inventory else {}
-    except:
-        inv = {}
-        
-    current_status = inv.get("block_pvp", False)
-    inv["block_pvp"] = not current_status
-    
-    current_user.inventory = json.dumps(inv)
+    current_user.block_pvp = not current_user.block_pvp
     db.commit()
     
-    status_text = "拒絕" if inv["block_pvp"] else "接受"
-    return {"message": f"已切換為：{status_text}對戰邀請", "block_pvp": inv["block_pvp"]}
+    status_text = "拒絕" if current_user.block_pvp else "接受"
+    return {"message": f"已切換為：{status_text}對戰邀請", "block_pvp": current_user.block_pvp}
 
 @router.post("/social/invite/{target_id}")
 def invite_player(target_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     if is_user_busy(target_id): raise HTTPException(status_code=400, detail="對方忙錄中")
     
     target_user = db.query(User).filter(User.id == target_id).first()
-    if target_user:
-        try:
-            target_inv = json.loads(target_user.inventory) if target_user.inventory else {}
-            if target_inv.get("block_pvp", False):
-                raise HTTPException(status_code=400, detail="對方目前不接受對戰邀請")
-        except: pass
+    if target_user and target_user.block_pvp:
+        raise HTTPException(status_code=400, detail="對方目前不接受對戰邀請")
         
     INVITES[target_id] = current_user.id
+    manager.push(target_id, "invite", {"has_invite": True, "source_id": current_user.id, "source_name": current_user.username})
     return {"message": "邀請已發送"}
 
 @router.get("/social/check_invite")
@@ -755,32 +925,30 @@ def check_invite(current_user: User = Depends(get_current_user), db: Session = D
 @router.post("/social/accept_invite/{source_id}")
 def accept_invite(source_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     if INVITES.get(current_user.id) != source_id: raise HTTPException(status_code=400, detail="無效邀請")
-    room_id = str(uuid.uuid4())
-    DUEL_ROOMS[room_id] = {
+    room = {
         "p1": source_id, "p2": current_user.id, "status": "PREPARING",
         "start_time": datetime.utcnow().isoformat(),
         "countdown_end": (datetime.utcnow() + timedelta(seconds=12)).isoformat(),
         "turn": None, "p1_data": None, "p2_data": None, "ended_at": None,
         "p1_atk_mult": 1.0, "p2_atk_mult": 1.0 
     }
+    room_id = duels.create(room)
     del INVITES[current_user.id]
+    push_duel(room)
     return {"message": "接受成功", "room_id": room_id}
 
 @router.post("/social/reject_invite/{source_id}")
 def reject_invite(source_id: int, current_user: User = Depends(get_current_user)):
-    if INVITES.get(current_user.id) == source_id: del INVITES[current_user.id]
+    if INVITES.get(current_user.id) == source_id:
+        del INVITES[current_user.id]
+        manager.push(source_id, "invite_rejected", {"target_id": current_user.id, "target_name": current_user.username})
     return {"message": "已拒絕"}
 
 @router.get("/duel/status")
 def check_duel_status(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     update_user_activity(current_user.id)
     now = datetime.utcnow()
-    keys_to_del = [k for k, r in DUEL_ROOMS.items() if r.get("ended_at") and (now - datetime.fromisoformat(r["ended_at"])).total_seconds() > 60]
-    for k in keys_to_del: del DUEL_ROOMS[k]
-    room = None
-    for r in DUEL_ROOMS.values():
-        if r["p1"] == current_user.id or r["p2"] == current_user.id:
-            room = r; break
+    room_id, room = duels.find(current_user.id)
     if not room: return {"status": "NONE"}
     if room["status"] == "PREPARING":
         end_time = datetime.fromisoformat(room["countdown_end"])
@@ -795,26 +963,28 @@ def check_duel_status(current_user: User = Depends(get_current_user), db: Sessio
                 if p1.attack > p2.attack: first_turn = p1.id
                 elif p2.attack > p1.attack: first_turn = p2.id
                 else: first_turn = random.choice([p1.id, p2.id])
-            room["status"] = "FIGHTING"; room["turn"] = first_turn
-            room["p1_data"] = {"id": p1.id, "name": p1.username, "hp": p1.hp, "max_hp": p1.max_hp, "atk": p1.attack, "img": p1.pokemon_image, "pname": p1.pokemon_name}
-            room["p2_data"] = {"id": p2.id, "name": p2.username, "hp": p2.hp, "max_hp": p2.max_hp, "atk": p2.attack, "img": p2.pokemon_image, "pname": p2.pokemon_name}
-            return {"status": "FIGHTING", "room": room}
+            opened = []
+            def start(room):
+                # 🔥 雙方同時輪詢時只有第一個請求開戰，後到的沿用同一個先攻與雙方數值
+                if room["status"] != "PREPARING": return room
+                opened.append(room_id)
+                room["status"] = "FIGHTING"; room["turn"] = first_turn
+                room["p1_data"] = {"id": p1.id, "name": p1.username, "hp": p1.hp, "max_hp": p1.max_hp, "atk": p1.attack, "img": p1.pokemon_image, "pname": p1.pokemon_name}
+                room["p2_data"] = {"id": p2.id, "name": p2.username, "hp": p2.hp, "max_hp": p2.max_hp, "atk": p2.attack, "img": p2.pokemon_image, "pname": p2.pokemon_name}
+                return room
+            room = duels.update(room_id, start)
+            if room is None: return {"status": "NONE"}
+            if opened: push_duel(room)
+            return duel_view(room, current_user.id)
         else: return {"status": "PREPARING", "remaining": remaining}
     if room["status"] in ["FIGHTING", "ENDED"]:
-        is_p1 = (current_user.id == room["p1"])
-        my_data = room["p1_data"] if is_p1 else room["p2_data"]
-        op_data = room["p2_data"] if is_p1 else room["p1_data"]
-        return {"status": room["status"], "room_id": "xxx", "turn": room["turn"], "my_data": my_data, "opponent_data": op_data, "is_my_turn": (room["turn"] == current_user.id)}
+        return duel_view(room, current_user.id)
     return {"status": "NONE"}
 
 @router.post("/duel/attack")
 def duel_attack(damage: int = Query(0), heal: int = Query(0), debuff: int = Query(0), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    room = None
-    for r in DUEL_ROOMS.values():
-        if (r["p1"] == current_user.id or r["p2"] == current_user.id) and r["status"] == "FIGHTING":
-            room = r; break
-    if not room: raise HTTPException(status_code=404, detail="不在對戰中")
-    if room["turn"] != current_user.id: raise HTTPException(status_code=400, detail="還沒輪到你")
+    room_id, room = duels.find(current_user.id)
+    if not room or room["status"] != "FIGHTING": raise HTTPException(status_code=404, detail="不在對戰中")
     try: damage = int(damage)
     except: damage = 0
     if damage < 0: damage = 0
@@ -823,37 +993,44 @@ def duel_attack(damage: int = Query(0), heal: int = Query(0), debuff: int = Quer
     target_key = "p2_data" if is_p1 else "p1_data"
     target_id = room["p2"] if is_p1 else room["p1"]
     my_key = "p1_data" if is_p1 else "p2_data"
+    mult_key = "p1_atk_mult" if is_p1 else "p2_atk_mult"
     
     # 🔥 PVP 力量頭帶判定
-    try: inv = json.loads(current_user.inventory)
-    except: inv = {}
-    active_item = inv.get("active_item", "leftovers")
-    final_dmg, hit_type = calculate_muscle_band(damage, active_item)
-    
-    my_atk_mult = room.get("p1_atk_mult", 1.0) if is_p1 else room.get("p2_atk_mult", 1.0)
-    final_dmg = int(final_dmg * my_atk_mult)
+    active_item = current_user.active_item or "leftovers"
+    base_dmg, hit_type = calculate_muscle_band(damage, active_item)
     
-    target_user = db.query(User).filter(User.id == target_id).first()
-    room[target_key]["hp"] = max(0, room[target_key]["hp"] - final_dmg)
-    target_user.hp = room[target_key]["hp"]
-    
-    if debuff > 0:
-        if is_p1: room["p1_atk_mult"] = room.get("p1_atk_mult", 1.0) * 0.9 
-        else: room["p2_atk_mult"] = room.get("p2_atk_mult", 1.0) * 0.9 
-
-    if heal > 0:
-        room[my_key]["hp"] = min(room[my_key]["max_hp"], room[my_key]["hp"] + heal)
-        current_user.hp = room[my_key]["hp"]
+    outcome = {}
+    def attack(room):
+        # 🔥 回合檢查與扣血在同一個鎖 / 交易內，連點兩次只有第一次會通過
+        if room["status"] != "FIGHTING": raise HTTPException(status_code=404, detail="不在對戰中")
+        if room["turn"] != current_user.id: raise HTTPException(status_code=400, detail="還沒輪到你")
+        outcome["dmg"] = final_dmg = int(base_dmg * room.get(mult_key, 1.0))
+        room[target_key]["hp"] = max(0, room[target_key]["hp"] - final_dmg)
         
-    if room[target_key]["hp"] <= 0:
-        room["status"] = "ENDED"; room["ended_at"] = datetime.utcnow().isoformat() 
-        current_user.money += 300; current_user.exp += 500
-        current_user.hp = current_user.max_hp; target_user.hp = target_user.max_hp
+        if debuff > 0: room[mult_key] = room.get(mult_key, 1.0) * 0.9 
+        
+        if heal > 0:
+            room[my_key]["hp"] = min(room[my_key]["max_hp"], room[my_key]["hp"] + heal)
+        
+        if room[target_key]["hp"] <= 0:
+            room["status"] = "ENDED"; room["ended_at"] = datetime.utcnow().isoformat() 
+        else: room["turn"] = target_id
+        return room
+    room = duels.update(room_id, attack)
+    if room is None: raise HTTPException(status_code=404, detail="不在對戰中")
+    
+    # 房間已經推進，玩家欄位改用單一條 UPDATE 寫入，不會因版本衝突回 409 (重試會變成重複攻擊)
+    if room["status"] == "ENDED":
+        update_user_atomic(db, current_user.id, money=User.money + 300, exp=User.exp + 500, hp=User.max_hp)
+        update_user_atomic(db, target_id, hp=User.max_hp)
         db.commit()
+        push_duel(room)
         return {"result": "WIN", "reward": "獲得 300G & 500 XP"}
-    room["turn"] = target_id
+    update_user_atomic(db, target_id, hp=room[target_key]["hp"])
+    if heal > 0: update_user_atomic(db, current_user.id, hp=room[my_key]["hp"])
     db.commit()
-    return {"result": "NEXT", "damage": final_dmg, "heal": heal, "hit_type": hit_type}
+    push_duel(room)
+    return {"result": "NEXT", "damage": outcome["dmg"], "heal": heal, "hit_type": hit_type}
 
 @router.get("/social/players")
 def get_online_players(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -861,35 +1038,39 @@ def get_online_players(current_user: User = Depends(get_current_user), db: Sessi
     all_users = db.query(User).all()
     result = []
     now = datetime.utcnow()
+    online = dict(ONLINE_USERS.items())
     for u in all_users:
-        last_seen = ONLINE_USERS.get(u.id)
-        is_online = False
+        last_seen = online.get(u.id)
+        is_online = manager.is_online(u.id)
         if last_seen and (now - last_seen).total_seconds() < 30: is_online = True
         result.append({ "id": u.id, "username": u.username, "pokemon_image": u.pokemon_image, "is_online": is_online })
     return result
 
-@router.post("/social/redeem")
-def redeem_code(code: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    try: inv = json.loads(current_user.inventory) if current_user.inventory else {}
-    except: inv = {}
-    if "redeemed_codes" not in inv: inv["redeemed_codes"] = []
+@router.post("/social/redeem", response_model=UserActionResponse, response_model_exclude_unset=True)
+def redeem_code(code: str, full_user: bool = Query(False), current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    inv = InventoryService(db)
     code = code.strip()
-    if code in inv["redeemed_codes"]: raise HTTPException(status_code=400, detail="此序號已經使用過了！")
+    if inv.has_redeemed(current_user.id, code): raise HTTPException(status_code=400, detail="此序號已經使用過了！")
+    before = UserDelta.snapshot(current_user)
     msg = ""; success = False
     
     if code == "1PF563GFK2":
-        inv["legendary_candy"] = inv.get("legendary_candy", 0) + 10
+        inv.grant(current_user, "legendary_candy", 10)
         msg = "兌換成功！獲得 🔮 傳說糖果 x10"; success = True
     elif code == "TRUW8Q3HD":
-        inv["legendary_candy"] = inv.get("legendary_candy", 0) + 15
+        inv.grant(current_user, "legendary_candy", 15)
         msg = "兌換成功！獲得 🔮 傳說糖果 x15"; success = True
     else: raise HTTPException(status_code=400, detail="無效的序號")
     
     if success:
-        inv["redeemed_codes"].append(code)
-        current_user.inventory = json.dumps(inv)
+        inv.mark_redeemed(current_user, code)
         db.commit()
-        return {"message": msg, "user": current_user}
+        return {"message": msg, "user": user_state(current_user, before, full_user, inventory=True)}
+
+@router.get("/admin/state_stats")
+def get_state_stats():
+    # 各項連線狀態目前的筆數與淘汰次數
+    return state_store.stats()
 
 @router.delete("/admin/delete_user")
 def delete_user_by_name(username: str, db: Session = Depends(get_db)):
@@ -8,9 +8,11 @@ from datetime import datetime
 
 from app.db.session import get_db
 from app.common.deps import get_current_user
+from app.common.retry import retry_on_stale
 from app.models.user import User
 # 🔥 改為引入 Friendship 🔥
 from app.models.friendship import Friendship 
+from app.services.leaderboard_service import LeaderboardService
 
 router = APIRouter()
 
@@ -113,6 +115,7 @@ def accept_friend(req_id: int, current_user: User = Depends(get_current_user), d
     return {"message": "已接受好友！"}
 
 @router.post("/gift/send/{friend_id}")
+@retry_on_stale()
 def send_gift(friend_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     # 確認是否為好友
     friend_rel = db.query(Friendship).filter(
@@ -137,18 +140,17 @@ def send_gift(friend_id: int, current_user: User = Depends(get_current_user), db
 # 排行榜與簽到保持不變，直接沿用
 @router.get("/leaderboard")
 def get_leaderboard(type: str = "level", db: Session = Depends(get_db)):
+    # 🔥 前 10 名改讀 LeaderboardService 的快照 (collection_count / money / level 都有索引)
+    rows = LeaderboardService(db).top(type)
     if type == "money":
-        users = db.query(User).order_by(User.money.desc()).limit(10).all()
-        return [{"rank": i+1, "username": u.username, "img": u.pokemon_image, "value": f"${u.money}"} for i, u in enumerate(users)]
+        return [{"rank": r["rank"], "username": r["username"], "img": r["img"], "value": f"${r['score']}"} for r in rows]
     elif type == "collection":
-        users = db.query(User).all()
-        users = sorted(users, key=lambda u: len(u.unlocked_monsters.split(',')) if u.unlocked_monsters else 0, reverse=True)[:10]
-        return [{"rank": i+1, "username": u.username, "img": u.pokemon_image, "value": f"{len(u.unlocked_monsters.split(',')) if u.unlocked_monsters else 0}隻"} for i, u in enumerate(users)]
+        return [{"rank": r["rank"], "username": r["username"], "img": r["img"], "value": f"{r['score']}隻"} for r in rows]
     else: # level
-        users = db.query(User).order_by(User.level.desc()).limit(10).all()
-        return [{"rank": i+1, "username": u.username, "img": u.pokemon_image, "value": f"Lv.{u.level}"} for i, u in enumerate(users)]
+        return [{"rank": r["rank"], "username": r["username"], "img": r["img"], "value": f"Lv.{r['score']}"} for r in rows]
     
 @router.get("/daily_checkin")
+@retry_on_stale()
 def daily_checkin(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     current_user.money += 500
     db.commit()
@@ -163,6 +165,7 @@ def send_chat(content: str = Query(...), current_user: User = Depends(get_curren
     return {"message": "Chat disabled"}
 
 @router.get("/redeem")
+@retry_on_stale()
 def redeem_code(code: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     if code == "VIP666":
         current_user.money += 10000
@@ -0,0 +1,54 @@
+# app/routers/ws.py
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, status
+
+from app.db.session import AsyncSessionLocal
+from app.common.deps import get_user_from_token_async
+from app.common.websocket import manager
+from app.common.duel_registry import duels
+from app.common.state_store import state_store
+from app.models.user import User
+from app.routers import shop
+
+router = APIRouter()
+
+# =================================================================
+# 🔥 即時推播通道：對戰回合、邀請、團體戰血量、道館變動
+# 瀏覽器的 WebSocket 無法帶 Authorization header，token 改由 query string 傳入
+# =================================================================
+@router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, token: str = Query("")):
+    async with AsyncSessionLocal() as db:
+        user = await get_user_from_token_async(token, db)
+        user_id = user.id if user else None
+        # 共享狀態用 state_store.run 存取 (SQLite 實作會移到 threadpool，不卡住事件迴圈)
+        source_id = await state_store.run(shop.INVITES.get, user_id)
+        source = await db.get(User, source_id) if source_id else None
+        source_name = source.username if source else ""
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await manager.connect(user_id, websocket)
+    await state_store.run(shop.update_user_activity, user_id)
+    manager.push_all("presence", {"user_id": user_id, "online": True})
+
+    # 連線 (或重連) 時先補送目前狀態
+    manager.push(user_id, "raid", await state_store.run(shop.raid_snapshot))
+    if source_id:
+        manager.push(user_id, "invite", {"has_invite": True, "source_id": source_id, "source_name": source_name})
+    _, room = await state_store.run(duels.find, user_id)
+    if room and room["status"] != "ENDED": manager.push(user_id, "duel", shop.duel_view(room, user_id))
+
+    try:
+        while True:
+            # 前端只會送心跳，內容不需要處理
+            await websocket.receive_text()
+            await state_store.run(shop.update_user_activity, user_id)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(user_id, websocket)
+        if not manager.is_online(user_id):
+            manager.push_all("presence", {"user_id": user_id, "online": False})
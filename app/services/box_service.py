@@ -0,0 +1,79 @@
+# app/services/box_service.py
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, undefer_group
+from datetime import datetime, timedelta
+import json
+import threading
+import uuid
+
+from app.models.user import User
+from app.models.pokemon import OwnedPokemon
+
+MAX_BOX_SIZE = 35
+
+# 盒子依 obtained_at 排序：十連抽同一微秒寫入的多筆要嚴格遞增，順序才會固定
+_clock_lock = threading.Lock()
+_last_obtained_at = datetime.min
+
+def next_obtained_at() -> datetime:
+    global _last_obtained_at
+    with _clock_lock:
+        _last_obtained_at = max(datetime.utcnow(), _last_obtained_at + timedelta(microseconds=1))
+        return _last_obtained_at
+
+# 時間相同 (例如多個 worker 同時寫入) 時再以 uid 排序
+BOX_ORDER = (OwnedPokemon.obtained_at, OwnedPokemon.uid)
+
+class BoxService:
+    """寶可夢盒子的存取層：每次只讀寫單筆 owned_pokemon，不再整包改寫 JSON。"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get(self, user_id: int, uid: str):
+        return self.db.query(OwnedPokemon).filter(OwnedPokemon.uid == uid, OwnedPokemon.user_id == user_id).first()
+
+    def get_many(self, user_id: int, uids) -> dict:
+        # 一次查出多隻，回傳 uid -> OwnedPokemon
+        rows = self.db.query(OwnedPokemon).filter(OwnedPokemon.user_id == user_id, OwnedPokemon.uid.in_(set(uids))).all()
+        return {mon.uid: mon for mon in rows}
+
+    def get_box(self, user_id: int):
+        return self.db.query(OwnedPokemon).filter(OwnedPokemon.user_id == user_id).order_by(*BOX_ORDER).all()
+
+    def count(self, user_id: int) -> int:
+        return self.db.query(func.count(OwnedPokemon.uid)).filter(OwnedPokemon.user_id == user_id).scalar() or 0
+
+    def names(self, user_id: int):
+        return [row[0] for row in self.db.query(OwnedPokemon.name).filter(OwnedPokemon.user_id == user_id).distinct()]
+
+    def add(self, user: User, name: str, iv: int, lv: int, exp: int = 0, item: str = "leftovers"):
+        mon = OwnedPokemon(uid=str(uuid.uuid4()), user_id=user.id, name=name, iv=iv, lv=lv, exp=exp, item=item, obtained_at=next_obtained_at())
+        self.db.add(mon)
+        # 讓 user.pokemons 下次存取時重新讀取
+        self.db.expire(user, ["pokemons"])
+        return mon
+
+    def remove(self, user: User, mon: OwnedPokemon):
+        self.db.delete(mon)
+        self.db.expire(user, ["pokemons"])
+
+def migrate_legacy_boxes(db: Session):
+    # 🔥 將舊版 pokemon_storage JSON 搬進 owned_pokemon (只處理尚未搬移的玩家)
+    users = db.query(User).options(undefer_group("legacy")).filter(User.legacy_pokemon_storage.isnot(None), User.legacy_pokemon_storage != "", User.legacy_pokemon_storage != "[]").all()
+    moved = 0
+    for u in users:
+        try: box = json.loads(u.legacy_pokemon_storage)
+        except: box = []
+        base_time = datetime.utcnow()
+        for i, p in enumerate(box):
+            if not p.get("uid") or db.get(OwnedPokemon, p["uid"]): continue
+            db.add(OwnedPokemon(
+                uid=p["uid"], user_id=u.id, name=p.get("name", "小拉達"), iv=p.get("iv", 50), lv=p.get("lv", 1),
+                exp=p.get("exp", 0), item=p.get("item", "leftovers"), obtained_at=base_time + timedelta(microseconds=i)
+            ))
+        u.legacy_pokemon_storage = "[]"
+        moved += 1
+    db.commit()
+    if moved: print(f"✅ 已搬移 {moved} 位玩家的寶可夢盒子")
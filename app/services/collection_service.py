@@ -0,0 +1,23 @@
+# app/services/collection_service.py
+
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+
+def unlock_monsters(user: User, names) -> bool:
+    # 🔥 圖鑑解鎖一律走這裡，unlocked_monsters 與 collection_count 同步更新
+    unlocked = user.unlocked_monsters.split(',') if user.unlocked_monsters else []
+    new_names = [n for n in dict.fromkeys(names) if n not in unlocked]
+    if not new_names: return False
+    unlocked.extend(new_names)
+    user.unlocked_monsters = ",".join(unlocked)
+    user.collection_count = len(unlocked)
+    return True
+
+def migrate_collection_counts(db: Session):
+    # 舊資料補上 collection_count (只處理尚未計算過的玩家)
+    rows = db.query(User.id, User.unlocked_monsters, User.version).filter(User.collection_count == 0, User.unlocked_monsters.isnot(None), User.unlocked_monsters != "").all()
+    if not rows: return
+    db.bulk_update_mappings(User, [{"id": uid, "version": version, "collection_count": len(unlocked.split(','))} for uid, unlocked, version in rows])
+    db.commit()
+    print(f"✅ 已計算 {len(rows)} 位玩家的圖鑑數量")
@@ -0,0 +1,79 @@
+# app/services/inventory_service.py
+
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, undefer_group
+import json
+
+from app.models.user import User
+from app.models.inventory import InventoryItem, RedeemedCode
+
+# 舊版 inventory JSON 內不屬於道具數量的旗標
+INVENTORY_FLAGS = ("active_item", "block_pvp", "redeemed_codes")
+
+class InventoryService:
+    """背包道具的存取層：增減數量都是單一條 SQL，不做讀取-修改-寫回。"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get(self, user_id: int, item_key: str) -> int:
+        count = self.db.query(InventoryItem.count).filter(InventoryItem.user_id == user_id, InventoryItem.item_key == item_key).scalar()
+        return count or 0
+
+    def grant(self, user: User, item_key: str, n: int = 1):
+        if n <= 0: return
+        values = {"user_id": user.id, "item_key": item_key, "count": n}
+        dialect = self.db.get_bind().dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+            stmt = insert(InventoryItem).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[InventoryItem.user_id, InventoryItem.item_key],
+                set_={"count": InventoryItem.count + stmt.excluded.count}
+            )
+            self.db.execute(stmt)
+        elif not self._add(user.id, item_key, n):
+            self.db.add(InventoryItem(**values)); self.db.flush()
+        self.db.expire(user, ["inventory_items"])
+
+    def spend(self, user: User, item_key: str, n: int = 1) -> bool:
+        # 數量不足時不會扣除，回傳 False 由呼叫端決定錯誤訊息
+        if n <= 0: return True
+        ok = self._add(user.id, item_key, -n)
+        self.db.expire(user, ["inventory_items"])
+        return ok
+
+    def _add(self, user_id: int, item_key: str, n: int) -> bool:
+        # UPDATE ... SET count = count + :n WHERE count + :n >= 0
+        result = self.db.execute(
+            update(InventoryItem)
+            .where(InventoryItem.user_id == user_id, InventoryItem.item_key == item_key, InventoryItem.count + n >= 0)
+            .values(count=InventoryItem.count + n)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    def has_redeemed(self, user_id: int, code: str) -> bool:
+        return self.db.query(RedeemedCode.id).filter(RedeemedCode.user_id == user_id, RedeemedCode.code == code).first() is not None
+
+    def mark_redeemed(self, user: User, code: str):
+        self.db.add(RedeemedCode(user_id=user.id, code=code))
+        self.db.expire(user, ["redeemed"])
+
+def migrate_legacy_inventory(db: Session):
+    # 🔥 將舊版 inventory JSON 搬進 inventory_items / redeemed_codes / User 欄位
+    users = db.query(User).options(undefer_group("legacy")).filter(User.legacy_inventory.isnot(None), User.legacy_inventory != "", User.legacy_inventory != "{}").all()
+    for u in users:
+        try: inv = json.loads(u.legacy_inventory)
+        except: inv = {}
+        for key, count in inv.items():
+            if key in INVENTORY_FLAGS or not isinstance(count, int): continue
+            db.add(InventoryItem(user_id=u.id, item_key=key, count=count))
+        u.active_item = inv.get("active_item", "leftovers")
+        u.block_pvp = bool(inv.get("block_pvp", False))
+        for code in set(inv.get("redeemed_codes", [])):
+            db.add(RedeemedCode(user_id=u.id, code=code))
+        u.legacy_inventory = "{}"
+    db.commit()
+    if users: print(f"✅ 已搬移 {len(users)} 位玩家的背包")
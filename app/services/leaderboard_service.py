@@ -0,0 +1,46 @@
+# app/services/leaderboard_service.py
+
+import time
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+
+# 排行榜種類 → 排序欄位 (三個欄位都有索引)
+LEADERBOARD_COLUMNS = {"level": User.level, "money": User.money, "collection": User.collection_count}
+LEADERBOARD_SIZE = 10
+
+# 🔥 前 N 名快照：由背景排程定期刷新，API 直接讀記憶體
+#    type -> {"rows": [...], "refreshed_at": time.time()}
+SNAPSHOTS = {}
+
+class LeaderboardService:
+    """排行榜查詢：前 N 名走快照，個人排名用索引上的 COUNT 計算。"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def column(board: str):
+        return LEADERBOARD_COLUMNS.get(board, User.level)
+
+    def query_top(self, board: str, n: int = LEADERBOARD_SIZE):
+        col = self.column(board)
+        rows = self.db.query(User.id, User.username, User.pokemon_image, col).order_by(col.desc(), User.id).limit(n).all()
+        return [{"rank": i+1, "user_id": uid, "username": name, "img": img, "score": score} for i, (uid, name, img, score) in enumerate(rows)]
+
+    def refresh(self):
+        for board in LEADERBOARD_COLUMNS:
+            SNAPSHOTS[board] = {"rows": self.query_top(board), "refreshed_at": time.time()}
+
+    def top(self, board: str):
+        if board not in LEADERBOARD_COLUMNS: board = "level"
+        if board not in SNAPSHOTS: self.refresh()
+        return SNAPSHOTS[board]["rows"]
+
+    def rank(self, user: User, board: str) -> dict:
+        # 名次 = 分數比我高的人數 + 1 (同分同名次)
+        col = self.column(board)
+        score = getattr(user, col.key) or 0
+        higher = self.db.query(func.count(User.id)).filter(col > score).scalar()
+        return {"type": board if board in LEADERBOARD_COLUMNS else "level", "rank": higher + 1, "score": score}
@@ -0,0 +1,70 @@
+# app/services/quest_service.py
+
+from sqlalchemy import update, case
+from sqlalchemy.orm import Session, undefer_group
+from datetime import datetime, timedelta
+import json
+import re
+
+from app.models.user import User
+from app.models.quest import Quest
+
+# 擊敗野怪會推進的任務類型
+KILL_QUEST_TYPES = ("BATTLE_WILD", "GOLDEN")
+
+class QuestService:
+    """任務的存取層：擊敗野怪時的進度是一條 UPDATE，不再解析整包 JSON 與顯示文字。"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def list(self, user_id: int):
+        return self.db.query(Quest).filter(Quest.user_id == user_id).order_by(Quest.created_at).all()
+
+    def get(self, user_id: int, quest_id: str):
+        return self.db.query(Quest).filter(Quest.id == quest_id, Quest.user_id == user_id).first()
+
+    def add(self, user: User, q: dict):
+        quest = Quest(user_id=user.id, created_at=datetime.utcnow(), **q)
+        self.db.add(quest)
+        self.db.expire(user, ["quest_rows"])
+        return quest
+
+    def remove(self, user: User, quest: Quest):
+        self.db.delete(quest)
+        self.db.expire(user, ["quest_rows"])
+
+    def record_kill(self, user_id: int, target: str, level: int) -> list:
+        # UPDATE quests SET now = now + 1 WHERE user_id=? AND target=? AND target_lv<=? AND status='ACTIVE'
+        # 達到需求數量時同一條 SQL 直接標成 COMPLETED；回傳被推進任務的新狀態
+        stmt = (
+            update(Quest)
+            .where(Quest.user_id == user_id, Quest.target == target, Quest.target_lv <= level,
+                   Quest.status == "ACTIVE", Quest.type.in_(KILL_QUEST_TYPES))
+            .values(now=Quest.now + 1, status=case((Quest.now + 1 >= Quest.req, "COMPLETED"), else_=Quest.status))
+            .execution_options(synchronize_session=False)
+        )
+        if self.db.get_bind().dialect.update_returning:
+            return list(self.db.execute(stmt.returning(Quest.status)).scalars())
+        return ["ACTIVE"] * self.db.execute(stmt).rowcount
+
+def migrate_legacy_quests(db: Session):
+    # 🔥 將舊版 quests JSON 搬進 quests 表格 (等級條件只在這裡從顯示文字解析一次)
+    users = db.query(User).options(undefer_group("legacy")).filter(User.legacy_quests.isnot(None), User.legacy_quests != "", User.legacy_quests != "[]").all()
+    for u in users:
+        try: quests = json.loads(u.legacy_quests)
+        except: quests = []
+        base_time = datetime.utcnow()
+        for i, q in enumerate(quests):
+            if not q.get("id") or db.get(Quest, q["id"]): continue
+            lv_match = re.search(r'Lv\.(\d+)', q.get("target_display", ""))
+            target_lv = q.get("target_lv") or (int(lv_match.group(1)) if lv_match else 1)
+            now = q.get("now", 0); req = q.get("req", 1)
+            db.add(Quest(
+                id=q["id"], user_id=u.id, type=q.get("type", "BATTLE_WILD"), target=q.get("target", "小拉達"), target_lv=target_lv,
+                target_display=q.get("target_display", ""), now=now, req=req, xp=q.get("xp", 0), gold=q.get("gold", 0),
+                status="COMPLETED" if now >= req else "ACTIVE", created_at=base_time + timedelta(microseconds=i)
+            ))
+        u.legacy_quests = "[]"
+    db.commit()
+    if users: print(f"✅ 已搬移 {len(users)} 位玩家的任務")
@@ -0,0 +1,58 @@
+# bench/_env.py
+"""
+效能測試共用設定：在 import app 之前呼叫 use_temp_sqlite()，
+讓每支腳本都跑在 /tmp 底下的全新 SQLite 檔案，不會碰到開發用的 sql_app.db。
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+def db_path(name: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f"bench_{name}.db")
+
+def fresh_db(name: str) -> str:
+    path = db_path(name)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix): os.remove(path + suffix)
+    return path
+
+def use_temp_sqlite(name: str) -> str:
+    path = fresh_db(name)
+    os.environ["DATABASE_URL"] = "sqlite:///" + path
+    if str(ROOT) not in sys.path: sys.path.insert(0, str(ROOT))
+    return path
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(0, int(len(values) * p) - 1)]
+
+@contextmanager
+def uvicorn_server(name: str, port: int, **env):
+    """在子程序啟動 uvicorn (全新的 SQLite 檔)，等到能回應後 yield base url；結束時關閉。"""
+    path = fresh_db(name)
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + path, **env)
+    log = open(os.path.join(tempfile.gettempdir(), f"bench_{name}.log"), "w")
+    srv = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(150):
+            try:
+                urllib.request.urlopen(base + "/", timeout=1); break
+            except OSError:
+                if srv.poll() is not None: raise RuntimeError(f"uvicorn 啟動失敗，請看 {log.name}")
+                time.sleep(0.2)
+        yield base
+    finally:
+        srv.terminate(); srv.wait(); log.close()
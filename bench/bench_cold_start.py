@@ -0,0 +1,97 @@
+# bench/bench_cold_start.py
+"""
+冷啟動：在已有 N 名玩家的 SQLite 上，量測 import app.main、startup、到第一個 /gym/list 回應的時間 (各跑 7 次取中位數)。
+用法：
+  python bench/bench_cold_start.py [N=5000]      整個程序的冷啟動 (每次都是新的子程序)
+  python bench/bench_cold_start.py --db-only [N] 只比較啟動時的資料庫工作：
+                                                 舊版每次 create_all + 補欄位 + 搬移 vs prepare_database (版本沒變)
+"""
+
+import contextlib
+import io
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+
+from _env import ROOT, db_path, fresh_db
+
+NAME = "cold_start"
+RUNS = 7
+
+CHILD = r'''
+import sys, time, warnings; warnings.filterwarnings("ignore")
+sys.path.insert(0, sys.argv[1])
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as c:
+    t2 = time.perf_counter()
+    r = c.get("/api/v1/shop/gym/list"); t3 = time.perf_counter()
+print("RESULT", t1 - t0, t2 - t1, t3 - t0, len(r.json()))
+'''
+
+def seed_players(n):
+    # 已經搬移過的舊資料 (legacy 欄位是空的)，模擬正式環境的重開機
+    conn = sqlite3.connect(db_path(NAME))
+    conn.executemany(
+        "INSERT INTO users_v11 (username, hashed_password, level, exp, money, pokemon_name, pet_level, pet_exp, hp, max_hp, attack, active_pokemon_uid, pokemon_storage, inventory, unlocked_monsters, collection_count, quests, version) "
+        "VALUES (?, 'x', 5, 0, 300, '小火龍', 5, 0, 100, 100, 10, '', '[]', '{}', '小火龍,皮卡丘', 2, '[]', 1)",
+        [(f"p{i}",) for i in range(n)]
+    )
+    conn.commit(); conn.close()
+
+def boot():
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + db_path(NAME))
+    out = subprocess.run([sys.executable, "-c", CHILD, str(ROOT)], env=env, capture_output=True, text=True, cwd=os.path.dirname(db_path(NAME)))
+    line = [l for l in out.stdout.splitlines() if l.startswith("RESULT")]
+    assert line, out.stdout + out.stderr
+    *times, gyms = line[0].split()[1:]
+    return [float(t) * 1000 for t in times], int(gyms)
+
+def cold_start(n):
+    fresh_db(NAME)
+    boot()  # 第一次啟動建表
+    seed_players(n)
+    runs = [boot() for _ in range(RUNS)]
+    print(f"{n} players, median of {RUNS} runs")
+    for i, label in enumerate(["import app.main", "startup", "import -> first /gym/list"]):
+        xs = [times[i] for times, _ in runs]
+        print(f"{label:<26} median {statistics.median(xs):6.0f} ms   min {min(xs):6.0f} ms")
+    print("gyms returned:", [gyms for _, gyms in runs])
+
+def db_only(n):
+    os.environ["DATABASE_URL"] = "sqlite:///" + fresh_db(NAME)
+    sys.path.insert(0, str(ROOT)); warnings.filterwarnings("ignore")
+    from app.db.session import engine, SessionLocal
+    from app.db.base_class import Base
+    from app.db import schema
+
+    def old_boot():
+        Base.metadata.create_all(bind=engine); schema.add_missing_columns(engine)
+        with SessionLocal() as db:
+            for migrate in (schema.migrate_legacy_boxes, schema.migrate_legacy_inventory, schema.migrate_collection_counts, schema.migrate_legacy_quests): migrate(db)
+
+    def new_boot():
+        schema.prepare_database(engine)
+
+    with contextlib.redirect_stdout(io.StringIO()): schema.prepare_database(engine)
+    seed_players(n)
+    print(f"{n} players, median of 15 runs")
+    for label, fn in (("old: create_all + add_missing_columns + migrations", old_boot), ("new: prepare_database, version unchanged", new_boot)):
+        xs = []
+        for _ in range(15):
+            engine.dispose(); t = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()): fn()
+            xs.append((time.perf_counter() - t) * 1000)
+        print(f"{label:<52} median {statistics.median(xs):5.1f} ms   min {min(xs):5.1f} ms")
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--db-only"]
+    n = int(args[0]) if args else 5000
+    if "--db-only" in sys.argv: db_only(n)
+    else: cold_start(n)
@@ -0,0 +1,50 @@
+# bench/bench_collection_rank.py
+"""
+圖鑑收集排行榜：載入全部玩家後在 Python 排序 (舊版) 與 collection_count 索引上的前 10 名查詢比較。
+用法：python bench/bench_collection_rank.py [玩家數]   (預設 100000)
+"""
+
+import random
+import sys
+import time
+import warnings
+
+from _env import use_temp_sqlite
+use_temp_sqlite("collection_rank")
+warnings.filterwarnings("ignore")
+
+from sqlalchemy.orm import undefer_group
+
+from app.db.session import engine, SessionLocal
+from app.db.base_class import Base
+from app.models.user import User
+from app.services.leaderboard_service import LeaderboardService
+
+def old_top10(db):
+    # 改版前 social.py 的寫法
+    users = db.query(User).options(undefer_group("collection")).all()
+    users = sorted(users, key=lambda u: len(u.unlocked_monsters.split(',')) if u.unlocked_monsters else 0, reverse=True)[:10]
+    return [len(u.unlocked_monsters.split(',')) for u in users]
+
+def new_top10(db):
+    return [r["score"] for r in LeaderboardService(db).query_top("collection")]
+
+def main(n):
+    rng = random.Random(0)
+    Base.metadata.create_all(bind=engine)
+    names = [f"mon{i}" for i in range(150)]
+    rows = []
+    for i in range(n):
+        k = rng.randint(1, 150)
+        rows.append({"username": f"u{i}", "hashed_password": "x", "unlocked_monsters": ",".join(rng.sample(names, k)), "collection_count": k, "pokemon_image": ""})
+    with engine.begin() as conn: conn.execute(User.__table__.insert(), rows)
+    print(f"{n} players")
+    for label, fn, reps in (("old: full scan + sort", old_top10, 3), ("new: indexed top-10", new_top10, 200)):
+        with SessionLocal() as db:
+            top = fn(db)
+            t = time.perf_counter()
+            for _ in range(reps): fn(db); db.expunge_all()
+            print(f"{label:<24} {(time.perf_counter() - t) / reps * 1000:9.2f} ms   top={top[0]}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
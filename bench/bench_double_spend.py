@@ -0,0 +1,75 @@
+# bench/bench_double_spend.py
+"""
+同一玩家並行花錢：N 個 /quests/abandon (每次 1000 G) 同時送出，餘額只夠 K 次。
+沒有樂觀鎖時會超扣 / 少扣；有 User.version 時應該剛好成功 K 次、扣 K*1000 G。
+另外量測 N 個不同玩家各送一次 (沒有衝突) 的吞吐量作為對照。
+用法：python bench/bench_double_spend.py [N=20] [K=5] [ROUNDS=10] [port=8767]   (需要 httpx)
+"""
+
+import asyncio
+import sqlite3
+import sys
+import time
+import uuid
+
+import httpx
+
+from _env import uvicorn_server, db_path
+
+NAME = "double_spend"
+QUEST_COLUMNS = "id, user_id, type, target, target_lv, target_display, now, req, xp, gold, status"
+
+def sql(query, *args):
+    conn = sqlite3.connect(db_path(NAME), timeout=30)
+    try:
+        rows = conn.execute(query, args).fetchall(); conn.commit(); return rows
+    finally:
+        conn.close()
+
+def add_quests(owners):
+    # 直接寫入可放棄的任務，每個 owner 一筆，回傳任務 id
+    ids = [uuid.uuid4().hex for _ in owners]
+    for qid, uid in zip(ids, owners):
+        sql(f"INSERT INTO quests ({QUEST_COLUMNS}) VALUES (?, ?, 'BATTLE_WILD', 'x', 1, 'x', 0, 5, 1, 1, 'ACTIVE')", qid, uid)
+    return ids
+
+async def run(base, n, k, rounds):
+    async with httpx.AsyncClient(base_url=base, timeout=600, limits=httpx.Limits(max_connections=200)) as c:
+        headers = {}
+        for i in range(n):
+            await c.post("/api/v1/auth/register", json={"username": f"u{i}", "password": "p", "starter_id": 1})
+            token = (await c.post("/api/v1/auth/token", data={"username": f"u{i}", "password": "p"})).json()["access_token"]
+            headers[sql("SELECT id FROM users_v11 WHERE username = ?", f"u{i}")[0][0]] = {"Authorization": "Bearer " + token}
+        uid = min(headers)
+
+        bad_rounds = 0; codes = {}; elapsed = 0
+        for r in range(rounds):
+            sql("UPDATE users_v11 SET money = ? WHERE id = ?", k * 1000, uid)
+            qids = add_quests([uid] * n)
+            t = time.perf_counter()
+            resps = await asyncio.gather(*[c.post(f"/api/v1/quests/abandon/{q}", headers=headers[uid]) for q in qids])
+            elapsed += time.perf_counter() - t
+            ok = sum(x.status_code == 200 for x in resps)
+            for x in resps: codes[x.status_code] = codes.get(x.status_code, 0) + 1
+            charged = k * 1000 - sql("SELECT money FROM users_v11 WHERE id = ?", uid)[0][0]
+            if ok > k or charged != ok * 1000: bad_rounds += 1
+            print(f"round {r}: ok={ok} (allowed {k}) charged={charged}")
+            sql("DELETE FROM quests WHERE user_id = ?", uid)
+        print(f"contended:   {n * rounds / elapsed:.0f} req/s, rounds over-granted or mischarged {bad_rounds}/{rounds}, status codes {codes}")
+
+        sql("UPDATE users_v11 SET money = 1000000")
+        elapsed = 0; ok = 0
+        for _ in range(rounds):
+            qids = add_quests(list(headers))
+            t = time.perf_counter()
+            resps = await asyncio.gather(*[c.post(f"/api/v1/quests/abandon/{q}", headers=headers[u]) for q, u in zip(qids, headers)])
+            elapsed += time.perf_counter() - t; ok += sum(x.status_code == 200 for x in resps)
+        print(f"uncontended: {n * rounds / elapsed:.0f} req/s, ok {ok}/{n * rounds}")
+
+def main(n, k, rounds, port):
+    with uvicorn_server(NAME, port) as base:
+        asyncio.run(run(base, n, k, rounds))
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [20, 5, 10, 8767][len(args):]))
@@ -0,0 +1,45 @@
+# bench/bench_login_burst.py
+"""
+登入尖峰：N 個同時的 bcrypt 登入進行中，量測 GET /auth/me 的延遲 (看事件迴圈有沒有被卡住)。
+用法：python bench/bench_login_burst.py [N=200] [port=8765]   (需要 httpx；PASSWORD_HASH_WORKERS 等環境變數會傳給伺服器)
+"""
+
+import asyncio
+import sys
+import time
+
+import httpx
+
+from _env import uvicorn_server, percentile
+
+async def run(base, n):
+    async with httpx.AsyncClient(base_url=base, timeout=600) as c, httpx.AsyncClient(base_url=base, timeout=600) as probe_client:
+        await c.post("/api/v1/auth/register", json={"username": "u", "password": "p", "starter_id": 1})
+        token = (await c.post("/api/v1/auth/token", data={"username": "u", "password": "p"})).json()["access_token"]
+        headers = {"Authorization": "Bearer " + token}
+
+        async def probe(count, out):
+            for _ in range(count):
+                t = time.perf_counter(); r = await probe_client.get("/api/v1/auth/me", headers=headers)
+                out.append((time.perf_counter() - t) * 1000); assert r.status_code == 200
+                await asyncio.sleep(0.02)
+
+        async def login():
+            return (await c.post("/api/v1/auth/token", data={"username": "u", "password": "p"})).status_code
+
+        idle = []; await probe(50, idle)
+        busy = []
+        t0 = time.perf_counter()
+        results = await asyncio.gather(probe(40, busy), *[login() for _ in range(n)])
+        elapsed = time.perf_counter() - t0
+        codes = {code: results[1:].count(code) for code in set(results[1:])}
+        print(f"idle   /auth/me p50 {percentile(idle, .5):7.1f} ms  p99 {percentile(idle, .99):7.1f} ms")
+        print(f"burst  /auth/me p50 {percentile(busy, .5):7.1f} ms  p99 {percentile(busy, .99):7.1f} ms  max {max(busy):7.1f} ms")
+        print(f"{n} logins in {elapsed:.1f}s, status codes {codes}")
+
+def main(n, port):
+    with uvicorn_server("login_burst", port) as base:
+        asyncio.run(run(base, n))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200, int(sys.argv[2]) if len(sys.argv) > 2 else 8765)
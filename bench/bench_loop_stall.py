@@ -0,0 +1,60 @@
+# bench/bench_loop_stall.py
+"""
+事件迴圈卡頓：20 個玩家狂打 wild attack / heal / gamble / buy 時，量測不碰資料庫的 async API 延遲。
+用法：python bench/bench_loop_stall.py [總請求數=400] [port=8766]   (需要 httpx)
+"""
+
+import asyncio
+import sys
+import time
+from urllib.parse import quote
+
+import httpx
+
+from _env import uvicorn_server, percentile
+
+PLAYERS = 20
+HOT_ENDPOINTS = [
+    "/api/v1/shop/wild/attack?is_win=true&target_name=" + quote("小拉達") + "&target_level=1",
+    "/api/v1/shop/heal",
+    "/api/v1/shop/gamble?amount=1",
+    "/api/v1/shop/buy/candy?count=1",
+]
+
+async def run(base, total):
+    async with httpx.AsyncClient(base_url=base, timeout=600, limits=httpx.Limits(max_connections=200)) as c, httpx.AsyncClient(base_url=base, timeout=600) as probe_client:
+        headers = []
+        for i in range(PLAYERS):
+            await c.post("/api/v1/auth/register", json={"username": f"u{i}", "password": "p", "starter_id": 1})
+            token = (await c.post("/api/v1/auth/token", data={"username": f"u{i}", "password": "p"})).json()["access_token"]
+            headers.append({"Authorization": "Bearer " + token})
+
+        stop = asyncio.Event()
+        async def probe(out):
+            while not stop.is_set():
+                t = time.perf_counter(); await probe_client.get("/api/v1/shop/data/items")
+                out.append((time.perf_counter() - t) * 1000)
+                await asyncio.sleep(0.005)
+
+        idle = []; task = asyncio.create_task(probe(idle)); await asyncio.sleep(2); stop.set(); await task
+
+        codes = {}
+        async def player(k):
+            for j in range(total // PLAYERS):
+                r = await c.post(HOT_ENDPOINTS[j % len(HOT_ENDPOINTS)], headers=headers[k])
+                codes[r.status_code] = codes.get(r.status_code, 0) + 1
+
+        busy = []; stop.clear(); task = asyncio.create_task(probe(busy))
+        t0 = time.perf_counter()
+        await asyncio.gather(*[player(k) for k in range(PLAYERS)])
+        elapsed = time.perf_counter() - t0; stop.set(); await task
+        print(f"idle        p50 {percentile(idle, .5):6.1f} ms  p99 {percentile(idle, .99):6.1f} ms")
+        print(f"under load  p50 {percentile(busy, .5):6.1f} ms  p99 {percentile(busy, .99):6.1f} ms  max {max(busy):6.1f} ms")
+        print(f"{total} hot requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s), status codes {codes}")
+
+def main(total, port):
+    with uvicorn_server("loop_stall", port) as base:
+        asyncio.run(run(base, total))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 400, int(sys.argv[2]) if len(sys.argv) > 2 else 8766)
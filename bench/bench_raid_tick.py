@@ -0,0 +1,56 @@
+# bench/bench_raid_tick.py
+"""
+團體戰 Boss 範圍攻擊：逐筆 ORM 載入 + flush (舊版) 與一條 UPDATE ... RETURNING (raid_boss_tick) 的比較。
+用法：python bench/bench_raid_tick.py [參戰人數 ...]   (預設 50 200 1000 4000，每種跑 20 次取平均)
+"""
+
+import sys
+import time
+import warnings
+
+from _env import use_temp_sqlite
+use_temp_sqlite("raid_tick")
+warnings.filterwarnings("ignore")
+
+from sqlalchemy.orm import Session
+
+from app.db.session import engine
+from app.db.base_class import Base
+from app.models.user import User
+from app.routers import shop
+
+REPS = 20
+BOSS_DMG = 200
+
+def old_tick(db: Session, uids):
+    # 改版前的寫法：把所有參戰玩家載入 ORM，逐一扣血後 flush
+    users = db.query(User).filter(User.id.in_(uids)).all()
+    for u in users:
+        u.hp = max(0, u.hp - BOSS_DMG)
+        if u.hp <= 0: shop.RAID_PLAYERS[u.id] = {**shop.RAID_PLAYERS[u.id], "dead_at": "x"}
+    db.commit()
+
+def main(sizes):
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        # HP 夠高，整場測試都不會有人陣亡
+        db.bulk_insert_mappings(User, [dict(username=f"u{i}", hashed_password="x", hp=10**9, max_hp=10**9) for i in range(max(sizes))])
+        db.commit()
+    st = {**shop.RAID_IDLE, "boss": {"atk": BOSS_DMG * 5, "name": "bench"}}
+    print(f"{'participants':>12} | {'ORM load+flush':>15} | {'bulk UPDATE RETURNING':>22}")
+    for n in sizes:
+        uids = list(range(1, n + 1))
+        shop.RAID_PLAYERS.clear()
+        for uid in uids: shop.RAID_PLAYERS[uid] = {"name": f"u{uid}", "dmg": 0, "dead_at": None, "claimed": False}
+        t = time.perf_counter()
+        for _ in range(REPS):
+            with Session(engine) as db: old_tick(db, uids)
+        t_old = (time.perf_counter() - t) / REPS * 1000
+        t = time.perf_counter()
+        for _ in range(REPS):
+            with Session(engine) as db: shop.raid_boss_tick(db, st)
+        t_new = (time.perf_counter() - t) / REPS * 1000
+        print(f"{n:>12} | {t_old:>12.2f} ms | {t_new:>19.2f} ms")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [50, 200, 1000, 4000])
@@ -0,0 +1,79 @@
+# bench/bench_serialization.py
+"""
+回應序列化：玩家背包放滿 35 隻時 /auth/me 的大小、UserRead 序列化、dict 路由編碼與前端解析的時間 (中位數 / p99)。
+用法：python bench/bench_serialization.py
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+import time
+import warnings
+
+from _env import use_temp_sqlite
+use_temp_sqlite("serialization")
+warnings.filterwarnings("ignore")
+
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from fastapi.testclient import TestClient
+from fastapi.utils import create_model_field
+
+from app.main import app
+from app.db.session import SessionLocal
+from app.models.user import User, UserRead
+
+results = {}
+
+def bench(name, fn, n=400):
+    for _ in range(20): fn()
+    xs = []
+    for _ in range(n):
+        t = time.perf_counter(); fn(); xs.append((time.perf_counter() - t) * 1e6)
+    results[name] = (statistics.median(xs), sorted(xs)[int(n * .99) - 1])
+
+def main():
+    with contextlib.redirect_stdout(io.StringIO()), TestClient(app) as c:
+        c.post("/api/v1/auth/register", json={"username": "a", "password": "p", "starter_id": 1})
+        headers = {"Authorization": "Bearer " + c.post("/api/v1/auth/token", data={"username": "a", "password": "p"}).json()["access_token"]}
+        with SessionLocal() as db:
+            u = db.query(User).filter(User.username == "a").first(); u.money = 10_000_000; u.level = 60; db.commit()
+        # 抽滿 35 格，背包也買齊各種糖果
+        for _ in range(3): c.post("/api/v1/shop/gacha/normal?count=10", headers=headers)
+        c.post("/api/v1/shop/gacha/normal?count=4", headers=headers)
+        for kind in ("candy", "growth", "golden", "legendary"): c.post(f"/api/v1/shop/buy/{kind}", headers=headers)
+
+        me = c.get("/api/v1/auth/me", headers=headers)
+        body = me.content
+        box = me.json()["pokemon_storage"]; box = json.loads(box) if isinstance(box, str) else box
+        bench("GET /auth/me (full stack)", lambda: c.get("/api/v1/auth/me", headers=headers))
+        bench("GET /shop/gym/list (dict route)", lambda: c.get("/api/v1/shop/gym/list", headers=headers))
+
+        # 只量序列化：已載入的 User -> JSON bytes (與 FastAPI response_model 路徑相同)
+        field = create_model_field(name="resp", type_=UserRead, mode="serialization")
+        db = SessionLocal(); user = db.query(User).filter(User.username == "a").first(); user.pokemons; user.inventory_items; user.redeemed
+        loop = asyncio.new_event_loop()
+        response_class = app.router.default_response_class
+        dump_json = isinstance(response_class, DefaultPlaceholder)
+        cls = response_class.value if dump_json else response_class
+        def serialize():
+            content = loop.run_until_complete(serialize_response(field=field, response_content=user, dump_json=dump_json))
+            return content if dump_json else cls(content).body
+        bench("serialize UserRead -> bytes", serialize, 2000)
+
+        gyms = c.get("/api/v1/shop/gym/list", headers=headers).json()
+        bench(f"jsonable_encoder + {cls.__name__} (gym list)", lambda: cls(jsonable_encoder(gyms)).body, 2000)
+        def client_parse():
+            d = json.loads(body)
+            if isinstance(d["pokemon_storage"], str): d["pokemon_storage"] = json.loads(d["pokemon_storage"]); d["inventory"] = json.loads(d["inventory"])
+        bench("client parse (json.loads, incl. nested strings)", client_parse, 2000)
+        db.close(); loop.close()
+
+    print(f"box size {len(box)}, /auth/me body {len(body)} bytes, response class {cls.__name__}, pydantic dump_json fast path {dump_json}")
+    for name, (med, p99) in results.items(): print(f"{name:<52} median {med:6.0f} us   p99 {p99:6.0f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# bench/bench_stat_engine.py
+"""
+逐筆 apply_iv_stats 與向量化 stats_for 的比較 (每列計算 hp + atk)。
+用法：python bench/bench_stat_engine.py [列數 ...]   (預設 1 35 1000 100000)
+"""
+
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.common.game_data import POKEDEX_DATA, HELD_ITEMS, apply_iv_stats
+from app.common.stat_engine import stats_for
+
+def main(sizes):
+    rng = random.Random(0)
+    names, items = list(POKEDEX_DATA), list(HELD_ITEMS)
+    print(f"{'rows':>8} | {'apply_iv_stats loop':>20} | {'stats_for':>10}")
+    for n in sizes:
+        sp = [rng.choice(names) for _ in range(n)]; iv = [rng.randint(0, 100) for _ in range(n)]
+        lv = [rng.randint(1, 120) for _ in range(n)]; it = [rng.choice(items) for _ in range(n)]
+
+        def scalar():
+            return [(apply_iv_stats(POKEDEX_DATA[s]["hp"], v, l, True, True, i), apply_iv_stats(POKEDEX_DATA[s]["atk"], v, l, False, True, i)) for s, v, l, i in zip(sp, iv, lv, it)]
+        def vector():
+            return stats_for(sp, iv, lv, it)
+
+        hp, atk = vector()
+        assert scalar() == list(zip(hp.tolist(), atk.tolist()))
+        reps = max(1, 20_000 // n)
+        t_scalar = min(timeit.repeat(scalar, number=reps, repeat=5)) / reps
+        t_vector = min(timeit.repeat(vector, number=reps, repeat=5)) / reps
+        print(f"{n:>8} | {t_scalar * 1e6:>17.1f} us | {t_vector * 1e6:>7.1f} us")
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1, 35, 1000, 100_000])
@@ -0,0 +1,34 @@
+# tests/test_box_service.py
+
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.db.base_class import Base
+from app.models.user import User
+from app.services import box_service
+from app.services.box_service import BoxService, next_obtained_at
+
+class FrozenDatetime(datetime):
+    # 時鐘解析度不足時 (Windows 約 15ms、或同一微秒內) 十連抽會拿到相同時間
+    @classmethod
+    def utcnow(cls): return datetime(2026, 1, 1)
+
+def test_obtained_at_strictly_increases():
+    stamps = [next_obtained_at() for _ in range(1000)]
+    assert all(a < b for a, b in zip(stamps, stamps[1:]))
+
+def test_batch_keeps_insertion_order(monkeypatch):
+    # 十連抽同一個請求內寫入，盒子順序必須與抽到的順序相同
+    monkeypatch.setattr(box_service, "datetime", FrozenDatetime)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        user = User(username="a", hashed_password="x")
+        db.add(user); db.commit()
+        box = BoxService(db)
+        added = [box.add(user, f"mon{i}", 50, 1).uid for i in range(10)]
+        db.commit()
+        assert [m.uid for m in box.get_box(user.id)] == added
+        assert [m.uid for m in user.pokemons] == added
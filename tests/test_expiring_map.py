@@ -0,0 +1,48 @@
+# tests/test_expiring_map.py
+
+import sys
+import threading
+
+from app.common.expiring_map import ExpiringMap
+from app.common.state_store import MemoryStateMap
+
+class FakeClock:
+    def __init__(self): self.now = 0.0
+    def __call__(self): return self.now
+
+def test_expire_and_evict():
+    clock = FakeClock()
+    m = ExpiringMap(ttl=10, max_size=2, clock=clock)
+    m["a"] = 1; m["b"] = 2; m["c"] = 3
+    assert "a" not in m and m.evicted == 1
+    clock.now = 5; assert m.get("b") == 2   # 讀取會延長 b 的存活時間
+    clock.now = 12
+    assert m.items() == [("b", 2)] and m.expired == 1
+
+def test_concurrent_purge_and_sweep():
+    # threadpool 的 API 與背景 sweep 同時淘汰同一批過期項目，不能丟 KeyError
+    clock = FakeClock()
+    m = MemoryStateMap(ttl=1, max_size=500)
+    m._data.clock = clock
+    errors = []
+
+    def worker(i):
+        try:
+            for n in range(2000):
+                m[(i, n % 50)] = n
+                m.get((i, (n + 7) % 50))
+                if n % 10 == 0: clock.now += 0.5
+                if n % 25 == 0: m.sweep(); len(m); m.items()
+        except Exception as e:
+            errors.append(e)
+
+    # 縮短 GIL 切換間隔，讓競爭更容易發生
+    interval = sys.getswitchinterval(); sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    assert len(m) <= 500
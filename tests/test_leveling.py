@@ -0,0 +1,88 @@
+# tests/test_leveling.py
+
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app.common.game_data import get_req_xp
+from app.common.leveling import PLAYER_CURVE
+from app.routers import item
+from app.routers.shop import CANDY_EXP
+
+# =================================================================
+# 改用累積經驗表之前的逐級迴圈 (原樣保留)，LevelCurve 的結果必須完全相同
+# =================================================================
+def old_wild_levelup(level, exp):
+    # shop.wild_attack_api (訓練師 / 寶可夢共用)
+    req = get_req_xp(level)
+    while exp >= req and level < 120: exp -= req; level += 1; req = get_req_xp(level)
+    return level, exp
+
+def old_candy_feed(lv, exp, count, user_level):
+    # shop.box_action 的成長糖果
+    real_used = 0
+    for _ in range(count):
+        if lv >= user_level: break
+        exp += 1500
+        real_used += 1
+        req = get_req_xp(lv)
+        while exp >= req and lv < 120:
+            if lv >= user_level: break
+            lv += 1; exp -= req; req = get_req_xp(lv)
+    return real_used, lv, exp
+
+def old_check_levelup_pet(user):
+    # item.check_levelup_dual 的寶可夢升級部分
+    msg_list = []
+    if (user.pet_level < user.level or (user.level == 1 and user.pet_level == 1)) and user.pet_level < 25:
+        req_xp_pet = item.get_req_xp(user.pet_level)
+        while user.pet_exp >= req_xp_pet:
+            if user.pet_level >= user.level and user.level > 1: break
+            if user.pet_level >= 25: break
+            user.pet_level += 1
+            user.pet_exp -= req_xp_pet
+            user.max_hp = int(user.max_hp * 1.08)
+            user.hp = user.max_hp
+            user.attack = int(user.attack * 1.06)
+            msg_list.append(f"{user.pokemon_name}升級(Lv.{user.pet_level})")
+            req_xp_pet = item.get_req_xp(user.pet_level)
+    return " & ".join(msg_list) if msg_list else None
+
+def random_exp(rng):
+    return rng.choice([0, rng.randint(0, 5000), rng.randint(0, 10**6), rng.randint(0, 10**8)])
+
+@pytest.mark.parametrize("seed", range(5))
+def test_add_exp_matches_wild_loop(seed):
+    rng = random.Random(seed)
+    for level in range(1, PLAYER_CURVE.max_level + 1):
+        for _ in range(50):
+            exp, gain = random_exp(rng), random_exp(rng)
+            assert PLAYER_CURVE.add_exp(level, exp, gain) == old_wild_levelup(level, exp + gain), (level, exp, gain)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_units_to_cap_matches_candy_loop(seed):
+    rng = random.Random(seed)
+    for level in range(1, PLAYER_CURVE.max_level + 1):
+        for _ in range(50):
+            exp, count, user_level = rng.randint(0, 10**6), rng.randint(1, 500), rng.randint(1, 120)
+            used = PLAYER_CURVE.units_to_cap(level, exp, CANDY_EXP, count, user_level) if level < user_level else 0
+            lv, left = PLAYER_CURVE.add_exp(level, exp, CANDY_EXP * used, user_level)
+            assert (used, lv, left) == old_candy_feed(level, exp, count, user_level), (level, exp, count, user_level)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_check_levelup_dual_matches_pet_loop(seed):
+    rng = random.Random(seed)
+
+    async def run():
+        for pet_level in range(1, 27):
+            for _ in range(100):
+                # exp=-1：不觸發訓練師升級 (該段沒有改動)
+                fields = dict(level=rng.randint(1, 26), exp=-1, pet_level=pet_level, pet_exp=random_exp(rng),
+                              max_hp=rng.randint(10, 900), hp=1, attack=rng.randint(5, 300), pokemon_name="皮卡丘", username="t")
+                old, new = SimpleNamespace(**fields), SimpleNamespace(**fields)
+                expected = old_check_levelup_pet(old)
+                assert await item.check_levelup_dual(new) == expected
+                assert vars(new) == vars(old), fields
+    asyncio.run(run())
@@ -0,0 +1,36 @@
+# tests/test_stat_engine.py
+
+import numpy as np
+import pytest
+
+from app.common.game_data import POKEDEX_DATA, HELD_ITEMS, apply_iv_stats
+from app.common.stat_engine import SPECIES, MAX_LEVEL, stats_for
+
+# 含表格外的等級 (-2、121、122)，這些會退回逐筆計算
+LEVELS = list(range(-2, MAX_LEVEL + 3))
+IVS = [0, 1, 13, 37, 50, 63, 99, 100]
+
+@pytest.mark.parametrize("is_player", [True, False])
+@pytest.mark.parametrize("item", list(HELD_ITEMS) + ["unknown_item"])
+def test_stats_for_matches_apply_iv_stats(is_player, item):
+    # 成長係數或 game_data 的公式改了卻沒同步，這裡就會失敗
+    lv = [l for l in LEVELS for _ in IVS]
+    iv = [v for _ in LEVELS for v in IVS]
+    in_table = np.array([0 <= l <= MAX_LEVEL for l in lv])
+    for name in SPECIES:
+        base = POKEDEX_DATA[name]
+        expected_hp = [apply_iv_stats(base["hp"], v, l, is_hp=True, is_player=is_player, item_id=item) for v, l in zip(iv, lv)]
+        expected_atk = [apply_iv_stats(base["atk"], v, l, is_hp=False, is_player=is_player, item_id=item) for v, l in zip(iv, lv)]
+        hp, atk = np.zeros(len(lv), dtype=np.int64), np.zeros(len(lv), dtype=np.int64)
+        for mask in (in_table, ~in_table):
+            n = int(mask.sum())
+            hp[mask], atk[mask] = stats_for([name] * n, np.array(iv)[mask].tolist(), np.array(lv)[mask].tolist(), [item] * n, is_player)
+        assert hp.tolist() == expected_hp, name
+        assert atk.tolist() == expected_atk, name
+
+def test_mixed_rows_and_default_item():
+    names = SPECIES[:5]
+    hp, atk = stats_for(names, [0, 25, 50, 75, 100], [1, 30, 60, 90, 120])
+    assert hp.dtype == np.int64
+    assert hp.tolist() == [apply_iv_stats(POKEDEX_DATA[n]["hp"], v, l, is_hp=True) for n, v, l in zip(names, [0, 25, 50, 75, 100], [1, 30, 60, 90, 120])]
+    assert atk.tolist() == [apply_iv_stats(POKEDEX_DATA[n]["atk"], v, l) for n, v, l in zip(names, [0, 25, 50, 75, 100], [1, 30, 60, 90, 120])]
@@ -0,0 +1,56 @@
+# tests/test_state_store.py
+
+import pytest
+
+from app.common.state_store import MemoryStateStore, SQLiteStateStore
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite": return SQLiteStateStore(str(tmp_path / "state.db"))
+    return MemoryStateStore()
+
+def test_values_are_copies(store):
+    # 兩種實作行為一致：取出的值改了沒寫回，就不會影響共享狀態
+    rooms = store.map("rooms", ttl=60)
+    room = {"boss_data": {"hp": 100}}
+    rooms["r1"] = room
+    room["boss_data"]["hp"] = 0
+    got = rooms.get("r1")
+    assert got == {"boss_data": {"hp": 100}}
+    got["boss_data"]["hp"] -= 30
+    assert rooms.get("r1")["boss_data"]["hp"] == 100
+    rooms.items()[0][1]["boss_data"]["hp"] = 1
+    assert rooms["r1"]["boss_data"]["hp"] == 100
+
+def test_update_value_rolls_back_on_error(store):
+    players = store.map("players")
+    players[1] = {"claimed": False}
+    def boom(p):
+        p["claimed"] = True
+        raise RuntimeError
+    with pytest.raises(RuntimeError): players.update_value(1, boom)
+    assert players[1] == {"claimed": False}
+    assert players.update_value(1, lambda p: {**p, "claimed": True}) == {"claimed": True}
+    assert players.get(2, "missing") == "missing"
+
+def test_publish_many_keeps_order(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "state.db"))
+    last_id, _ = store.poll(-1)
+    store.publish_many([([1], "a"), (None, "b")]); store.publish(([2], "c"))
+    _, messages = store.poll(last_id)
+    assert messages == [([1], "a"), (None, "b"), ([2], "c")]
+
+def test_duel_update_is_atomic_and_skips_missing_rooms(store):
+    from app.common.duel_registry import DuelRegistry
+    duels = DuelRegistry(store)
+    room_id = duels.create({"p1": 1, "p2": 2, "status": "FIGHTING", "turn": 1})
+    def attack(room):
+        if room["turn"] != 1: raise ValueError("還沒輪到你")
+        return {**room, "turn": 2}
+    assert duels.update(room_id, attack)["turn"] == 2
+    # 連點第二次看到的是已經換手的房間
+    with pytest.raises(ValueError): duels.update(room_id, attack)
+    assert duels.update(room_id, lambda r: {**r, "status": "ENDED"})["status"] == "ENDED"
+    assert room_id in duels.expiry
+    assert duels.update("missing", attack) is None
+    assert duels.rooms.get("missing") is None and len(duels.rooms) == 1
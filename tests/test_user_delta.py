@@ -0,0 +1,22 @@
+# tests/test_user_delta.py
+
+from app.models.user import User, UserDelta
+
+def make_user():
+    return User(username="a", hashed_password="x", level=5, exp=0, money=1000, pokemon_name="皮卡丘", pokemon_image="",
+                pet_level=5, pet_exp=0, hp=100, max_hp=100, attack=10, active_pokemon_uid="u0")
+
+def test_only_changed_fields_are_set():
+    user = make_user()
+    before = UserDelta.snapshot(user)
+    user.money -= 500
+    delta = UserDelta.since(before, user)
+    assert delta.model_dump(exclude_unset=True) == {"money": 500}
+
+def test_box_rows_and_released_uids():
+    # 特訓 / 糖果 / 放生只改到盒子時，回應也要帶出變動的寶可夢，前端才能依 uid 合併
+    user = make_user()
+    before = UserDelta.snapshot(user)
+    row = {"uid": "u1", "name": "小拉達", "iv": 88, "lv": 3, "exp": 0, "item": "leftovers"}
+    delta = UserDelta.since(before, user, pokemon=[row], released=["u2"])
+    assert delta.model_dump(exclude_unset=True) == {"pokemon": [row], "released_pokemon": ["u2"]}